@@ -0,0 +1,120 @@
+"""
+Load test for :class:`~pyro.contrib.serving.BatchingServer`.
+
+A local stand-in client issues single-datum posterior queries with Poisson
+arrival times against an amortized guide and its posterior predictive. The
+same workload is served once without batching (``max_batch_size=1``) and once
+with micro-batching, and latency percentiles and throughput are reported.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import asyncio
+import time
+
+import torch
+import torch.nn as nn
+
+import pyro
+import pyro.distributions as dist
+import pyro.poutine as poutine
+from pyro.contrib.serving import BatchingServer
+
+
+class Encoder(nn.Module):
+    def __init__(self, x_dim, z_dim, hidden_dim):
+        super(Encoder, self).__init__()
+        self.net = nn.Sequential(nn.Linear(x_dim, hidden_dim), nn.ReLU(), nn.Linear(hidden_dim, 2 * z_dim))
+
+    def forward(self, x):
+        loc, log_scale = self.net(x).chunk(2, dim=-1)
+        return loc, log_scale.exp()
+
+
+def make_model_and_guide(x_dim, z_dim, hidden_dim):
+    decoder = nn.Linear(z_dim, x_dim)
+    encoder = Encoder(x_dim, z_dim, hidden_dim)
+
+    def model(x):
+        with pyro.plate("data", x.size(0)):
+            z = pyro.sample("z", dist.Normal(x.new_zeros(z_dim), 1.).to_event(1))
+            return pyro.sample("x", dist.Normal(decoder(z), 0.1).to_event(1))
+
+    def guide(x):
+        with pyro.plate("data", x.size(0)):
+            loc, scale = encoder(x)
+            return pyro.sample("z", dist.Normal(loc, scale).to_event(1))
+
+    return model, guide
+
+
+def make_query(model, guide):
+    def query(x):
+        with torch.no_grad():
+            guide_trace = poutine.trace(guide).get_trace(x)
+            x_pred = poutine.replay(model, guide_trace)(x)
+        return {"z": guide_trace.nodes["z"]["value"], "x_pred": x_pred}
+    return query
+
+
+async def client(server, data, rate, latencies):
+    # Stand-in for an RPC front end: fire independent requests with
+    # exponentially distributed inter-arrival times.
+    loop = asyncio.get_event_loop()
+    tasks = []
+
+    async def request(x):
+        start = loop.time()
+        await server.submit(x)
+        latencies.append(loop.time() - start)
+
+    for x in data:
+        tasks.append(asyncio.ensure_future(request(x)))
+        await asyncio.sleep(float(torch.empty(1).exponential_(rate)))
+    await asyncio.gather(*tasks)
+
+
+def run_load_test(query, data, rate, max_batch_size, max_latency):
+    server = BatchingServer(query, max_batch_size=max_batch_size, max_latency=max_latency)
+    latencies = []
+
+    async def main():
+        async with server:
+            await client(server, data, rate, latencies)
+
+    start = time.time()
+    asyncio.get_event_loop().run_until_complete(main())
+    elapsed = time.time() - start
+    latencies = torch.tensor(latencies).sort()[0]
+    p50 = latencies[int(0.5 * (len(latencies) - 1))].item()
+    p99 = latencies[int(0.99 * (len(latencies) - 1))].item()
+    print("max_batch_size={:<5d} mean_batch_size={:<8.2f} throughput={:<10.1f}/s "
+          "p50={:.2f}ms p99={:.2f}ms".format(max_batch_size, server.mean_batch_size,
+                                             len(data) / elapsed, 1000 * p50, 1000 * p99))
+
+
+def main(args):
+    pyro.set_rng_seed(args.seed)
+    model, guide = make_model_and_guide(args.x_dim, args.z_dim, args.hidden_dim)
+    query = make_query(model, guide)
+    data = torch.randn(args.num_requests, args.x_dim)
+    for max_batch_size in [1, args.max_batch_size]:
+        run_load_test(query, data, args.rate, max_batch_size, args.max_latency)
+
+
+if __name__ == "__main__":
+    assert pyro.__version__.startswith('0.3.0')
+    parser = argparse.ArgumentParser(description="Load test for micro-batched posterior queries")
+    parser.add_argument("-n", "--num-requests", default=2000, type=int)
+    parser.add_argument("-r", "--rate", default=5000., type=float,
+                        help="mean request arrival rate per second")
+    parser.add_argument("-b", "--max-batch-size", default=64, type=int)
+    parser.add_argument("-l", "--max-latency", default=0.002, type=float,
+                        help="maximum batching window in seconds")
+    parser.add_argument("--x-dim", default=100, type=int)
+    parser.add_argument("--z-dim", default=10, type=int)
+    parser.add_argument("--hidden-dim", default=200, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    args = parser.parse_args()
+    main(args)
@@ -13,13 +13,14 @@ import pyro
 import pyro.distributions as dist
 import pyro.poutine as poutine
 
-from search_inference import factor, HashingMarginal, memoize, Search
+from pyro.infer import MemoizedMarginal
+from search_inference import factor, HashingMarginal, Search
 
 torch.set_default_dtype(torch.float64)  # double precision for numerical stability
 
 
 def Marginal(fn):
-    return memoize(lambda *args: HashingMarginal(Search(fn).run(*args)))
+    return MemoizedMarginal(fn, Search, marginal=HashingMarginal)
 
 
 ######################################
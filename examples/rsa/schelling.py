@@ -16,6 +16,7 @@ import torch
 import pyro
 import pyro.poutine as poutine
 from pyro.distributions import Bernoulli
+from pyro.infer import MemoizedMarginal
 from search_inference import HashingMarginal, Search
 
 
@@ -34,7 +35,7 @@ def alice(preference, depth):
     """
     alice_prior = location(preference)
     with poutine.block():
-        bob_marginal = HashingMarginal(Search(bob).run(preference, depth - 1))
+        bob_marginal = bob_marginals(preference, depth - 1)
     return pyro.sample("bob_choice", bob_marginal, obs=alice_prior)
 
 
@@ -45,12 +46,17 @@ def bob(preference, depth):
     bob_prior = location(preference)
     if depth > 0:
         with poutine.block():
-            alice_marginal = HashingMarginal(Search(alice).run(preference, depth))
+            alice_marginal = alice_marginals(preference, depth)
         return pyro.sample("alice_choice", alice_marginal, obs=bob_prior)
     else:
         return bob_prior
 
 
+# Memoize the nested marginals, which are shared across the recursion.
+alice_marginals = MemoizedMarginal(alice, Search, marginal=HashingMarginal)
+bob_marginals = MemoizedMarginal(bob, Search, marginal=HashingMarginal)
+
+
 def main(args):
     # Here Alice and Bob slightly prefer one location over the other a priori
     shared_preference = torch.tensor([args.preference])
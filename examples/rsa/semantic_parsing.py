@@ -8,11 +8,13 @@ import torch
 
 import argparse
 import collections
+import functools
 
 import pyro
 import pyro.distributions as dist
 
-from search_inference import HashingMarginal, BestFirstSearch, factor, memoize
+from pyro.infer import MemoizedMarginal
+from search_inference import HashingMarginal, BestFirstSearch, factor
 
 torch.set_default_dtype(torch.float64)
 
@@ -20,7 +22,7 @@ torch.set_default_dtype(torch.float64)
 def Marginal(fn=None, **kwargs):
     if fn is None:
         return lambda _fn: Marginal(_fn, **kwargs)
-    return memoize(lambda *args: HashingMarginal(BestFirstSearch(fn, **kwargs).run(*args)))
+    return MemoizedMarginal(fn, functools.partial(BestFirstSearch, **kwargs), marginal=HashingMarginal)
 
 
 ###################################################################
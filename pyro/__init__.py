@@ -3,8 +3,8 @@ from __future__ import absolute_import, division, print_function
 import pyro.poutine as poutine
 from pyro.logger import log
 from pyro.poutine import condition, do, markov
-from pyro.primitives import (clear_param_store, enable_validation, get_param_store, iarange, irange, module, param,
-                             plate, random_module, sample, validation_enabled)
+from pyro.primitives import (clear_param_store, enable_validation, get_param_store, iarange, irange,
+                             markov_plate, module, param, plate, random_module, sample, validation_enabled)
 from pyro.util import set_rng_seed
 
 version_prefix = '0.3.0'
@@ -26,6 +26,7 @@ __all__ = [
     "irange",
     "log",
     "markov",
+    "markov_plate",
     "module",
     "param",
     "plate",
@@ -1,10 +1,11 @@
 from __future__ import absolute_import, division, print_function
 
-from pyro.contrib.gp import kernels, likelihoods, models, parameterized, util
+from pyro.contrib.gp import kernels, likelihoods, linalg, models, parameterized, util
 
 __all__ = [
     "kernels",
     "likelihoods",
+    "linalg",
     "models",
     "parameterized",
     "util",
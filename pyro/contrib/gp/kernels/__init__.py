@@ -1,5 +1,6 @@
 from __future__ import absolute_import, division, print_function
 
+from pyro.contrib.gp.kernels.approximate import GridInterpolation, RandomFourierFeatures
 from pyro.contrib.gp.kernels.brownian import Brownian
 from pyro.contrib.gp.kernels.coregionalize import Coregionalize
 from pyro.contrib.gp.kernels.dot_product import DotProduct, Linear, Polynomial
@@ -20,6 +21,7 @@ __all__ = [
     "DotProduct",
     "Exponent",
     "Exponential",
+    "GridInterpolation",
     "Isotropy",
     "Linear",
     "Matern32",
@@ -28,6 +30,7 @@ __all__ = [
     "Polynomial",
     "Product",
     "RBF",
+    "RandomFourierFeatures",
     "RationalQuadratic",
     "Sum",
     "Transforming",
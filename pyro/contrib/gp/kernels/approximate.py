@@ -0,0 +1,279 @@
+from __future__ import absolute_import, division, print_function
+
+import numbers
+
+import torch
+import torch.nn.functional as F
+from torch.distributions import Chi2
+
+from .isotropic import RBF, Exponential, Matern32, Matern52, RationalQuadratic
+from .kernel import Transforming
+
+# smoothness parameters nu of Matern kernels
+_MATERN_NU = {Exponential: 0.5, Matern32: 1.5, Matern52: 2.5}
+
+
+class RandomFourierFeatures(Transforming):
+    r"""
+    Approximates a stationary kernel :math:`k` by random Fourier features
+    (see reference [1])
+
+        :math:`k(x, z) \approx \phi(x)^T \phi(z),`
+
+    where :math:`\phi(x) = \frac{\sigma}{\sqrt{D}}\left[\cos(\omega_1^T x / l), \ldots,
+    \cos(\omega_D^T x / l), \sin(\omega_1^T x / l), \ldots, \sin(\omega_D^T x / l)
+    \right]` and the frequencies :math:`\omega_i` are drawn from the spectral density
+    of :math:`k`. Supported kernels are :class:`.RBF`, :class:`.Exponential`,
+    :class:`.Matern32`, :class:`.Matern52` and :class:`.RationalQuadratic`.
+
+    Random numbers are drawn once when this kernel is constructed, so the kernel is
+    deterministic. Parameters of the original kernel (variance, lengthscale, scale
+    mixture) are still learnable.
+
+    .. note:: A covariance matrix of this kernel has rank at most :math:`2D`, so
+        :meth:`matmul` has :math:`\mathcal{O}(ND)` complexity. Together with
+        :class:`~pyro.contrib.gp.linalg.IterativeSolver` as ``solver`` of
+        :class:`~pyro.contrib.gp.models.GPRegression`, a training step has
+        :math:`\mathcal{O}(ND)` complexity per solver iteration.
+
+    References:
+
+    [1] `Random Features for Large-Scale Kernel Machines`,
+    Ali Rahimi, Ben Recht
+
+    :param Isotropy kern: The stationary kernel to approximate.
+    :param int num_features: Number :math:`D` of random frequencies.
+    """
+    def __init__(self, kern, num_features=100):
+        if not isinstance(kern, (RBF, Exponential, Matern32, Matern52, RationalQuadratic)):
+            raise TypeError("Random Fourier features are not supported for {} kernels."
+                            .format(type(kern).__name__))
+        super(RandomFourierFeatures, self).__init__(kern)
+        self.num_features = num_features
+
+        spectral_normal = kern.variance.new_empty(num_features, kern.input_dim).normal_()
+        self.register_buffer("spectral_normal", spectral_normal)
+        # scale of each frequency, see _frequencies()
+        if isinstance(kern, RBF):
+            spectral_mixture = kern.variance.new_ones(num_features)
+        elif isinstance(kern, RationalQuadratic):
+            spectral_mixture = kern.variance.new_empty(num_features).normal_()
+        else:
+            nu = _MATERN_NU[type(kern)]
+            chi2 = Chi2(kern.variance.new_tensor(2 * nu)).sample((num_features,))
+            spectral_mixture = (2 * nu / chi2).sqrt()
+        self.register_buffer("spectral_mixture", spectral_mixture)
+
+    def _frequencies(self):
+        if isinstance(self.kern, RationalQuadratic):
+            # RationalQuadratic is a Gamma(alpha, alpha) mixture of RBF kernels over
+            # their precision tau; we draw tau by the Wilson-Hilferty approximation
+            # of Gamma quantiles, so frequencies are differentiable in alpha
+            alpha = self.kern.scale_mixture
+            tau = (1 - 1 / (9 * alpha) + self.spectral_mixture / (3 * alpha.sqrt())).clamp(min=0) ** 3
+            return self.spectral_normal * tau.sqrt().unsqueeze(-1)
+        # Matern kernels have multivariate Student-t spectral densities
+        return self.spectral_normal * self.spectral_mixture.unsqueeze(-1)
+
+    def features(self, X):
+        r"""
+        Computes random Fourier features :math:`\phi(X)`.
+
+        :param torch.Tensor X: A 2D tensor with shape :math:`N \times input\_dim`.
+        :returns: a 2D tensor with shape :math:`N \times 2D`
+        :rtype: torch.Tensor
+        """
+        X = self._slice_input(X)
+        projection = (X / self.kern.lengthscale).matmul(self._frequencies().t())
+        scale = (self.kern.variance / self.num_features).sqrt()
+        return scale * torch.cat([projection.cos(), projection.sin()], dim=-1)
+
+    def forward(self, X, Z=None, diag=False):
+        self._check_unbatched(X, Z)
+        if diag:
+            # cos^2 + sin^2 = 1
+            return self.kern.variance.expand(X.size(0))
+
+        phi_X = self.features(X)
+        phi_Z = phi_X if Z is None else self.features(Z)
+        return phi_X.matmul(phi_Z.t())
+
+    def matmul(self, X, V, Z=None, block_size=1024):
+        self._check_unbatched(X, Z)
+        phi_X = self.features(X)
+        phi_Z = phi_X if Z is None else self.features(Z)
+        return phi_X.matmul(phi_Z.t().matmul(V))
+
+
+def _cubic_interpolation_weights(distance):
+    """
+    Keys' cubic convolution kernel with ``a = -0.5``.
+    """
+    a = -0.5
+    d = distance.abs()
+    near = ((a + 2) * d - (a + 3)) * d * d + 1
+    far = ((a * d - 5 * a) * d + 8 * a) * d - 4 * a
+    return torch.where(d <= 1, near, torch.where(d < 2, far, torch.zeros_like(d)))
+
+
+class GridInterpolation(Transforming):
+    r"""
+    Approximates a stationary kernel :math:`k` by structured kernel interpolation
+    (KISS-GP, see reference [1])
+
+        :math:`k(X, Z) \approx W_X k(U, U) W_Z^T,`
+
+    where :math:`U` is a regular grid of inducing points and :math:`W_X`,
+    :math:`W_Z` are sparse matrices of local cubic interpolation weights, with
+    :math:`4^d` nonzero entries in each row (:math:`d` is ``input_dim``).
+
+    Because :math:`U` is a regular grid, :math:`k(U, U)` is a (multilevel) Toeplitz
+    matrix, so products with it are computed by fast Fourier transforms on its
+    circulant embedding. Hence :meth:`matmul` has
+    :math:`\mathcal{O}(4^d N + G\log G)` complexity, where :math:`G` is the number
+    of grid points. Together with :class:`~pyro.contrib.gp.linalg.IterativeSolver`
+    as ``solver`` of :class:`~pyro.contrib.gp.models.GPRegression`, training is near
+    linear in :math:`N`.
+
+    .. note:: The original kernel must be stationary and only depend on absolute
+        differences :math:`|x_i - z_i|` in each input dimension, which is the case for
+        :class:`.Isotropy` and :class:`.Periodic` kernels. Inputs must lie inside
+        ``grid_bounds``.
+
+    References:
+
+    [1] `Kernel Interpolation for Scalable Structured Gaussian Processes (KISS-GP)`,
+    Andrew Gordon Wilson, Hannes Nickisch
+
+    :param Kernel kern: The stationary kernel to approximate.
+    :param grid_size: Number of grid points in each input dimension.
+    :type grid_size: int or list
+    :param list grid_bounds: A list of pairs ``(lower, upper)`` of grid bounds for
+        each input dimension.
+    """
+    def __init__(self, kern, grid_size, grid_bounds):
+        super(GridInterpolation, self).__init__(kern)
+        if isinstance(grid_size, numbers.Number):
+            grid_size = [grid_size] * self.input_dim
+        if len(grid_size) != self.input_dim or len(grid_bounds) != self.input_dim:
+            raise ValueError("Expected grid_size and grid_bounds for each of {} input dimensions."
+                             .format(self.input_dim))
+        if min(grid_size) < 2:
+            raise ValueError("Expected at least 2 grid points in each dimension.")
+        self.grid_spacing = [(upper - lower) / (size - 1)
+                             for size, (lower, upper) in zip(grid_size, grid_bounds)]
+        # pad the grid by 2 points at both ends, so cubic interpolation is defined
+        # everywhere inside grid bounds
+        self.grid_lower = [lower - 2 * h for (lower, _), h in zip(grid_bounds, self.grid_spacing)]
+        self.grid_size = [size + 4 for size in grid_size]
+
+    def _grid_first_column(self, X):
+        """
+        Computes the covariances between all grid points and the first grid point,
+        with shape ``grid_size``.
+        """
+        axes = [X.new_tensor(lower) + h * torch.arange(size, dtype=X.dtype, device=X.device)
+                for lower, h, size in zip(self.grid_lower, self.grid_spacing, self.grid_size)]
+        grid = [axis.reshape(-1) for axis in torch.meshgrid(*axes)]
+        # embed grid points in the input space of the original kernel
+        U = X.new_zeros(grid[0].size(0), max(self.active_dims) + 1)
+        for dim, axis in zip(self.active_dims, grid):
+            U[:, dim] = axis
+        return self.kern(U, U[:1]).reshape(self.grid_size)
+
+    def _grid_eigenvalues(self, first_column):
+        """
+        Computes the eigenvalues of the circulant embedding of the grid kernel
+        matrix, in the layout of :func:`torch.rfft`.
+        """
+        c = first_column
+        for dim, size in enumerate(self.grid_size):
+            mirror = torch.arange(size - 2, 0, -1, dtype=torch.long, device=c.device)
+            c = torch.cat([c, c.index_select(dim, mirror)], dim=dim)
+        # c is real and symmetric, so its Fourier transform is real
+        return torch.rfft(c, len(self.grid_size))[..., 0]
+
+    def _grid_matmul(self, eigenvalues, V):
+        """
+        Computes ``k(U, U) @ V`` for a tensor ``V`` with shape ``(k,) + grid_size``.
+        """
+        d = len(self.grid_size)
+        pad = []
+        for size in reversed(self.grid_size):
+            pad += [0, size - 2]
+        V_hat = torch.rfft(F.pad(V, pad), d)
+        result = torch.irfft(V_hat * eigenvalues.unsqueeze(-1), d,
+                             signal_sizes=[2 * size - 2 for size in self.grid_size])
+        for dim, size in enumerate(self.grid_size):
+            result = result.narrow(dim + 1, 0, size)
+        return result
+
+    def _interpolation(self, X):
+        """
+        Returns interpolation weights, flattened grid indices and multi-indices of
+        the grid points which each input interpolates from, each with shape
+        ``(N, 4 ** input_dim)``.
+        """
+        X = self._slice_input(X)
+        N = X.size(0)
+        offsets = torch.arange(-1, 3, dtype=torch.long, device=X.device)
+        weights, indices, multi_indices = X.new_ones(N, 1), X.new_zeros(N, 1, dtype=torch.long), []
+        stride = 1
+        for size in self.grid_size:
+            stride *= size
+        for dim, (lower, h, size) in enumerate(zip(self.grid_lower, self.grid_spacing, self.grid_size)):
+            stride //= size
+            t = (X[:, dim] - lower) / h
+            base = t.detach().floor()
+            distance = (t - base).unsqueeze(-1) - offsets.type_as(t)
+            dim_indices = (base.long().unsqueeze(-1) + offsets).clamp(0, size - 1)
+            weights = (weights.unsqueeze(-1) * _cubic_interpolation_weights(distance).unsqueeze(-2)).reshape(N, -1)
+            indices = (indices.unsqueeze(-1) + stride * dim_indices.unsqueeze(-2)).reshape(N, -1)
+            multi_indices = [i.unsqueeze(-1).expand(-1, -1, 4).reshape(N, -1) for i in multi_indices]
+            multi_indices.append(dim_indices.unsqueeze(-2).expand(-1, weights.size(-1) // 4, -1).reshape(N, -1))
+        return weights, indices, multi_indices
+
+    def _interpolated_matmul(self, X, V, Z=None):
+        weights_Z, indices_Z, _ = self._interpolation(X if Z is None else Z)
+        weights_X, indices_X, _ = (weights_Z, indices_Z, None) if Z is None else self._interpolation(X)
+        k = V.size(-1)
+        # W_Z.T @ V
+        source = (weights_Z.unsqueeze(-1) * V.unsqueeze(1)).reshape(-1, k)
+        num_grid = 1
+        for size in self.grid_size:
+            num_grid *= size
+        grid_V = V.new_zeros(num_grid, k).index_add(0, indices_Z.reshape(-1), source)
+        # k(U, U) @ W_Z.T @ V
+        eigenvalues = self._grid_eigenvalues(self._grid_first_column(X))
+        grid_V = self._grid_matmul(eigenvalues, grid_V.t().reshape([k] + self.grid_size))
+        grid_V = grid_V.reshape(k, num_grid).t()
+        # W_X @ k(U, U) @ W_Z.T @ V
+        return (weights_X.unsqueeze(-1) * grid_V[indices_X]).sum(1)
+
+    def forward(self, X, Z=None, diag=False):
+        self._check_unbatched(X, Z)
+        if diag:
+            return self._diag(X)
+        M = X.size(0) if Z is None else Z.size(0)
+        eye = torch.eye(M, dtype=X.dtype, device=X.device)
+        return self._interpolated_matmul(X, eye, Z)
+
+    def _diag(self, X, block_size=1024):
+        first_column = self._grid_first_column(X).reshape(-1)
+        strides = []
+        stride = first_column.size(0)
+        for size in self.grid_size:
+            stride //= size
+            strides.append(stride)
+        diags = []
+        for X_block in X.split(block_size):
+            weights, _, multi_indices = self._interpolation(X_block)
+            # k(U_p, U_q) only depends on |p - q|
+            index = sum(s * (i.unsqueeze(-1) - i.unsqueeze(-2)).abs() for s, i in zip(strides, multi_indices))
+            K = first_column[index]
+            diags.append((weights.unsqueeze(-1) * K * weights.unsqueeze(-2)).sum((-2, -1)))
+        return torch.cat(diags)
+
+    def matmul(self, X, V, Z=None, block_size=1024):
+        self._check_unbatched(X, Z)
+        return self._interpolated_matmul(X, V, Z)
@@ -32,6 +32,7 @@ class Brownian(Kernel):
         self.set_constraint("variance", constraints.positive)
 
     def forward(self, X, Z=None, diag=False):
+        self._check_unbatched(X, Z)
         if Z is None:
             Z = X
         X = self._slice_input(X)
@@ -67,6 +67,7 @@ class Coregionalize(Kernel):
         self.set_constraint("diagonal", constraints.positive)
 
     def forward(self, X, Z=None, diag=False):
+        self._check_unbatched(X, Z)
         X = self._slice_input(X)
         Xc = X.matmul(self.components)
 
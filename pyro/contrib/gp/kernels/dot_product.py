@@ -23,6 +23,7 @@ class DotProduct(Kernel):
         r"""
         Returns :math:`X \cdot Z`.
         """
+        self._check_unbatched(X, Z)
         if Z is None:
             Z = X
         X = self._slice_input(X)
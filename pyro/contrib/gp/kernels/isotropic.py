@@ -4,7 +4,7 @@ import torch
 from torch.distributions import constraints
 from torch.nn import Parameter
 
-from .kernel import Kernel
+from .kernel import _PAIRWISE_CACHE, Kernel, _pairwise_cached
 
 
 def _torch_sqrt(x, eps=1e-12):
@@ -23,7 +23,9 @@ class Isotropy(Kernel):
 
     By default, the parameter ``lengthscale`` has size 1. To use the isotropic version
     (different lengthscale for each dimension), make sure that ``lengthscale`` has size
-    equal to ``input_dim``.
+    equal to ``input_dim``. For batched inputs (see :class:`.Kernel`), a separate
+    lengthscale of each data set is given by a ``lengthscale`` with shape
+    ``batch_shape + (1,)`` or ``batch_shape + (input_dim,)``.
 
     :param torch.Tensor lengthscale: Length-scale parameter of this kernel.
     """
@@ -44,17 +46,33 @@ class Isotropy(Kernel):
         """
         if Z is None:
             Z = X
+        if _PAIRWISE_CACHE[0] is not None and self.lengthscale.numel() == 1:
+            # share unscaled distances with other kernels of a composite kernel
+            r2 = _pairwise_cached("square_dist", (X, Z), lambda: self._square_dist(X, Z),
+                                  tuple(self.active_dims))
+            return r2 / self.lengthscale.reshape(()).pow(2)
+        return _pairwise_cached("square_scaled_dist", (X, Z, self.lengthscale),
+                                lambda: self._square_dist(X, Z, self.lengthscale),
+                                tuple(self.active_dims))
+
+    def _square_dist(self, X, Z, lengthscale=None):
         X = self._slice_input(X)
         Z = self._slice_input(Z)
-        if X.size(1) != Z.size(1):
+        if X.size(-1) != Z.size(-1):
             raise ValueError("Inputs must have the same number of features.")
 
-        scaled_X = X / self.lengthscale
-        scaled_Z = Z / self.lengthscale
-        X2 = (scaled_X ** 2).sum(1, keepdim=True)
-        Z2 = (scaled_Z ** 2).sum(1, keepdim=True)
-        XZ = scaled_X.matmul(scaled_Z.t())
-        r2 = X2 - 2 * XZ + Z2.t()
+        if lengthscale is not None:
+            if X.dim() > 2 and lengthscale.dim() > 0:
+                lengthscale = lengthscale.unsqueeze(-2)
+            X = X / lengthscale
+            Z = Z / lengthscale
+        X2 = (X ** 2).sum(-1, keepdim=True)
+        Z2 = (Z ** 2).sum(-1, keepdim=True)
+        if X.dim() > 2:
+            r2 = X2 - 2 * X.matmul(Z.transpose(-2, -1)) + Z2.transpose(-2, -1)
+        else:
+            # fuse r2 = X2 - 2 * X @ Z.T + Z2.T to avoid allocating temporary N x M matrices
+            r2 = torch.addmm(Z2.t(), X, Z.t(), alpha=-2).add_(X2)
         return r2.clamp(min=0)
 
     def _scaled_dist(self, X, Z=None):
@@ -67,6 +85,8 @@ class Isotropy(Kernel):
         """
         Calculates the diagonal part of covariance matrix on active features.
         """
+        if X.dim() > 2:
+            return self._batched(self.variance, X, 1).expand(X.shape[:-1])
         return self.variance.expand(X.size(0))
 
 
@@ -86,7 +106,7 @@ class RBF(Isotropy):
             return self._diag(X)
 
         r2 = self._square_scaled_dist(X, Z)
-        return self.variance * torch.exp(-0.5 * r2)
+        return self._batched(self.variance, X, 2) * torch.exp(-0.5 * r2)
 
 
 class RationalQuadratic(Isotropy):
@@ -113,7 +133,8 @@ class RationalQuadratic(Isotropy):
             return self._diag(X)
 
         r2 = self._square_scaled_dist(X, Z)
-        return self.variance * (1 + (0.5 / self.scale_mixture) * r2).pow(-self.scale_mixture)
+        scale_mixture = self._batched(self.scale_mixture, X, 2)
+        return self._batched(self.variance, X, 2) * (1 + (0.5 / scale_mixture) * r2).pow(-scale_mixture)
 
 
 class Exponential(Isotropy):
@@ -130,7 +151,7 @@ class Exponential(Isotropy):
             return self._diag(X)
 
         r = self._scaled_dist(X, Z)
-        return self.variance * torch.exp(-r)
+        return self._batched(self.variance, X, 2) * torch.exp(-r)
 
 
 class Matern32(Isotropy):
@@ -149,7 +170,7 @@ class Matern32(Isotropy):
 
         r = self._scaled_dist(X, Z)
         sqrt3_r = 3**0.5 * r
-        return self.variance * (1 + sqrt3_r) * torch.exp(-sqrt3_r)
+        return self._batched(self.variance, X, 2) * (1 + sqrt3_r) * torch.exp(-sqrt3_r)
 
 
 class Matern52(Isotropy):
@@ -169,4 +190,4 @@ class Matern52(Isotropy):
         r2 = self._square_scaled_dist(X, Z)
         r = _torch_sqrt(r2)
         sqrt5_r = 5**0.5 * r
-        return self.variance * (1 + sqrt5_r + (5/3) * r2) * torch.exp(-sqrt5_r)
+        return self._batched(self.variance, X, 2) * (1 + sqrt5_r + (5/3) * r2) * torch.exp(-sqrt5_r)
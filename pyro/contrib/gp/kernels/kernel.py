@@ -1,9 +1,55 @@
 from __future__ import absolute_import, division, print_function
 
 import numbers
+from contextlib import contextmanager
+
+import torch
 
 from pyro.contrib.gp.parameterized import Parameterized
 
+# Pairwise computations (e.g. squared distances) shared by the sub-kernels of
+# a composite kernel during one forward pass. It is None outside of a forward
+# pass of a Combination kernel.
+_PAIRWISE_CACHE = [None]
+
+
+@contextmanager
+def _shared_pairwise_cache():
+    """
+    Context manager within which kernels share pairwise computations on the same
+    inputs through :func:`_pairwise_cached`. Nested contexts reuse the outermost
+    cache, which is cleared on exit.
+    """
+    if _PAIRWISE_CACHE[0] is not None:
+        yield
+        return
+    _PAIRWISE_CACHE[0] = {}
+    try:
+        yield
+    finally:
+        _PAIRWISE_CACHE[0] = None
+
+
+def _pairwise_cached(name, tensors, compute_fn, *args):
+    """
+    Returns ``compute_fn()``, reusing a previous result if called with the same
+    ``name``, ``args`` and input ``tensors`` (compared by identity) within the
+    current :func:`_shared_pairwise_cache` context. Outside of such a context, this
+    simply calls ``compute_fn()``.
+    """
+    cache = _PAIRWISE_CACHE[0]
+    if cache is None:
+        return compute_fn()
+    key = (name, args, tuple(id(t) for t in tensors))
+    if key in cache:
+        cached_tensors, value = cache[key]
+        # cached tensors are kept alive, so their ids can not be reused
+        if all(t is u for t, u in zip(tensors, cached_tensors)):
+            return value
+    value = compute_fn()
+    cache[key] = (tensors, value)
+    return value
+
 
 class Kernel(Parameterized):
     """
@@ -15,6 +61,25 @@ class Kernel(Parameterized):
     To construct a new kernel from the old ones, we can use methods :meth:`add`,
     :meth:`mul`, :meth:`exp`, :meth:`warp`, :meth:`vertical_scale`.
 
+    For large inputs, :meth:`iter_blocks` and :meth:`matmul` evaluate the covariance
+    matrix tile by tile, so only a ``block_size x block_size`` block is in memory at
+    any time.
+
+    Stationary kernels (:class:`.Isotropy` kernels, :class:`.Constant`,
+    :class:`.WhiteNoise`) and their combinations also accept batched inputs with shape
+    ``batch_shape + (N, input_dim)``, which are treated as independent data sets. Other
+    kernels raise :class:`NotImplementedError` for batched inputs. In
+    that case, their covariance matrices have shape ``batch_shape + (N, M)``. Each
+    parameter can either be shared across the batch, or have shape ``batch_shape``
+    (``batch_shape + (1,)`` or ``batch_shape + (input_dim,)`` for lengthscales) to
+    hold a separate value for each data set. For example, ten independent kernels
+    are evaluated at once by
+
+        >>> X = torch.randn(10, 50, 3)
+        >>> kernel = gp.kernels.RBF(input_dim=3, variance=torch.ones(10),
+        ...                         lengthscale=torch.ones(10, 3))
+        >>> assert kernel(X).shape == (10, 50, 50)
+
     References:
 
     [1] `Gaussian Processes for Machine Learning`,
@@ -51,27 +116,107 @@ class Kernel(Parameterized):
         """
         raise NotImplementedError
 
+    def iter_blocks(self, X, Z=None, block_size=1024):
+        r"""
+        Iterates over tiles of the covariance matrix of inputs :math:`X` and
+        :math:`Z`. Each tile is computed by :meth:`forward` on at most ``block_size``
+        rows of :math:`X` and ``block_size`` rows of :math:`Z`.
+
+        .. note:: If ``Z=None``, diagonal tiles are computed with ``Z=None`` too, so
+            kernels such as :class:`~pyro.contrib.gp.kernels.WhiteNoise`, which only
+            contribute to the covariance matrix of an input with itself, give the same
+            result as the full covariance matrix :math:`k(X, X)`.
+
+        :param torch.Tensor X: A 2D tensor with shape :math:`N \times input\_dim`.
+        :param torch.Tensor Z: An (optional) 2D tensor with shape
+            :math:`M \times input\_dim`.
+        :param int block_size: Maximum number of rows and columns of a tile.
+        :returns: a generator of triples ``(i, j, block)``, where ``block`` is the
+            covariance matrix of ``X[i:i + block_size]`` and ``Z[j:j + block_size]``
+        """
+        symmetric = Z is None
+        Z = X if symmetric else Z
+        for i in range(0, X.size(0), block_size):
+            Xi = X[i:i + block_size]
+            for j in range(0, Z.size(0), block_size):
+                if symmetric and i == j:
+                    yield i, j, self(Xi)
+                else:
+                    yield i, j, self(Xi, Z[j:j + block_size])
+
+    def matmul(self, X, V, Z=None, block_size=1024):
+        r"""
+        Computes the product :math:`k(X, Z) V` of the covariance matrix of inputs
+        :math:`X`, :math:`Z` and a matrix :math:`V`, without forming the covariance
+        matrix.
+
+        :param torch.Tensor X: A 2D tensor with shape :math:`N \times input\_dim`.
+        :param torch.Tensor V: A 2D tensor with shape :math:`M \times D` (or
+            :math:`N \times D` if ``Z=None``).
+        :param torch.Tensor Z: An (optional) 2D tensor with shape
+            :math:`M \times input\_dim`.
+        :param int block_size: Maximum number of rows and columns of a tile of the
+            covariance matrix.
+        :returns: a 2D tensor with shape :math:`N \times D`
+        :rtype: torch.Tensor
+        """
+        rows = []
+        for i, j, block in self.iter_blocks(X, Z, block_size):
+            product = block.matmul(V[j:j + block_size])
+            if j == 0:
+                rows.append(product)
+            else:
+                rows[-1] = rows[-1] + product
+        return torch.cat(rows)
+
     def _slice_input(self, X):
         r"""
         Slices :math:`X` according to ``self.active_dims``. If ``X`` is 1D then returns
-        a 2D tensor with shape :math:`N \times 1`.
+        a 2D tensor with shape :math:`N \times 1`. Batched inputs with shape
+        ``batch_shape + (N, input_dim)`` are sliced along their last dimension.
 
-        :param torch.Tensor X: A 1D or 2D input tensor.
-        :returns: a 2D slice of :math:`X`
+        :param torch.Tensor X: A 1D, 2D or batched input tensor.
+        :returns: a 2D (or batched) slice of :math:`X`
         :rtype: torch.Tensor
         """
-        if X.dim() == 2:
-            return X[:, self.active_dims]
+        if X.dim() >= 2:
+            return X[..., self.active_dims]
         elif X.dim() == 1:
             return X.unsqueeze(1)
         else:
-            raise ValueError("Input X must be either 1 or 2 dimensional.")
+            raise ValueError("Input X must be at least 1 dimensional.")
+
+    def _check_unbatched(self, X, Z=None):
+        """
+        Raises :class:`NotImplementedError` if ``X`` or ``Z`` is batched, for kernels
+        which do not support batched inputs.
+        """
+        if X.dim() > 2 or (Z is not None and Z.dim() > 2):
+            raise NotImplementedError("{} kernel does not support batched inputs."
+                                      .format(type(self).__name__))
+
+    def _batched(self, param, X, event_dim):
+        """
+        Appends ``event_dim`` singleton dimensions to a parameter of batched inputs
+        ``X``, so that a parameter with shape ``batch_shape`` broadcasts against
+        outputs with shape ``batch_shape + (N,)`` (``event_dim=1``) or
+        ``batch_shape + (N, M)`` (``event_dim=2``). Parameters of non-batched inputs
+        are returned unchanged.
+        """
+        if X.dim() <= 2 or param.dim() == 0:
+            return param
+        return param.reshape(param.shape + (1,) * event_dim)
 
 
 class Combination(Kernel):
     """
     Base class for kernels derived from a combination of kernels.
 
+    During a forward pass of a combination kernel, its sub-kernels which act on the
+    same inputs and active dimensions share pairwise computations. For example, the
+    pairwise squared distances in ``Sum(RBF(2), Matern52(2))`` are computed once
+    (exactly once if the lengthscales are scalar, see :class:`.Isotropy`).
+
     :param Kernel kern0: First kernel to combine.
     :param kern1: Second kernel to combine.
     :type kern1: Kernel or numbers.Number
@@ -101,10 +246,11 @@ class Sum(Combination):
     The second kernel can be a constant.
     """
     def forward(self, X, Z=None, diag=False):
-        if isinstance(self.kern1, Kernel):
-            return self.kern0(X, Z, diag=diag) + self.kern1(X, Z, diag=diag)
-        else:  # constant
-            return self.kern0(X, Z, diag=diag) + self.kern1
+        with _shared_pairwise_cache():
+            if isinstance(self.kern1, Kernel):
+                return self.kern0(X, Z, diag=diag) + self.kern1(X, Z, diag=diag)
+            else:  # constant
+                return self.kern0(X, Z, diag=diag) + self.kern1
 
 
 class Product(Combination):
@@ -113,10 +259,11 @@ class Product(Combination):
     The second kernel can be a constant.
     """
     def forward(self, X, Z=None, diag=False):
-        if isinstance(self.kern1, Kernel):
-            return self.kern0(X, Z, diag=diag) * self.kern1(X, Z, diag=diag)
-        else:  # constant
-            return self.kern0(X, Z, diag=diag) * self.kern1
+        with _shared_pairwise_cache():
+            if isinstance(self.kern1, Kernel):
+                return self.kern0(X, Z, diag=diag) * self.kern1(X, Z, diag=diag)
+            else:  # constant
+                return self.kern0(X, Z, diag=diag) * self.kern1
 
 
 class Transforming(Kernel):
@@ -161,11 +308,11 @@ class VerticalScaling(Transforming):
         if diag:
             return self.vscaling_fn(X) * self.kern(X, Z, diag=diag) * self.vscaling_fn(X)
         elif Z is None:
-            vscaled_X = self.vscaling_fn(X).unsqueeze(1)
-            return vscaled_X * self.kern(X, Z, diag=diag) * vscaled_X.t()
+            vscaled_X = self.vscaling_fn(X).unsqueeze(-1)
+            return vscaled_X * self.kern(X, Z, diag=diag) * vscaled_X.transpose(-2, -1)
         else:
-            return (self.vscaling_fn(X).unsqueeze(1) * self.kern(X, Z, diag=diag) *
-                    self.vscaling_fn(Z).unsqueeze(0))
+            return (self.vscaling_fn(X).unsqueeze(-1) * self.kern(X, Z, diag=diag) *
+                    self.vscaling_fn(Z).unsqueeze(-2))
 
 
 def _Horner_evaluate(x, coef):
@@ -7,7 +7,7 @@ from torch.distributions import constraints
 from torch.nn import Parameter
 
 from .isotropic import Isotropy
-from .kernel import Kernel
+from .kernel import Kernel, _pairwise_cached
 
 
 class Cosine(Isotropy):
@@ -61,16 +61,20 @@ class Periodic(Kernel):
         self.set_constraint("period", constraints.positive)
 
     def forward(self, X, Z=None, diag=False):
+        self._check_unbatched(X, Z)
         if diag:
             return self.variance.expand(X.size(0))
 
         if Z is None:
             Z = X
+        d = _pairwise_cached("difference", (X, Z), lambda: self._difference(X, Z),
+                             tuple(self.active_dims))
+        scaled_sin = torch.sin(math.pi * d / self.period) / self.lengthscale
+        return self.variance * torch.exp(-2 * (scaled_sin ** 2).sum(-1))
+
+    def _difference(self, X, Z):
         X = self._slice_input(X)
         Z = self._slice_input(Z)
         if X.size(1) != Z.size(1):
             raise ValueError("Inputs must have the same number of features.")
-
-        d = X.unsqueeze(1) - Z.unsqueeze(0)
-        scaled_sin = torch.sin(math.pi * d / self.period) / self.lengthscale
-        return self.variance * torch.exp(-2 * (scaled_sin ** 2).sum(-1))
+        return X.unsqueeze(1) - Z.unsqueeze(0)
@@ -21,6 +21,12 @@ class Constant(Kernel):
         self.set_constraint("variance", constraints.positive)
 
     def forward(self, X, Z=None, diag=False):
+        if X.dim() > 2:
+            if diag:
+                return self._batched(self.variance, X, 1).expand(X.shape[:-1])
+            Z = X if Z is None else Z
+            return self._batched(self.variance, X, 2).expand(X.shape[:-1] + (Z.size(-2),))
+
         if diag:
             return self.variance.expand(X.size(0))
 
@@ -45,6 +51,15 @@ class WhiteNoise(Kernel):
         self.set_constraint("variance", constraints.positive)
 
     def forward(self, X, Z=None, diag=False):
+        if X.dim() > 2:
+            variance = self._batched(self.variance, X, 1).expand(X.shape[:-1])
+            if diag:
+                return variance
+            if Z is None:
+                return torch.diag_embed(variance)
+            else:
+                return X.data.new_zeros(X.shape[:-1] + (Z.size(-2),))
+
         if diag:
             return self.variance.expand(X.size(0))
 
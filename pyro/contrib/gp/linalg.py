@@ -0,0 +1,329 @@
+from __future__ import absolute_import, division, print_function
+
+import math
+
+import six
+import torch
+from torch.distributions import constraints
+
+from pyro.contrib.gp.kernels import Kernel
+from pyro.distributions.torch_distribution import TorchDistribution
+
+
+def _kernel_tensors(kernel):
+    """
+    Returns the tensors requiring gradients which a kernel reads directly in its
+    forward pass: its buffers (the constrained values of :class:`Parameterized`
+    parameters) and those parameters which are not only used to compute a buffer.
+    """
+    tensors = []
+    for module in kernel.modules():
+        buffers = [name for name, t in module._buffers.items() if t is not None]
+        for name, t in module._parameters.items():
+            if t is None or not t.requires_grad:
+                continue
+            # e.g. `lengthscale_unconstrained` or `lengthscale_map` is read through `lengthscale`
+            if any(name.startswith(buffer + "_") for buffer in buffers):
+                continue
+            tensors.append(t)
+        tensors.extend(module._buffers[name] for name in buffers if module._buffers[name].requires_grad)
+    return tensors
+
+
+def _kernel_bilinear(kernel, block_size, X, A, B, tensors):
+    """
+    Computes the column-wise bilinear forms ``(A * (kernel(X) @ B)).sum(0)``.
+    Kernels with a structured :meth:`~pyro.contrib.gp.kernels.kernel.Kernel.matmul`
+    are differentiated through it directly.
+    """
+    if six.get_unbound_function(type(kernel).matmul) is not six.get_unbound_function(Kernel.matmul):
+        return (A * kernel.matmul(X, B, block_size=block_size)).sum(0)
+    return _KernelBilinear.apply(kernel, block_size, X, A, B, *tensors)
+
+
+class _KernelBilinear(torch.autograd.Function):
+    """
+    Computes the column-wise bilinear forms ``(A * (kernel(X) @ B)).sum(0)`` by
+    evaluating the kernel matrix tile by tile. The backward pass evaluates the tiles
+    again instead of storing them, so memory stays linear in ``N``.
+    """
+    @staticmethod
+    def forward(ctx, kernel, block_size, X, A, B, *tensors):
+        ctx.kernel = kernel
+        ctx.block_size = block_size
+        ctx.save_for_backward(X, A, B)
+        ctx.tensors = tensors
+        result = A.new_zeros(A.size(1))
+        for i, j, block in kernel.iter_blocks(X, block_size=block_size):
+            result += (A[i:i + block_size] * block.matmul(B[j:j + block_size])).sum(0)
+        return result
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        X, A, B = ctx.saved_tensors
+        inputs = ([X] if ctx.needs_input_grad[2] else []) + [t for t in ctx.tensors]
+        grads = [torch.zeros_like(t) for t in inputs]
+        with torch.enable_grad():
+            for i, j, block in ctx.kernel.iter_blocks(X, block_size=ctx.block_size):
+                s = (A[i:i + ctx.block_size] * block.matmul(B[j:j + ctx.block_size])).sum(0)
+                s = (s * grad_output).sum()
+                block_grads = torch.autograd.grad(s, inputs, allow_unused=True)
+                for grad, block_grad in zip(grads, block_grads):
+                    if block_grad is not None:
+                        grad += block_grad
+        X_grad = grads.pop(0) if ctx.needs_input_grad[2] else None
+        return (None, None, X_grad, None, None) + tuple(grads)
+
+
+class IterativeSolver(object):
+    r"""
+    A matrix-free linear algebra backend for Gaussian Process regression, which can
+    be passed as ``solver`` argument to :class:`~pyro.contrib.gp.models.GPRegression`.
+
+    Instead of forming the :math:`N \times N` kernel matrix :math:`K` and its
+    Cholesky decomposition, this backend only evaluates kernel matrix-vector
+    products, in tiles of ``block_size x block_size`` entries (see
+    :meth:`~pyro.contrib.gp.kernels.kernel.Kernel.matmul`). Linear systems are solved by
+    conjugate gradients preconditioned by a partial pivoted Cholesky decomposition
+    of :math:`K` (see reference [1]); :math:`\log\det K` is estimated by stochastic
+    Lanczos quadrature (see reference [2]) and the gradient of :math:`\log\det K` is
+    estimated by Hutchinson's trace estimator. Each training step has
+    :math:`\mathcal{O}(N^2)` time complexity and :math:`\mathcal{O}(N)` memory
+    complexity.
+
+    .. note:: Log likelihoods and their gradients are stochastic estimates, so this
+        backend is meant to be used with stochastic optimizers such as
+        :class:`torch.optim.Adam`.
+
+    .. note:: Gradients are computed with respect to parameters and buffers of the
+        kernel module, so kernel hyperparameters must be registered in the kernel
+        (or one of its submodules).
+
+    References:
+
+    [1] `GPyTorch: Blackbox Matrix-Matrix Gaussian Process Inference with GPU
+    Acceleration`, Jacob R. Gardner, Geoff Pleiss, David Bindel, Kilian Q.
+    Weinberger, Andrew Gordon Wilson
+
+    [2] `Fast Estimation of tr(f(A)) via Stochastic Lanczos Quadrature`,
+    Shashanka Ubaru, Jie Chen, Yousef Saad
+
+    :param int max_iter: Maximum number of conjugate gradient iterations.
+    :param float tol: Tolerance of relative residual norms of conjugate gradients.
+    :param int num_probes: Number of random probe vectors to estimate
+        :math:`\log\det K` and its gradient.
+    :param int num_lanczos: Number of Lanczos iterations for each probe vector.
+    :param int precond_rank: Rank of the pivoted Cholesky preconditioner. If 0,
+        a diagonal (Jacobi) preconditioner is used.
+    :param int block_size: Maximum number of rows and columns of a kernel matrix tile.
+    """
+    def __init__(self, max_iter=1000, tol=1e-4, num_probes=10, num_lanczos=30,
+                 precond_rank=10, block_size=1024):
+        self.max_iter = max_iter
+        self.tol = tol
+        self.num_probes = num_probes
+        self.num_lanczos = num_lanczos
+        self.precond_rank = precond_rank
+        self.block_size = block_size
+
+    def matmul(self, kernel, X, V, diag=0):
+        r"""
+        Computes :math:`(K + diag \times I) V` without forming :math:`K = k(X, X)`.
+
+        :param ~pyro.contrib.gp.kernels.kernel.Kernel kernel: A Pyro kernel object.
+        :param torch.Tensor X: Input data with first dimension :math:`N`.
+        :param torch.Tensor V: A 2D tensor with first dimension :math:`N`.
+        :param diag: A term added to the diagonal of the kernel matrix.
+        :rtype: torch.Tensor
+        """
+        return kernel.matmul(X, V, block_size=self.block_size) + diag * V
+
+    def _preconditioner(self, kernel, X, diag):
+        r"""
+        Returns a function which computes :math:`P^{-1} V`, where
+        :math:`P = L L^T + diag \times I` and :math:`L` is a rank ``precond_rank``
+        pivoted Cholesky factor of :math:`K`.
+        """
+        N = X.size(0)
+        Kdiag = kernel(X, diag=True).expand(N)
+        rank = min(self.precond_rank, N)
+        if rank == 0:
+            d = Kdiag + diag
+            return lambda V: V / d.unsqueeze(-1)
+
+        # pivoted Cholesky decomposition, see reference [1]
+        residual = Kdiag.clone()
+        Lt = X.new_zeros(rank, N)
+        for m in range(rank):
+            pivot = residual.argmax()
+            if residual[pivot] <= 0:
+                Lt = Lt[:m]
+                break
+            row = kernel(X[pivot:pivot + 1], X).squeeze(0)
+            Lt[m] = (row - Lt[:m, pivot].matmul(Lt[:m])) / residual[pivot].sqrt()
+            residual = residual - Lt[m].pow(2)
+            residual[pivot] = 0
+
+        # Woodbury identity:
+        # inv(P) = (I - L @ inv(diag * I + L.T @ L) @ L.T) / diag
+        C = Lt.matmul(Lt.t()).contiguous()
+        C.view(-1)[::C.size(0) + 1] += diag
+        Lc = C.cholesky()
+
+        def precond(V):
+            W = Lt.matmul(V).trtrs(Lc, upper=False)[0].trtrs(Lc.t(), upper=True)[0]
+            return (V - Lt.t().matmul(W)) / diag
+        return precond
+
+    def solve(self, kernel, X, B, diag=0):
+        r"""
+        Solves :math:`(K + diag \times I) A = B` for :math:`A` by preconditioned
+        conjugate gradients. This method does not track gradients.
+
+        :param ~pyro.contrib.gp.kernels.kernel.Kernel kernel: A Pyro kernel object.
+        :param torch.Tensor X: Input data with first dimension :math:`N`.
+        :param torch.Tensor B: A 2D tensor with first dimension :math:`N`.
+        :param diag: A positive term added to the diagonal of the kernel matrix.
+        :rtype: torch.Tensor
+        """
+        with torch.no_grad():
+            return self._solve(kernel, X, B, diag, self._preconditioner(kernel, X, diag))
+
+    def _solve(self, kernel, X, B, diag, precond):
+        A = torch.zeros_like(B)
+        R = B
+        Z = precond(R)
+        P = Z
+        RZ = (R * Z).sum(0)
+        B_norm = B.norm(dim=0).clamp(min=torch.finfo(B.dtype).tiny)
+        for _ in range(self.max_iter):
+            KP = self.matmul(kernel, X, P, diag)
+            alpha = RZ / (P * KP).sum(0).clamp(min=torch.finfo(B.dtype).tiny)
+            A = A + alpha * P
+            R = R - alpha * KP
+            if (R.norm(dim=0) <= self.tol * B_norm).all():
+                break
+            Z = precond(R)
+            RZ_new = (R * Z).sum(0)
+            P = Z + (RZ_new / RZ.clamp(min=torch.finfo(B.dtype).tiny)) * P
+            RZ = RZ_new
+        return A
+
+    def _lanczos_logdet(self, kernel, X, probes, diag):
+        r"""
+        Estimates :math:`\log\det(K + diag \times I)` by stochastic Lanczos quadrature
+        using the columns of ``probes``.
+        """
+        tiny = torch.finfo(probes.dtype).tiny
+        num_steps = min(self.num_lanczos, X.size(0))
+        probe_norm = probes.norm(dim=0)
+        q = probes / probe_norm
+        q_prev = torch.zeros_like(q)
+        beta = q.new_zeros(q.size(1))
+        alphas, betas = [], []
+        for j in range(num_steps):
+            w = self.matmul(kernel, X, q, diag) - beta * q_prev
+            alpha = (q * w).sum(0)
+            w = w - alpha * q
+            alphas.append(alpha)
+            if j == num_steps - 1:
+                break
+            beta = w.norm(dim=0).clamp(min=tiny)
+            betas.append(beta)
+            q_prev, q = q, w / beta
+
+        logdet = q.new_tensor(0.)
+        for i in range(probes.size(1)):
+            T = torch.stack([a[i] for a in alphas]).diag()
+            if betas:
+                off_diag = torch.stack([b[i] for b in betas])
+                T = T + off_diag.diag(1) + off_diag.diag(-1)
+            eigvals, eigvecs = T.symeig(eigenvectors=True)
+            quadrature = (eigvecs[0].pow(2) * eigvals.clamp(min=tiny).log()).sum()
+            logdet = logdet + probe_norm[i].pow(2) * quadrature
+        return logdet / probes.size(1)
+
+    def log_prob(self, kernel, X, value, diag=0):
+        r"""
+        Computes the log density of :math:`\mathcal{N}(0, K + diag \times I)` at
+        ``value``, together with a surrogate for its gradient with respect to
+        ``value``, ``diag``, ``X`` and kernel hyperparameters.
+
+        :param ~pyro.contrib.gp.kernels.kernel.Kernel kernel: A Pyro kernel object.
+        :param torch.Tensor X: Input data with first dimension :math:`N`.
+        :param torch.Tensor value: A tensor whose last dimension is :math:`N`.
+        :param diag: A positive term added to the diagonal of the kernel matrix.
+        :returns: log densities with shape ``value.shape[:-1]``
+        :rtype: torch.Tensor
+        """
+        N = X.size(0)
+        batch_shape = value.shape[:-1]
+        value_2D = value.reshape(-1, N).t()
+        num_outputs = value_2D.size(1)
+        diag = diag if torch.is_tensor(diag) else value.new_tensor(diag)
+
+        with torch.no_grad():
+            probes = value.new_empty(N, self.num_probes).bernoulli_(0.5).mul_(2).sub_(1)
+            precond = self._preconditioner(kernel, X, diag)
+            # alpha = inv(K) @ value, u = inv(K) @ probes
+            solution = self._solve(kernel, X, torch.cat((value_2D, probes), dim=1), diag, precond)
+            alpha, u = solution[:, :num_outputs], solution[:, num_outputs:]
+            logdet = self._lanczos_logdet(kernel, X, probes, diag)
+            quad = (value_2D * alpha).sum(0)
+            log_prob = -0.5 * (quad + logdet + N * math.log(2 * math.pi))
+
+        # d(quad) = 2 alpha.T @ d(value) - alpha.T @ dK @ alpha
+        # d(logdet) = tr(inv(K) @ dK) ~ mean(u.T @ dK @ probes)
+        tensors = _kernel_tensors(kernel)
+        surrogate = (alpha * value_2D).sum(0) - 0.5 * diag * alpha.pow(2).sum(0)
+        if tensors or X.requires_grad:
+            K_alpha = _kernel_bilinear(kernel, self.block_size, X, alpha, alpha, tensors)
+            K_probes = _kernel_bilinear(kernel, self.block_size, X, u, probes, tensors)
+            surrogate = surrogate - 0.5 * K_alpha + 0.5 * K_probes.mean()
+        surrogate = surrogate + 0.5 * diag * (u * probes).sum(0).mean()
+        log_prob = log_prob - (surrogate - surrogate.detach())
+        return log_prob.reshape(batch_shape)
+
+
+class MatrixFreeMultivariateNormal(TorchDistribution):
+    r"""
+    Multivariate normal distribution :math:`\mathcal{N}(loc, k(X, X) + diag \times I)`
+    whose log density is computed by an :class:`IterativeSolver` without forming the
+    covariance matrix. This distribution can only be used to score observations.
+
+    :param torch.Tensor loc: Mean of the distribution, with shape
+        ``batch_shape + (N,)``.
+    :param ~pyro.contrib.gp.kernels.kernel.Kernel kernel: A Pyro kernel object.
+    :param torch.Tensor X: Input data with first dimension :math:`N`.
+    :param diag: A positive term added to the diagonal of the covariance matrix.
+    :param IterativeSolver solver: A matrix-free linear algebra backend.
+    """
+    arg_constraints = {}
+    support = constraints.real
+
+    def __init__(self, loc, kernel, X, diag, solver, validate_args=None):
+        self.loc = loc
+        self.kernel = kernel
+        self.X = X
+        self.diag = diag
+        self.solver = solver
+        super(MatrixFreeMultivariateNormal, self).__init__(loc.shape[:-1], loc.shape[-1:],
+                                                           validate_args=validate_args)
+
+    def expand(self, batch_shape, _instance=None):
+        new = self._get_checked_instance(MatrixFreeMultivariateNormal, _instance)
+        batch_shape = torch.Size(batch_shape)
+        new.loc = self.loc.expand(batch_shape + self.event_shape)
+        new.kernel = self.kernel
+        new.X = self.X
+        new.diag = self.diag
+        new.solver = self.solver
+        super(MatrixFreeMultivariateNormal, new).__init__(batch_shape, self.event_shape,
+                                                          validate_args=False)
+        new._validate_args = self._validate_args
+        return new
+
+    def log_prob(self, value):
+        value = value - self.loc
+        shape = torch.Size(torch.broadcast_tensors(value, self.loc)[0].shape)
+        return self.solver.log_prob(self.kernel, self.X, value.expand(shape), self.diag)
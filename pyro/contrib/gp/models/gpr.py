@@ -7,8 +7,9 @@ from torch.nn import Parameter
 import pyro
 import pyro.distributions as dist
 from pyro.contrib import autoname
+from pyro.contrib.gp.linalg import MatrixFreeMultivariateNormal
 from pyro.contrib.gp.models.model import GPModel
-from pyro.contrib.gp.util import conditional
+from pyro.contrib.gp.util import _predict_in_blocks, _whiten, conditional
 from pyro.util import warn_if_nan
 
 
@@ -45,7 +46,29 @@ class GPRegression(GPModel):
 
     .. note:: This model has :math:`\mathcal{O}(N^3)` complexity for training,
         :math:`\mathcal{O}(N^3)` complexity for testing. Here, :math:`N` is the number
-        of train inputs.
+        of train inputs. Passing an :class:`~pyro.contrib.gp.linalg.IterativeSolver`
+        as ``solver`` reduces the training complexity to :math:`\mathcal{O}(N^2)`
+        per step and the memory to :math:`\mathcal{O}(N)`.
+
+    To fit many independent Gaussian Processes at once (e.g. one for each of many
+    time series), use batched inputs ``X`` with shape ``batch_shape + (N, input_dim)``
+    and outputs ``y`` with shape ``batch_shape + (N,)``. Parameters of the kernel and
+    ``noise`` are either shared or have shape ``batch_shape`` (see
+    :class:`~pyro.contrib.gp.kernels.kernel.Kernel`). Then each training step needs
+    only one batched Cholesky decomposition, and :meth:`forward` predicts for all
+    Gaussian Processes at once:
+
+        >>> X = torch.rand(100, 20, 1)
+        >>> y = (6 * X.squeeze(-1)).sin()
+        >>> kernel = gp.kernels.RBF(input_dim=1, variance=torch.ones(100),
+        ...                         lengthscale=torch.ones(100, 1))
+        >>> gpr = gp.models.GPRegression(X, y, kernel, noise=torch.ones(100))
+        >>> f_loc, f_var = gpr(torch.rand(100, 5, 1))
+        >>> assert f_loc.shape == (100, 5)
+
+    The loss of a batched model is the sum of losses of the Gaussian Processes, so
+    minimizing it (e.g. by :func:`~pyro.contrib.gp.util.train`) fits each of them.
+    Batched inputs are not supported by ``solver``.
 
     Reference:
 
@@ -63,9 +86,14 @@ class GPRegression(GPModel):
         process. By default, we use zero mean.
     :param float jitter: A small positive term which is added into the diagonal part of
         a covariance matrix to help stablize its Cholesky decomposition.
+    :param ~pyro.contrib.gp.linalg.IterativeSolver solver: An optional matrix-free
+        linear algebra backend. By default, Cholesky decomposition is used. Note that
+        with a solver, the outputs of :meth:`forward` only have correct gradients with
+        respect to ``Xnew``.
     """
-    def __init__(self, X, y, kernel, noise=None, mean_function=None, jitter=1e-6):
+    def __init__(self, X, y, kernel, noise=None, mean_function=None, jitter=1e-6, solver=None):
         super(GPRegression, self).__init__(X, y, kernel, mean_function, jitter)
+        self.solver = solver
 
         noise = self.X.new_tensor(1.) if noise is None else noise
         self.noise = Parameter(noise)
@@ -75,12 +103,15 @@ class GPRegression(GPModel):
     def model(self):
         self.set_mode("model")
 
-        N = self.X.size(0)
-        Kff = self.kernel(self.X)
-        Kff.view(-1)[::N + 1] += self.jitter + self.noise  # add noise to diagonal
+        if self.solver is not None:
+            if self.X.dim() > 2:
+                raise NotImplementedError("Batched inputs are not supported by iterative solvers.")
+            return self._iterative_model()
+
+        Kff = self._noisy_kernel_matrix()
         Lff = Kff.cholesky()
 
-        zero_loc = self.X.new_zeros(self.X.size(0))
+        zero_loc = self.X.new_zeros(Lff.shape[:-1])
         f_loc = zero_loc + self.mean_function(self.X)
         if self.y is None:
             f_var = Lff.pow(2).sum(dim=-1)
@@ -88,10 +119,38 @@ class GPRegression(GPModel):
         else:
             return pyro.sample("y",
                                dist.MultivariateNormal(f_loc, scale_tril=Lff)
-                                   .expand_by(self.y.shape[:-1])
+                                   .expand(self.y.shape[:-1])
                                    .to_event(self.y.dim() - 1),
                                obs=self.y)
 
+    def _noisy_kernel_matrix(self):
+        """
+        Computes the kernel matrix of training inputs, with noise and jitter added to
+        its diagonal.
+        """
+        Kff = self.kernel(self.X).contiguous()
+        N = Kff.size(-1)
+        if self.X.dim() > 2:
+            # noise is either shared or has shape batch_shape
+            diag = (self.jitter + self.noise).expand(Kff.shape[:-2]).reshape(-1, 1)
+            Kff.view(-1, N * N)[:, ::N + 1] += diag
+        else:
+            Kff.view(-1)[::N + 1] += self.jitter + self.noise  # add noise to diagonal
+        return Kff
+
+    def _iterative_model(self):
+        f_loc = self.X.new_zeros(self.X.size(0)) + self.mean_function(self.X)
+        diag = self.noise + self.jitter
+        if self.y is None:
+            f_var = self.kernel(self.X, diag=True) + diag
+            return f_loc, f_var
+        else:
+            y_dist = MatrixFreeMultivariateNormal(f_loc, self.kernel, self.X, diag, self.solver)
+            return pyro.sample("y",
+                               y_dist.expand_by(self.y.shape[:-1])
+                                     .to_event(self.y.dim() - 1),
+                               obs=self.y)
+
     @autoname.scope(prefix="GPR")
     def guide(self):
         self.set_mode("guide")
@@ -119,24 +178,108 @@ class GPRegression(GPModel):
         self._check_Xnew_shape(Xnew)
         self.set_mode("guide")
 
-        N = self.X.size(0)
-        Kff = self.kernel(self.X).contiguous()
-        Kff.view(-1)[::N + 1] += self.jitter + self.noise  # add noise to the diagonal
-        Lff = Kff.cholesky()
-
-        y_residual = self.y - self.mean_function(self.X)
-        loc, cov = conditional(Xnew, self.X, self.kernel, y_residual, None, Lff,
-                               full_cov, jitter=self.jitter)
-
-        if full_cov and not noiseless:
+        if self.solver is None and self.X.dim() > 2:
+            Lff, v = self._cached(self._posterior_factor, self.jitter)
+            loc, cov = _predict_in_blocks(lambda Xnew: self._batched_conditional(Xnew, Lff, v, full_cov),
+                                          Xnew, full_cov, self.block_size)
+        elif self.solver is None:
+            Lff, v = self._cached(self._posterior_factor, self.jitter)
+            loc, cov = conditional(Xnew, self.X, self.kernel, v, None, Lff,
+                                   full_cov, whiten=True, jitter=self.jitter,
+                                   block_size=self.block_size)
+        else:
+            alpha = self._cached(self._posterior_solution, self.jitter, self.solver)
+            loc, cov = _predict_in_blocks(lambda Xnew: self._iterative_conditional(Xnew, alpha, full_cov),
+                                          Xnew, full_cov, self.block_size)
+
+        if not noiseless and self.X.dim() > 2:
+            # broadcast a batched noise over test points
+            noise = self.noise.unsqueeze(-1) if self.noise.dim() > 0 else self.noise
+            if full_cov:
+                cov = cov + torch.diag_embed(noise.expand(cov.shape[:-1]))
+            else:
+                cov = cov + noise
+        elif full_cov and not noiseless:
             M = Xnew.size(0)
             cov = cov.contiguous()
             cov.view(-1, M * M)[:, ::M + 1] += self.noise  # add noise to the diagonal
-        if not full_cov and not noiseless:
+        elif not full_cov and not noiseless:
             cov = cov + self.noise
 
         return loc + self.mean_function(Xnew), cov
 
+    def _posterior_factor(self):
+        """
+        Computes the Cholesky factor ``Lff`` of the noisy kernel matrix and the whitened
+        residual ``v = inv(Lff) @ (y - m(X))``, which are reused in :meth:`forward`.
+        """
+        Lff = self._noisy_kernel_matrix().cholesky()
+
+        y_residual = self.y - self.mean_function(self.X)
+        if self.X.dim() > 2:
+            # move latent dimensions of y to the right: batch_shape + (N,) + latent_shape
+            latent_dim = y_residual.dim() - self.X.dim() + 1
+            dims = list(range(latent_dim, y_residual.dim())) + list(range(latent_dim))
+            y_residual = y_residual.permute(dims)
+            y_2D = y_residual.reshape(Lff.shape[:-1] + (-1,))
+            v = y_2D.trtrs(Lff, upper=False)[0].reshape(y_residual.shape)
+            dims = list(range(v.dim() - latent_dim, v.dim())) + list(range(v.dim() - latent_dim))
+            return Lff, v.permute(dims)
+        v = _whiten(Lff, y_residual)[0]
+        return Lff, v
+
+    def _batched_conditional(self, Xnew, Lff, v, full_cov):
+        """
+        Computes the posterior loc and covariance matrix (or variance) of batched
+        inputs ``Xnew`` from the Cholesky factor ``Lff`` of noisy kernel matrices and
+        the whitened residual ``v = inv(Lff) @ (y - m(X))``.
+        """
+        Kfs = self.kernel(self.X, Xnew)
+        W = Kfs.trtrs(Lff, upper=False)[0]
+        loc = v.unsqueeze(-2).matmul(W).squeeze(-2)
+        if full_cov:
+            cov = self.kernel(Xnew) - W.transpose(-2, -1).matmul(W)
+            cov = cov.expand(loc.shape + loc.shape[-1:])
+        else:
+            cov = self.kernel(Xnew, diag=True) - W.pow(2).sum(dim=-2)
+            cov = cov.expand(loc.shape)
+        return loc, cov
+
+    def _posterior_solution(self):
+        """
+        Solves ``alpha = inv(Kff + noise) @ (y - m(X))`` with :attr:`solver`, which is
+        reused in :meth:`forward`.
+        """
+        N = self.X.size(0)
+        y_residual = self.y - self.mean_function(self.X)
+        y_2D = y_residual.reshape(-1, N).t()
+        alpha_2D = self.solver.solve(self.kernel, self.X, y_2D, self.noise + self.jitter)
+        return alpha_2D.t().reshape(y_residual.shape)
+
+    def _iterative_conditional(self, Xnew, alpha, full_cov):
+        """
+        Computes the posterior loc and covariance matrix (or variance) at ``Xnew``
+        from ``alpha = inv(Kff + noise) @ (y - m(X))``. Linear systems are solved by
+        :attr:`solver` without tracking gradients, so the returned loc and covariance
+        only have correct gradients with respect to ``Xnew``.
+        """
+        M = Xnew.size(0)
+        latent_shape = alpha.shape[:-1]
+        Kfs = self.kernel(self.X, Xnew)
+        loc = alpha.matmul(Kfs)
+
+        # Qss = Ksf @ inv(Kff + noise) @ Kfs, where A = inv(Kff + noise) @ Kfs is detached
+        A = self.solver.solve(self.kernel, self.X, Kfs.detach(), self.noise.detach() + self.jitter)
+        if full_cov:
+            Kfs_A = Kfs.t().matmul(A)
+            Qss = Kfs_A + Kfs_A.t() - Kfs_A.detach()
+            cov = (self.kernel(Xnew) - Qss).expand(latent_shape + (M, M))
+        else:
+            Kfs_A = (Kfs * A).sum(dim=0)
+            Qss = 2 * Kfs_A - Kfs_A.detach()
+            cov = (self.kernel(Xnew, diag=True) - Qss).expand(latent_shape + (M,))
+        return loc, cov
+
     def iter_sample(self, noiseless=True):
         r"""
         Iteratively constructs a sample from the Gaussian Process posterior.
@@ -154,6 +297,10 @@ class GPRegression(GPModel):
             kernel's parameters have been learned from a training procedure (MCMC or
             SVI).
 
+        .. note:: The Cholesky factor of the kernel matrix is updated by one row each
+            time a new point is conditioned on, so each call of the sampler has
+            :math:`\mathcal{O}(N^2)` complexity. Storage grows geometrically.
+
         :param bool noiseless: A flag to decide if we want to add sampling noise
             to the samples beyond the noise inherent in the GP posterior.
         :returns: sampler
@@ -163,10 +310,27 @@ class GPRegression(GPModel):
         X = self.X.clone().detach()
         y = self.y.clone().detach()
         N = X.size(0)
-        Kff = self.kernel(X).contiguous()
-        Kff.view(-1)[::N + 1] += noise  # add noise to the diagonal
+        with torch.no_grad():
+            Kff = self.kernel(X).contiguous()
+            Kff.view(-1)[::N + 1] += noise  # add noise to the diagonal
+            Lff = Kff.cholesky()
+            y_residual = y - self.mean_function(X)
+            v = y_residual.unsqueeze(-1).trtrs(Lff, upper=False)[0].squeeze(-1)
+            logdet = 2 * Lff.diag().log().sum()
+
+        outside_vars = {"N": N, "X": X, "Lff": Lff, "v": v, "logdet": logdet}
 
-        outside_vars = {"X": X, "y": y, "N": N, "Kff": Kff}
+        def grow(outside_vars):
+            """Doubles the capacity of the storage for conditioned points."""
+            N = outside_vars["N"]
+            capacity = 2 * N + 1
+            X = outside_vars["X"].new_empty((capacity,) + outside_vars["X"].shape[1:])
+            X[:N] = outside_vars["X"][:N]
+            Lff = outside_vars["Lff"].new_zeros(capacity, capacity)
+            Lff[:N, :N] = outside_vars["Lff"][:N, :N]
+            v = outside_vars["v"].new_empty(capacity)
+            v[:N] = outside_vars["v"][:N]
+            outside_vars.update({"X": X, "Lff": Lff, "v": v})
 
         def sample_next(xnew, outside_vars):
             """Repeatedly samples from the Gaussian process posterior,
@@ -175,36 +339,45 @@ class GPRegression(GPModel):
             warn_if_nan(xnew)
 
             # Variables from outer scope
-            X, y, Kff = outside_vars["X"], outside_vars["y"], outside_vars["Kff"]
-
-            # Compute Cholesky decomposition of kernel matrix
-            Lff = Kff.cholesky()
-            y_residual = y - self.mean_function(X)
+            N = outside_vars["N"]
+            X = outside_vars["X"][:N]
+            Lff = outside_vars["Lff"][:N, :N]
+            v = outside_vars["v"][:N]  # v = inv(Lff) @ y_residual
+            if xnew.requires_grad:
+                # these views are saved for backward, so we decouple them from
+                # the in-place updates of the storage below
+                X, Lff, v = X.clone(), Lff.clone(), v.clone()
 
             # Compute conditional mean and variance
-            loc, cov = conditional(xnew, X, self.kernel, y_residual, None, Lff,
-                                   False, jitter=self.jitter)
+            Kfs = self.kernel(X, xnew)
+            W = Kfs.trtrs(Lff, upper=False)[0]
+            loc = W.t().matmul(v)
+            cov = self.kernel(xnew, diag=True) - W.pow(2).sum(dim=0)
             if not noiseless:
                 cov = cov + noise
 
             ynew = torchdist.Normal(loc + self.mean_function(xnew), cov.sqrt()).rsample()
 
-            # Update kernel matrix
-            N = outside_vars["N"]
-            Kffnew = Kff.new_empty(N+1, N+1)
-            Kffnew[:N, :N] = Kff
-            cross = self.kernel(X, xnew).squeeze()
-            end = self.kernel(xnew, xnew).squeeze()
-            Kffnew[N, :N] = cross
-            Kffnew[:N, N] = cross
-            # No noise, just jitter for numerical stability
-            Kffnew[N, N] = end + self.jitter
-            # Heuristic to avoid adding degenerate points
-            if Kffnew.logdet() > -15.:
-                outside_vars["Kff"] = Kffnew
-                outside_vars["N"] += 1
-                outside_vars["X"] = torch.cat((X, xnew))
-                outside_vars["y"] = torch.cat((y, ynew))
+            # Update Cholesky factor of kernel matrix by a new row [w, d], where
+            # w = inv(Lff) @ cross and d^2 = end - w @ w
+            with torch.no_grad():
+                w = W.squeeze(-1)
+                end = self.kernel(xnew, xnew).squeeze()
+                # No noise, just jitter for numerical stability
+                d2 = end + self.jitter - w.dot(w)
+                logdet = outside_vars["logdet"] + d2.log()
+                # Heuristic to avoid adding degenerate points
+                if logdet > -15.:
+                    if N == outside_vars["X"].size(0):
+                        grow(outside_vars)
+                    d = d2.sqrt()
+                    outside_vars["X"][N] = xnew.squeeze(0)
+                    outside_vars["Lff"][N, :N] = w
+                    outside_vars["Lff"][N, N] = d
+                    y_residual = ynew - self.mean_function(xnew)
+                    outside_vars["v"][N] = (y_residual.squeeze() - w.dot(outside_vars["v"][:N])) / d
+                    outside_vars["logdet"] = logdet
+                    outside_vars["N"] += 1
 
             return ynew
 
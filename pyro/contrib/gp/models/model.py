@@ -1,5 +1,9 @@
 from __future__ import absolute_import, division, print_function
 
+import torch
+
+import pyro
+import pyro.distributions as dist
 from pyro.contrib.gp.parameterized import Parameterized
 
 
@@ -71,6 +75,21 @@ class GPModel(Parameterized):
         >>> Xnew = torch.tensor([[2., 3, 1]])
         >>> f_loc, f_cov = gpr(Xnew, full_cov=True)
 
+    When gradients are not required (e.g. under :func:`torch.no_grad`), Cholesky
+    factors of kernel matrices computed in :meth:`forward` are cached until the
+    parameters or the training data change. So repeated predictions only need to
+    compute cross covariances and triangular solves:
+
+        >>> with torch.no_grad():
+        ...     f_loc, f_var = gpr(Xnew)
+
+    To predict variances on a large test set with bounded memory, set the attribute
+    ``block_size``. Then :meth:`forward` processes ``Xnew`` in blocks of at most
+    ``block_size`` points (this is ignored if ``full_cov=True``):
+
+        >>> gpr.block_size = 1024
+        >>> f_loc, f_var = gpr(Xnew)
+
     Reference:
 
     [1] `Gaussian Processes for Machine Learning`,
@@ -94,6 +113,7 @@ class GPModel(Parameterized):
         self.mean_function = (mean_function if mean_function is not None else
                               _zero_mean_function)
         self.jitter = jitter
+        self.block_size = None
 
     def model(self):
         """
@@ -184,12 +204,69 @@ class GPModel(Parameterized):
         :param torch.Tensor y: An output data for training. Its last dimension is the
             number of data points.
         """
-        if y is not None and X.size(0) != y.size(-1):
+        # batched inputs have shape batch_shape + (N, input_dim)
+        N = X.size(-2) if X.dim() > 2 else X.size(0)
+        if y is not None and N != y.size(-1):
             raise ValueError("Expected the number of input data points equal to the "
                              "number of output data points, but got {} and {}."
-                             .format(X.size(0), y.size(-1)))
+                             .format(N, y.size(-1)))
         self.X = X
         self.y = y
+        self._prediction_cache = None
+
+    def _subsample(self, subsample_size):
+        """
+        Returns a random minibatch of ``subsample_size`` training data points, whose
+        indices are drawn by a :class:`~pyro.plate` named "data". If
+        ``subsample_size`` is ``None``, returns the whole training data.
+
+        :param int subsample_size: Size of the minibatch.
+        :returns: a minibatch of inputs and outputs
+        :rtype: tuple(torch.Tensor, torch.Tensor)
+        """
+        N = self.X.size(0)
+        if subsample_size is None or subsample_size >= N:
+            return self.X, self.y
+        with pyro.plate("data", N, subsample_size=subsample_size) as idx:
+            return self.X[idx], self.y[..., idx]
+
+    def _cached(self, compute_fn, *args):
+        """
+        Returns ``compute_fn()``, reusing the result of a previous call if parameters
+        and training data have not changed since then. This is used to cache
+        posterior factorizations (e.g. Cholesky factors of kernel matrices) for fast
+        repeated predictions.
+
+        Caching is disabled if gradients with respect to parameters are required, or
+        if a parameter is drawn from a non-Delta guide (so its value is random).
+
+        :param callable compute_fn: A function which computes the factorization.
+        :param args: Additional hashable settings which the factorization depends on.
+        """
+        params = list(self.parameters())
+        if ((torch.is_grad_enabled() and any(p.requires_grad for p in params)) or
+                any(dist_constructor is not dist.Delta
+                    for module in self.modules() if isinstance(module, Parameterized)
+                    for dist_constructor, _ in module._guides.values())):
+            return compute_fn()
+
+        # different compute functions share the cache, so key on the function too
+        args = (compute_fn.__name__,) + args
+        data = [(t, t._version) for t in (self.X, self.y) if t is not None]
+        if self._prediction_cache is not None:
+            cached_args, cached_data, cached_params, value = self._prediction_cache
+            # optimizers might update `p.data` in-place, which does not bump the
+            # version of `p`, so we compare parameters by value
+            if (cached_args == args and len(cached_data) == len(data) and
+                    all(t is u and v == w for (t, v), (u, w) in zip(data, cached_data)) and
+                    len(cached_params) == len(params) and
+                    all(p is q and p.type() == q_value.type() and torch.equal(p, q_value)
+                        for p, (q, q_value) in zip(params, cached_params))):
+                return value
+
+        value = compute_fn()
+        self._prediction_cache = (args, data, [(p, p.detach().clone()) for p in params], value)
+        return value
 
     def _check_Xnew_shape(self, Xnew):
         """
@@ -202,7 +279,13 @@ class GPModel(Parameterized):
             raise ValueError("Train data and test data should have the same "
                              "number of dimensions, but got {} and {}."
                              .format(self.X.dim(), Xnew.dim()))
-        if self.X.shape[1:] != Xnew.shape[1:]:
+        if self.X.dim() > 2:
+            # batched data, with shape batch_shape + (N, input_dim)
+            if self.X.shape[:-2] != Xnew.shape[:-2] or self.X.size(-1) != Xnew.size(-1):
+                raise ValueError("Train data and test data should have the same "
+                                 "batch shape and number of features, but got {} and {}."
+                                 .format(self.X.shape, Xnew.shape))
+        elif self.X.shape[1:] != Xnew.shape[1:]:
             raise ValueError("Train data and test data should have the same "
                              "shape of features, but got {} and {}."
                              .format(self.X.shape[1:], Xnew.shape[1:]))
@@ -6,8 +6,10 @@ from torch.nn import Parameter
 
 import pyro
 import pyro.distributions as dist
+import pyro.poutine as poutine
 from pyro.contrib import autoname
 from pyro.contrib.gp.models.model import GPModel
+from pyro.contrib.gp.util import _predict_in_blocks
 
 
 class SparseGPRegression(GPModel):
@@ -68,6 +70,15 @@ class SparseGPRegression(GPModel):
         :math:`\\mathcal{O}(NM^2)` complexity for testing. Here, :math:`N` is the number
         of train inputs, :math:`M` is the number of inducing inputs.
 
+    .. note:: For large datasets, we can set ``subsample_size`` so that each call of
+        :meth:`model` only uses a random minibatch of ``subsample_size`` data points,
+        whose log likelihood is scaled by ``num_data / subsample_size``. A training
+        step then has :math:`\\mathcal{O}(BM^2 + M^3)` complexity, where :math:`B`
+        is ``subsample_size``. Because the collapsed log likelihood of this model
+        does not factorize over data points, this is a biased stochastic
+        approximation; :class:`.VariationalSparseGP` gives unbiased minibatch
+        estimates of its objective.
+
     References:
 
     [1] `A Unifying View of Sparse Approximate Gaussian Process Regression`,
@@ -92,8 +103,13 @@ class SparseGPRegression(GPModel):
     :param float jitter: A small positive term which is added into the diagonal part of
         a covariance matrix to help stablize its Cholesky decomposition.
     :param str name: Name of this model.
+    :param int num_data: The size of full training dataset. It is useful for training
+        this model with mini-batch.
+    :param int subsample_size: An optional size of random minibatches of training
+        data which are used in each call of :meth:`model`.
     """
-    def __init__(self, X, y, kernel, Xu, noise=None, mean_function=None, approx=None, jitter=1e-6):
+    def __init__(self, X, y, kernel, Xu, noise=None, mean_function=None, approx=None, jitter=1e-6,
+                 num_data=None, subsample_size=None):
         super(SparseGPRegression, self).__init__(X, y, kernel, mean_function, jitter)
 
         self.Xu = Parameter(Xu)
@@ -110,6 +126,9 @@ class SparseGPRegression(GPModel):
             raise ValueError("The sparse approximation method should be one of "
                              "'DTC', 'FITC', 'VFE'.")
 
+        self.num_data = num_data if num_data is not None else self.X.size(0)
+        self.subsample_size = subsample_size
+
     @autoname.scope(prefix="SGPR")
     def model(self):
         self.set_mode("model")
@@ -123,17 +142,21 @@ class SparseGPRegression(GPModel):
         # y_cov = W @ W.T + D
         # trace_term is added into log_prob
 
-        N = self.X.size(0)
+        X, y = self.X, self.y
+        if y is not None:
+            X, y = self._subsample(self.subsample_size)
+
+        N = X.size(0)
         M = self.Xu.size(0)
         Kuu = self.kernel(self.Xu).contiguous()
         Kuu.view(-1)[::M + 1] += self.jitter  # add jitter to the diagonal
         Luu = Kuu.cholesky()
-        Kuf = self.kernel(self.Xu, self.X)
+        Kuf = self.kernel(self.Xu, X)
         W = Kuf.trtrs(Luu, upper=False)[0].t()
 
         D = self.noise.expand(N)
         if self.approx == "FITC" or self.approx == "VFE":
-            Kffdiag = self.kernel(self.X, diag=True)
+            Kffdiag = self.kernel(X, diag=True)
             Qffdiag = W.pow(2).sum(dim=-1)
             if self.approx == "FITC":
                 D = D + Kffdiag - Qffdiag
@@ -141,21 +164,22 @@ class SparseGPRegression(GPModel):
                 trace_term = (Kffdiag - Qffdiag).sum() / self.noise
                 trace_term = trace_term.clamp(min=0)
 
-        zero_loc = self.X.new_zeros(N)
-        f_loc = zero_loc + self.mean_function(self.X)
-        if self.y is None:
+        zero_loc = X.new_zeros(N)
+        f_loc = zero_loc + self.mean_function(X)
+        if y is None:
             f_var = D + W.pow(2).sum(dim=-1)
             return f_loc, f_var
         else:
-            if self.approx == "VFE":
-                pyro.sample("trace_term", dist.Bernoulli(probs=torch.exp(-trace_term / 2.)),
-                            obs=trace_term.new_tensor(1.))
+            with poutine.scale(scale=self.num_data / N):
+                if self.approx == "VFE":
+                    pyro.sample("trace_term", dist.Bernoulli(probs=torch.exp(-trace_term / 2.)),
+                                obs=trace_term.new_tensor(1.))
 
-            return pyro.sample("y",
-                               dist.LowRankMultivariateNormal(f_loc, W, D)
-                                   .expand_by(self.y.shape[:-1])
-                                   .to_event(self.y.dim() - 1),
-                               obs=self.y)
+                return pyro.sample("y",
+                                   dist.LowRankMultivariateNormal(f_loc, W, D)
+                                       .expand_by(y.shape[:-1])
+                                       .to_event(y.dim() - 1),
+                                   obs=y)
 
     @autoname.scope(prefix="SGPR")
     def guide(self):
@@ -197,11 +221,44 @@ class SparseGPRegression(GPModel):
         # cov = Kss - Ksu @ inv(Kuu) @ Kus + Ksu @ S @ Kus
         #     = kss - Ksu @ inv(Kuu) @ Kus + Ws.T @ inv(L).T @ inv(L) @ Ws
 
+        Luu, L, Linv_W_Dinv_y = self._cached(self._posterior_factor, self.jitter, self.approx)
+
+        def predict(Xnew):
+            Kus = self.kernel(self.Xu, Xnew)
+            Ws = Kus.trtrs(Luu, upper=False)[0]
+            Linv_Ws = Ws.trtrs(L, upper=False)[0]
+
+            C = Xnew.size(0)
+            loc_shape = self.y.shape[:-1] + (C,)
+            loc = Linv_W_Dinv_y.t().matmul(Linv_Ws).reshape(loc_shape)
+
+            if full_cov:
+                Kss = self.kernel(Xnew).contiguous()
+                if not noiseless:
+                    Kss.view(-1)[::C + 1] += self.noise  # add noise to the diagonal
+                Qss = Ws.t().matmul(Ws)
+                cov = Kss - Qss + Linv_Ws.t().matmul(Linv_Ws)
+                cov_shape = self.y.shape[:-1] + (C, C)
+            else:
+                Kssdiag = self.kernel(Xnew, diag=True)
+                if not noiseless:
+                    Kssdiag = Kssdiag + self.noise
+                Qssdiag = Ws.pow(2).sum(dim=0)
+                cov = Kssdiag - Qssdiag + Linv_Ws.pow(2).sum(dim=0)
+                cov_shape = self.y.shape[:-1] + (C,)
+            return loc, cov.expand(cov_shape)
+
+        loc, cov = _predict_in_blocks(predict, Xnew, full_cov, self.block_size)
+        return loc + self.mean_function(Xnew), cov
+
+    def _posterior_factor(self):
+        """
+        Computes the terms ``Luu``, ``L`` and ``inv(L) @ W @ inv(D) @ y`` (see
+        :meth:`forward`), which only depend on parameters and training data.
+        """
         N = self.X.size(0)
         M = self.Xu.size(0)
 
-        # TODO: cache these calculations to get faster inference
-
         Kuu = self.kernel(self.Xu).contiguous()
         Kuu.view(-1)[::M + 1] += self.jitter  # add jitter to the diagonal
         Luu = Kuu.cholesky()
@@ -224,35 +281,5 @@ class SparseGPRegression(GPModel):
         y_residual = self.y - self.mean_function(self.X)
         y_2D = y_residual.reshape(-1, N).t()
         W_Dinv_y = W_Dinv.matmul(y_2D)
-
-        # End caching ----------
-
-        Kus = self.kernel(self.Xu, Xnew)
-        Ws = Kus.trtrs(Luu, upper=False)[0]
-        pack = torch.cat((W_Dinv_y, Ws), dim=1)
-        Linv_pack = pack.trtrs(L, upper=False)[0]
-        # unpack
-        Linv_W_Dinv_y = Linv_pack[:, :W_Dinv_y.shape[1]]
-        Linv_Ws = Linv_pack[:, W_Dinv_y.shape[1]:]
-
-        C = Xnew.size(0)
-        loc_shape = self.y.shape[:-1] + (C,)
-        loc = Linv_W_Dinv_y.t().matmul(Linv_Ws).reshape(loc_shape)
-
-        if full_cov:
-            Kss = self.kernel(Xnew).contiguous()
-            if not noiseless:
-                Kss.view(-1)[::C + 1] += self.noise  # add noise to the diagonal
-            Qss = Ws.t().matmul(Ws)
-            cov = Kss - Qss + Linv_Ws.t().matmul(Linv_Ws)
-        else:
-            Kssdiag = self.kernel(Xnew, diag=True)
-            if not noiseless:
-                Kssdiag = Kssdiag + self.noise
-            Qssdiag = Ws.pow(2).sum(dim=0)
-            cov = Kssdiag - Qssdiag + Linv_Ws.pow(2).sum(dim=0)
-
-        cov_shape = self.y.shape[:-1] + (C, C)
-        cov = cov.expand(cov_shape)
-
-        return loc + self.mean_function(Xnew), cov
+        Linv_W_Dinv_y = W_Dinv_y.trtrs(L, upper=False)[0]
+        return Luu, L, Linv_W_Dinv_y
@@ -8,7 +8,7 @@ import pyro
 import pyro.distributions as dist
 from pyro.contrib import autoname
 from pyro.contrib.gp.models.model import GPModel
-from pyro.contrib.gp.util import conditional
+from pyro.contrib.gp.util import _whiten, conditional
 from pyro.distributions.util import eye_like
 
 
@@ -140,6 +140,22 @@ class VariationalGP(GPModel):
         self._check_Xnew_shape(Xnew)
         self.set_mode("guide")
 
-        loc, cov = conditional(Xnew, self.X, self.kernel, self.f_loc, self.f_scale_tril,
-                               full_cov=full_cov, whiten=self.whiten, jitter=self.jitter)
+        Lff, v, S = self._cached(self._posterior_factor, self.jitter, self.whiten)
+        loc, cov = conditional(Xnew, self.X, self.kernel, v, S, Lff,
+                               full_cov=full_cov, whiten=True, jitter=self.jitter,
+                               block_size=self.block_size)
         return loc + self.mean_function(Xnew), cov
+
+    def _posterior_factor(self):
+        """
+        Computes the Cholesky factor ``Lff`` of the kernel matrix and the whitened
+        variational parameters, which are reused in :meth:`forward`.
+        """
+        N = self.X.size(0)
+        Kff = self.kernel(self.X).contiguous()
+        Kff.view(-1)[::N + 1] += self.jitter  # add jitter to the diagonal
+        Lff = Kff.cholesky()
+        if self.whiten:
+            return Lff, self.f_loc, self.f_scale_tril
+        v, S = _whiten(Lff, self.f_loc, self.f_scale_tril)
+        return Lff, v, S
@@ -9,7 +9,7 @@ import pyro.distributions as dist
 import pyro.poutine as poutine
 from pyro.contrib import autoname
 from pyro.contrib.gp.models.model import GPModel
-from pyro.contrib.gp.util import conditional
+from pyro.contrib.gp.util import _whiten, conditional
 from pyro.distributions.util import eye_like
 
 
@@ -44,6 +44,14 @@ class VariationalSparseGP(GPModel):
         of train inputs, :math:`M` is the number of inducing inputs. Size of
         variational parameters is :math:`\mathcal{O}(M^2)`.
 
+    .. note:: The log likelihood term of the ELBO is a sum over data points, so
+        it can be estimated without bias from minibatches. If ``subsample_size`` is
+        set, each call of :meth:`model` evaluates the likelihood on a random minibatch
+        of ``subsample_size`` points and scales it by ``num_data / subsample_size``.
+        Then a training step has :math:`\mathcal{O}(BM^2 + M^3)` complexity, where
+        :math:`B` is ``subsample_size``. Minibatches can also be fed by
+        :meth:`set_data` (see :func:`~pyro.contrib.gp.util.train`).
+
     References:
 
     [1] `Scalable variational Gaussian process classification`,
@@ -76,9 +84,12 @@ class VariationalSparseGP(GPModel):
         flag will help optimization.
     :param float jitter: A small positive term which is added into the diagonal part of
         a covariance matrix to help stablize its Cholesky decomposition.
+    :param int subsample_size: An optional size of random minibatches of training
+        data which are used in each call of :meth:`model`.
     """
     def __init__(self, X, y, kernel, Xu, likelihood, mean_function=None,
-                 latent_shape=None, num_data=None, whiten=False, jitter=1e-6):
+                 latent_shape=None, num_data=None, whiten=False, jitter=1e-6,
+                 subsample_size=None):
         super(VariationalSparseGP, self).__init__(X, y, kernel, mean_function, jitter)
 
         self.likelihood = likelihood
@@ -98,6 +109,7 @@ class VariationalSparseGP(GPModel):
 
         self.num_data = num_data if num_data is not None else self.X.size(0)
         self.whiten = whiten
+        self.subsample_size = subsample_size
         self._sample_latent = True
 
     @autoname.scope(prefix="VSGP")
@@ -120,15 +132,19 @@ class VariationalSparseGP(GPModel):
                         dist.MultivariateNormal(zero_loc, scale_tril=Luu)
                             .to_event(zero_loc.dim() - 1))
 
-        f_loc, f_var = conditional(self.X, self.Xu, self.kernel, self.u_loc, self.u_scale_tril,
+        X, y = self.X, self.y
+        if y is not None:
+            X, y = self._subsample(self.subsample_size)
+
+        f_loc, f_var = conditional(X, self.Xu, self.kernel, self.u_loc, self.u_scale_tril,
                                    Luu, full_cov=False, whiten=self.whiten, jitter=self.jitter)
 
-        f_loc = f_loc + self.mean_function(self.X)
-        if self.y is None:
+        f_loc = f_loc + self.mean_function(X)
+        if y is None:
             return f_loc, f_var
         else:
-            with poutine.scale(scale=self.num_data / self.X.size(0)):
-                return self.likelihood(f_loc, f_var, self.y)
+            with poutine.scale(scale=self.num_data / X.size(0)):
+                return self.likelihood(f_loc, f_var, y)
 
     @autoname.scope(prefix="VSGP")
     def guide(self):
@@ -160,6 +176,22 @@ class VariationalSparseGP(GPModel):
         self._check_Xnew_shape(Xnew)
         self.set_mode("guide")
 
-        loc, cov = conditional(Xnew, self.Xu, self.kernel, self.u_loc, self.u_scale_tril,
-                               full_cov=full_cov, whiten=self.whiten, jitter=self.jitter)
+        Luu, v, S = self._cached(self._posterior_factor, self.jitter, self.whiten)
+        loc, cov = conditional(Xnew, self.Xu, self.kernel, v, S, Luu,
+                               full_cov=full_cov, whiten=True, jitter=self.jitter,
+                               block_size=self.block_size)
         return loc + self.mean_function(Xnew), cov
+
+    def _posterior_factor(self):
+        """
+        Computes the Cholesky factor ``Luu`` of the kernel matrix and the whitened
+        variational parameters, which are reused in :meth:`forward`.
+        """
+        M = self.Xu.size(0)
+        Kuu = self.kernel(self.Xu).contiguous()
+        Kuu.view(-1)[::M + 1] += self.jitter  # add jitter to the diagonal
+        Luu = Kuu.cholesky()
+        if self.whiten:
+            return Luu, self.u_loc, self.u_scale_tril
+        v, S = _whiten(Luu, self.u_loc, self.u_scale_tril)
+        return Luu, v, S
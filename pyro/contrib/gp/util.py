@@ -7,7 +7,7 @@ from pyro.infer.util import torch_backward, torch_item
 
 
 def conditional(Xnew, X, kernel, f_loc, f_scale_tril=None, Lff=None, full_cov=False,
-                whiten=False, jitter=1e-6):
+                whiten=False, jitter=1e-6, block_size=None):
     r"""
     Given :math:`X_{new}`, predicts loc and covariance matrix of the conditional
     multivariate normal distribution
@@ -33,6 +33,10 @@ def conditional(Xnew, X, kernel, f_loc, f_scale_tril=None, Lff=None, full_cov=Fa
     In case ``f_scale_tril`` is not ``None``, we follow the derivation from reference
     [1]. For the case ``f_scale_tril=None``, we follow the popular reference [2].
 
+    When ``full_cov=False``, we can set ``block_size`` to process :math:`X_{new}`
+    in blocks of ``block_size`` points, so cross covariances between :math:`X` and
+    :math:`X_{new}` never need more than :math:`N \times block\_size` memory.
+
     References:
 
     [1] `Sparse GPs: approximate the posterior, not the model
@@ -56,9 +60,24 @@ def conditional(Xnew, X, kernel, f_loc, f_scale_tril=None, Lff=None, full_cov=Fa
         already transformed by the inverse of ``Lff``.
     :param float jitter: A small positive term which is added into the diagonal part of
         a covariance matrix to help stablize its Cholesky decomposition.
+    :param int block_size: An optional maximum number of points of :math:`X_{new}`
+        processed at once. It is ignored if ``full_cov=True``.
     :returns: loc and covariance matrix (or variance) of :math:`p(f^*(X_{new}))`
     :rtype: tuple(torch.Tensor, torch.Tensor)
     """
+    if block_size is not None and not full_cov and Xnew.size(0) > block_size:
+        if Lff is None:
+            N = X.size(0)
+            Kff = kernel(X).contiguous()
+            Kff.view(-1)[::N + 1] += jitter  # add jitter to diagonal
+            Lff = Kff.cholesky()
+        if not whiten:
+            # whiten once instead of for each block
+            f_loc, f_scale_tril = _whiten(Lff, f_loc, f_scale_tril)
+        return _predict_in_blocks(lambda Xnew_block: conditional(Xnew_block, X, kernel, f_loc, f_scale_tril,
+                                                                 Lff, whiten=True, jitter=jitter),
+                                  Xnew, full_cov, block_size)
+
     # p(f* | Xnew, X, kernel, f_loc, f_scale_tril) ~ N(f* | loc, cov)
     # Kff = Lff @ Lff.T
     # v = inv(Lff) @ f_loc  <- whitened f_loc
@@ -146,10 +165,97 @@ def conditional(Xnew, X, kernel, f_loc, f_scale_tril=None, Lff=None, full_cov=Fa
     return (loc, cov) if full_cov else (loc, var)
 
 
-def train(gpmodule, optimizer=None, loss_fn=None, retain_graph=None, num_steps=1000):
+def _predict_in_blocks(predict_fn, Xnew, full_cov, block_size):
+    """
+    Calls ``predict_fn`` on blocks of at most ``block_size`` points of ``Xnew`` and
+    concatenates the returned locs and variances. Full covariance matrices can not
+    be split, so ``predict_fn`` is called on the whole ``Xnew`` if ``full_cov=True``.
+    """
+    # batched inputs have shape batch_shape + (M, input_dim)
+    dim = -2 if Xnew.dim() > 2 else 0
+    if full_cov or block_size is None or Xnew.size(dim) <= block_size:
+        return predict_fn(Xnew)
+    locs, variances = zip(*[predict_fn(Xnew_block) for Xnew_block in Xnew.split(block_size, dim=dim)])
+    return torch.cat(locs, dim=-1), torch.cat(variances, dim=-1)
+
+
+def _whiten(Lff, f_loc, f_scale_tril=None):
+    r"""
+    Transforms variational parameters ``f_loc`` and ``f_scale_tril`` by the inverse
+    of ``Lff``, so that they can be used in :func:`conditional` with ``whiten=True``.
+
+    :param torch.Tensor Lff: Lower triangular decomposition of :math:`kernel(X, X)`.
+    :param torch.Tensor f_loc: Mean of :math:`q(f)`, with shape
+        ``latent_shape + (N,)``.
+    :param torch.Tensor f_scale_tril: Lower triangular decomposition of covariance
+        matrix of :math:`q(f)`, with shape ``latent_shape + (N, N)`` (optional).
+    :returns: whitened ``f_loc`` and ``f_scale_tril``
+    :rtype: tuple(torch.Tensor, torch.Tensor)
+    """
+    N = Lff.size(0)
+    latent_shape = f_loc.shape[:-1]
+    # pack f_loc and f_scale_tril into a 2D tensor with first dimension N
+    f_loc_2D = f_loc.permute(-1, *range(len(latent_shape))).reshape(N, -1)
+    pack = f_loc_2D
+    if f_scale_tril is not None:
+        f_scale_tril_2D = f_scale_tril.permute(-2, -1, *range(len(latent_shape))).reshape(N, -1)
+        pack = torch.cat((pack, f_scale_tril_2D), dim=1)
+
+    Lffinv_pack = pack.trtrs(Lff, upper=False)[0]
+    # unpack
+    v = Lffinv_pack[:, :f_loc_2D.size(1)].reshape((N,) + latent_shape)
+    v = v.permute(list(range(1, v.dim())) + [0])
+    if f_scale_tril is None:
+        return v, None
+    S = Lffinv_pack[:, f_loc_2D.size(1):].reshape((N, N) + latent_shape)
+    S = S.permute(list(range(2, S.dim())) + [0, 1])
+    return v, S
+
+
+def minibatches(X, y=None, batch_size=1024, shuffle=True):
+    """
+    Iterates over minibatches of a training dataset once (one epoch).
+
+    Example::
+
+        >>> for epoch in range(num_epochs):  # doctest: +SKIP
+        ...     for X_batch, y_batch in minibatches(X, y, batch_size=1000):
+        ...         vsgp.set_data(X_batch, y_batch)
+        ...         ...
+
+    :param torch.Tensor X: Input data. Its first dimension is the number of data
+        points.
+    :param torch.Tensor y: Output data (optional). Its last dimension is the number
+        of data points.
+    :param int batch_size: Number of data points of each minibatch. The last
+        minibatch might be smaller.
+    :param bool shuffle: A flag to decide if data points are visited in a random
+        order.
+    :returns: a generator of pairs ``(X_batch, y_batch)``
+    """
+    N = X.size(0)
+    if shuffle:
+        indices = torch.randperm(N, device=X.device)
+    for i in range(0, N, batch_size):
+        if shuffle:
+            idx = indices[i:i + batch_size]
+            yield X[idx], (None if y is None else y[..., idx])
+        else:
+            yield X[i:i + batch_size], (None if y is None else y[..., i:i + batch_size])
+
+
+def train(gpmodule, optimizer=None, loss_fn=None, retain_graph=None, num_steps=1000,
+          batch_size=None):
     """
     A helper to optimize parameters for a GP module.
 
+    If ``batch_size`` is given, each step is taken on a minibatch of the training
+    data, which is set by :meth:`~pyro.contrib.gp.models.model.GPModel.set_data`
+    (see :func:`minibatches`). The full training data is restored after training.
+    This requires a model whose log likelihood is scaled by the size ``num_data`` of
+    the full dataset, such as :class:`~pyro.contrib.gp.models.VariationalSparseGP`
+    or :class:`~pyro.contrib.gp.models.SparseGPRegression`.
+
     :param ~pyro.contrib.gp.models.GPModel gpmodule: A GP module.
     :param ~torch.optim.Optimizer optimizer: A PyTorch optimizer instance.
         By default, we use Adam with ``lr=0.01``.
@@ -158,6 +264,7 @@ def train(gpmodule, optimizer=None, loss_fn=None, retain_graph=None, num_steps=1
         By default, ``loss_fn=TraceMeanField_ELBO().differentiable_loss``.
     :param bool retain_graph: An optional flag of ``torch.autograd.backward``.
     :param int num_steps: Number of steps to run SVI.
+    :param int batch_size: An optional number of data points of each minibatch.
     :returns: a list of losses during the training procedure
     :rtype: list
     """
@@ -172,8 +279,26 @@ def train(gpmodule, optimizer=None, loss_fn=None, retain_graph=None, num_steps=1
         torch_backward(loss, retain_graph)
         return loss
 
+    if batch_size is None:
+        losses = []
+        for i in range(num_steps):
+            loss = optimizer.step(closure)
+            losses.append(torch_item(loss))
+        return losses
+
+    if not hasattr(gpmodule, "num_data"):
+        raise ValueError("Minibatch training requires a model with `num_data` attribute, "
+                         "but got {}.".format(type(gpmodule).__name__))
+    X, y = gpmodule.X, gpmodule.y
     losses = []
-    for i in range(num_steps):
-        loss = optimizer.step(closure)
-        losses.append(torch_item(loss))
+    try:
+        while len(losses) < num_steps:
+            for X_batch, y_batch in minibatches(X, y, batch_size):
+                gpmodule.set_data(X_batch, y_batch)
+                loss = optimizer.step(closure)
+                losses.append(torch_item(loss))
+                if len(losses) == num_steps:
+                    break
+    finally:
+        gpmodule.set_data(X, y)
     return losses
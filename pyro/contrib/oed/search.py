@@ -18,7 +18,7 @@ class Search(TracePosterior):
         super(Search, self).__init__(**kwargs)
 
     def _traces(self, *args, **kwargs):
-        q = queue.Queue()
+        q = queue.LifoQueue()
         q.put(poutine.Trace())
         p = poutine.trace(
             poutine.queue(self.model, queue=q, max_tries=self.max_tries))
@@ -0,0 +1,31 @@
+r"""
+The :mod:`pyro.contrib.serving` module provides an :mod:`asyncio` front end
+for serving posterior queries, e.g. amortized guide outputs or posterior
+predictive samples, behind an RPC endpoint.
+
+Requests typically concern a single datum, whereas Pyro models and guides are
+much cheaper to run once along a :class:`~pyro.plate` batch dimension. The
+:class:`~pyro.contrib.serving.batching.BatchingServer` coalesces concurrent
+requests into one vectorized call and scatters the results back::
+
+    def predict(x):
+        # x has shape (batch_size, x_dim)
+        with pyro.plate("data", x.size(0)):
+            return guide(x)
+
+    server = BatchingServer(predict, max_batch_size=64, max_latency=0.002)
+
+    async def main(requests):
+        async with server:
+            return await asyncio.gather(*[server.submit(x) for x in requests])
+
+.. note:: This module requires Python 3.5 or later.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+from pyro.contrib.serving.batching import BatchingServer
+
+__all__ = [
+    "BatchingServer",
+]
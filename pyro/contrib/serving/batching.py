@@ -0,0 +1,177 @@
+from __future__ import absolute_import, division, print_function
+
+import asyncio
+
+import torch
+
+
+def _unstack(value, index, dim):
+    """
+    Selects the ``index``-th entry along ``dim`` of every tensor in a
+    (possibly nested) tuple, list or dict. Non-tensor leaves are shared
+    among all requests of the batch.
+    """
+    if torch.is_tensor(value):
+        return value.select(dim, index)
+    if isinstance(value, dict):
+        return type(value)((k, _unstack(v, index, dim)) for k, v in value.items())
+    if isinstance(value, (tuple, list)):
+        return type(value)(_unstack(v, index, dim) for v in value)
+    return value
+
+
+class BatchingServer(object):
+    """
+    An :mod:`asyncio` front end that coalesces concurrent single-datum
+    requests into one call of a batched function.
+
+    A batch is dispatched as soon as ``max_batch_size`` requests are pending,
+    or ``max_latency`` seconds after its first request arrived, whichever
+    happens first. The positional arguments of the requests in a batch are
+    stacked along ``dim``, so all requests must pass tensors of identical
+    shapes. The batched function should run the model or guide inside a
+    :class:`~pyro.plate` of size ``batch_size`` and return a tensor (or a
+    nested tuple, list or dict of tensors) whose ``dim``-th dimension is the
+    batch dimension; this is split back into one result per request.
+
+    Example::
+
+        server = BatchingServer(predict, max_batch_size=64, max_latency=0.002)
+        async with server:
+            y1, y2 = await asyncio.gather(server.submit(x1), server.submit(x2))
+
+    :param callable fn: A batched function.
+    :param int max_batch_size: The maximum number of requests per call to
+        ``fn``. Larger values trade latency for throughput.
+    :param float max_latency: The maximum time in seconds that a request
+        waits for further requests before its batch is dispatched.
+    :param int dim: The dimension along which inputs are stacked and outputs
+        are split. Defaults to 0.
+    :param executor: An optional :class:`concurrent.futures.Executor` in which
+        to run ``fn``. This allows the event loop to keep accepting requests
+        while a batch is being computed. By default ``fn`` runs inline on the
+        event loop.
+    """
+    def __init__(self, fn, max_batch_size=32, max_latency=0.005, dim=0, executor=None):
+        if max_batch_size < 1:
+            raise ValueError("Expected max_batch_size >= 1, actual {}".format(max_batch_size))
+        if max_latency < 0:
+            raise ValueError("Expected max_latency >= 0, actual {}".format(max_latency))
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.dim = dim
+        self.executor = executor
+        self.num_requests = 0
+        self.num_batches = 0
+        self._pending = []
+        self._timer = None
+        self._wakeup = None
+        self._task = None
+        self._closing = False
+
+    @property
+    def mean_batch_size(self):
+        """
+        The average number of requests per dispatched batch.
+        """
+        return self.num_requests / max(self.num_batches, 1)
+
+    @property
+    def running(self):
+        return self._task is not None and not self._closing
+
+    async def start(self):
+        """
+        Starts the background task that dispatches batches.
+        """
+        if self._task is not None:
+            raise RuntimeError("BatchingServer is already running")
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """
+        Flushes all pending requests and stops the background task.
+        """
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await self._task
+        finally:
+            self._task = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    async def submit(self, *args):
+        """
+        Submits a single request and waits for its result.
+
+        :param args: Per-request arguments to ``fn``, without the batch
+            dimension.
+        :return: The ``fn`` result for this request.
+        """
+        if not self.running:
+            raise RuntimeError("BatchingServer is not running, call .start() first")
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending.append((args, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._wakeup.set()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_latency, self._wakeup.set)
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            # Leftover requests open a new batching window.
+            if self._pending:
+                if self._closing or len(self._pending) >= self.max_batch_size:
+                    self._wakeup.set()
+                else:
+                    self._timer = loop.call_later(self.max_latency, self._wakeup.set)
+
+            if batch:
+                await self._dispatch(batch)
+            if self._closing and not self._pending:
+                break
+
+    async def _dispatch(self, batch):
+        try:
+            args = [torch.stack([torch.as_tensor(arg) for arg in column], dim=self.dim)
+                    for column in zip(*[request_args for request_args, _ in batch])]
+            if self.executor is None:
+                result = self.fn(*args)
+            else:
+                loop = asyncio.get_event_loop()
+                result = await loop.run_in_executor(self.executor, lambda: self.fn(*args))
+            results = [_unstack(result, i, self.dim) for i in range(len(batch))]
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.num_requests += len(batch)
+            self.num_batches += 1
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -3,6 +3,7 @@ from __future__ import absolute_import, division, print_function
 import itertools
 import math
 import numbers
+from collections import namedtuple
 
 import torch
 
@@ -23,6 +24,46 @@ def _exp(value):
     return value.exp()
 
 
+class BPInfo(namedtuple('BPInfo', ['messages', 'num_iters', 'residual'])):
+    """
+    Diagnostics of a run of belief propagation.
+
+    :ivar tuple messages: the final messages, which can be passed as ``bp_init``
+        to warm start belief propagation on a similar problem, e.g. the next
+        frame of a streaming tracker.
+    :ivar int num_iters: the number of iterations that were run.
+    :ivar float residual: the largest absolute change of any message (in
+        log-odds space) during the final iteration.
+    """
+    __slots__ = ()
+
+
+def _run_bp(update, messages, bp_iters, bp_tol):
+    """
+    Iterates ``messages = update(messages, i)`` for at most ``bp_iters``
+    iterations, stopping early once no message changes by more than ``bp_tol``.
+    For batched problems, iteration continues until all problems have converged.
+    """
+    residual = float('inf')
+    for i in range(bp_iters):
+        new_messages = update(messages, i)
+        if bp_tol is not None or i == bp_iters - 1:
+            residual = max((new - old).abs().max().item() for new, old in zip(new_messages, messages))
+        messages = new_messages
+        if bp_tol is not None and residual <= bp_tol:
+            return messages, BPInfo(messages, i + 1, residual)
+    return messages, BPInfo(messages, bp_iters, residual)
+
+
+def _init_messages(bp_init, shapes, like):
+    if bp_init is None:
+        return tuple(like.new_zeros(shape) for shape in shapes)
+    assert len(bp_init) == len(shapes)
+    for message, shape in zip(bp_init, shapes):
+        assert message.shape == shape, (message.shape, shape)
+    return tuple(bp_init)
+
+
 class MarginalAssignment(object):
     """
     Computes marginal data associations between objects and detections.
@@ -40,6 +81,14 @@ class MarginalAssignment(object):
         associates with a single object.
     :param int bp_iters: optional number of belief propagation iterations. If
         unspecified or ``None`` an expensive exact algorithm will be used.
+    :param float bp_tol: optional tolerance to stop belief propagation early,
+        once no message changes by more than ``bp_tol`` in an iteration.
+    :param tuple bp_init: optional messages to warm start belief propagation,
+        typically the ``.bp_info.messages`` of a previous solver.
+
+    When using belief propagation, a batch of independent problems can be solved
+    at once by passing ``exists_logits`` of shape ``batch_shape + (num_objects,)``
+    and ``assign_logits`` of shape ``batch_shape + (num_detections, num_objects)``.
 
     :ivar int num_detections: the number of detections
     :ivar int num_objects: the number of (potentially existing) objects
@@ -50,12 +99,15 @@ class MarginalAssignment(object):
         associates.  This has ``.event_shape == (num_objects + 1,)`` where the
         final element denotes spurious detection, and
         ``.batch_shape == (num_frames, num_detections)``.
+    :ivar BPInfo bp_info: diagnostics of belief propagation, or ``None`` if
+        the exact algorithm was used.
     """
-    def __init__(self, exists_logits, assign_logits, bp_iters=None):
-        assert exists_logits.dim() == 1, exists_logits.shape
-        assert assign_logits.dim() == 2, assign_logits.shape
+    def __init__(self, exists_logits, assign_logits, bp_iters=None, bp_tol=None, bp_init=None):
+        assert exists_logits.dim() >= 1, exists_logits.shape
+        assert assign_logits.dim() == exists_logits.dim() + 1, assign_logits.shape
+        assert assign_logits.shape[:-2] == exists_logits.shape[:-1]
         assert assign_logits.shape[-1] == exists_logits.shape[-1]
-        self.num_detections, self.num_objects = assign_logits.shape
+        self.num_detections, self.num_objects = assign_logits.shape[-2:]
 
         # Clamp to avoid NANs.
         exists_logits = exists_logits.clamp(min=-40, max=40)
@@ -63,9 +115,12 @@ class MarginalAssignment(object):
 
         # This does all the work.
         if bp_iters is None:
+            assert exists_logits.dim() == 1, 'batching requires belief propagation'
             exists, assign = compute_marginals(exists_logits, assign_logits)
+            self.bp_info = None
         else:
-            exists, assign = compute_marginals_bp(exists_logits, assign_logits, bp_iters)
+            exists, assign, self.bp_info = compute_marginals_bp(
+                exists_logits, assign_logits, bp_iters, bp_tol, bp_init, return_info=True)
 
         # Wrap the results in Distribution objects.
         # This adds a final logit=0 element denoting spurious detection.
@@ -89,6 +144,14 @@ class MarginalAssignmentSparse(object):
         edge denotes that a given detection associates with a single object.
     :param int bp_iters: optional number of belief propagation iterations. If
         unspecified or ``None`` an expensive exact algorithm will be used.
+    :param float bp_tol: optional tolerance to stop belief propagation early,
+        once no message changes by more than ``bp_tol`` in an iteration.
+    :param tuple bp_init: optional messages to warm start belief propagation,
+        typically the ``.bp_info.messages`` of a previous solver.
+
+    A batch of independent problems sharing the same ``edges`` can be solved at
+    once by passing ``exists_logits`` of shape ``batch_shape + (num_objects,)``
+    and ``assign_logits`` of shape ``batch_shape + (num_edges,)``.
 
     :ivar int num_detections: the number of detections
     :ivar int num_objects: the number of (potentially existing) objects
@@ -99,12 +162,14 @@ class MarginalAssignmentSparse(object):
         associates.  This has ``.event_shape == (num_objects + 1,)`` where the
         final element denotes spurious detection, and
         ``.batch_shape == (num_frames, num_detections)``.
+    :ivar BPInfo bp_info: diagnostics of belief propagation.
     """
-    def __init__(self, num_objects, num_detections, edges, exists_logits, assign_logits, bp_iters):
+    def __init__(self, num_objects, num_detections, edges, exists_logits, assign_logits, bp_iters,
+                 bp_tol=None, bp_init=None):
         assert edges.dim() == 2, edges.shape
         assert edges.shape[0] == 2, edges.shape
-        assert exists_logits.shape == (num_objects,), exists_logits.shape
-        assert assign_logits.shape == edges.shape[1:], assign_logits.shape
+        assert exists_logits.shape[-1:] == (num_objects,), exists_logits.shape
+        assert assign_logits.shape == exists_logits.shape[:-1] + edges.shape[1:], assign_logits.shape
         self.num_objects = num_objects
         self.num_detections = num_detections
         self.edges = edges
@@ -114,14 +179,16 @@ class MarginalAssignmentSparse(object):
         assign_logits = assign_logits.clamp(min=-40, max=40)
 
         # This does all the work.
-        exists, assign = compute_marginals_sparse_bp(
-            num_objects, num_detections, edges, exists_logits, assign_logits, bp_iters)
+        exists, assign, self.bp_info = compute_marginals_sparse_bp(
+            num_objects, num_detections, edges, exists_logits, assign_logits, bp_iters,
+            bp_tol, bp_init, return_info=True)
 
         # Wrap the results in Distribution objects.
         # This adds a final logit=0 element denoting spurious detection.
-        padded_assign = assign.new_empty(num_detections, num_objects + 1).fill_(-float('inf'))
-        padded_assign[:, -1] = 0
-        padded_assign[edges[0], edges[1]] = assign
+        batch_shape = exists_logits.shape[:-1]
+        padded_assign = assign.new_empty(batch_shape + (num_detections, num_objects + 1)).fill_(-float('inf'))
+        padded_assign[..., -1] = 0
+        padded_assign[..., edges[0], edges[1]] = assign
         self.assign_dist = dist.Categorical(logits=padded_assign)
         self.exists_dist = dist.Bernoulli(logits=exists)
 
@@ -151,6 +218,15 @@ class MarginalAssignmentPersistent(object):
         unspecified or ``None`` an expensive exact algorithm will be used.
     :param float bp_momentum: optional momentum to use for belief propagation.
         Should be in the interval ``[0,1)``.
+    :param float bp_tol: optional tolerance to stop belief propagation early,
+        once no message changes by more than ``bp_tol`` in an iteration.
+    :param tuple bp_init: optional messages to warm start belief propagation,
+        typically the ``.bp_info.messages`` of a previous solver.
+
+    When using belief propagation, a batch of independent problems can be solved
+    at once by passing ``exists_logits`` of shape ``batch_shape + (num_objects,)``
+    and ``assign_logits`` of shape
+    ``batch_shape + (num_frames, num_detections, num_objects)``.
 
     :ivar int num_frames: the number of time frames
     :ivar int num_detections: the (maximum) number of detections per frame
@@ -162,12 +238,17 @@ class MarginalAssignmentPersistent(object):
         associates.  This has ``.event_shape == (num_objects + 1,)`` where the
         final element denotes spurious detection, and
         ``.batch_shape == (num_frames, num_detections)``.
+    :ivar BPInfo bp_info: diagnostics of belief propagation, or ``None`` if
+        the exact algorithm was used.
     """
-    def __init__(self, exists_logits, assign_logits, bp_iters=None, bp_momentum=0.5):
-        assert exists_logits.dim() == 1, exists_logits.shape
-        assert assign_logits.dim() == 3, assign_logits.shape
+    def __init__(self, exists_logits, assign_logits, bp_iters=None, bp_momentum=0.5,
+                 bp_tol=None, bp_init=None):
+        assert exists_logits.dim() >= 1, exists_logits.shape
+        assert assign_logits.dim() == exists_logits.dim() + 2, assign_logits.shape
+        assert assign_logits.shape[:-3] == exists_logits.shape[:-1]
         assert assign_logits.shape[-1] == exists_logits.shape[-1]
-        self.num_frames, self.num_detections, self.num_objects = assign_logits.shape
+        self.num_frames, self.num_detections, self.num_objects = assign_logits.shape[-3:]
+        batch_shape = exists_logits.shape[:-1]
 
         # Clamp to avoid NANs.
         exists_logits = exists_logits.clamp(min=-40, max=40)
@@ -175,18 +256,90 @@ class MarginalAssignmentPersistent(object):
 
         # This does all the work.
         if bp_iters is None:
+            assert not batch_shape, 'batching requires belief propagation'
             exists, assign = compute_marginals_persistent(exists_logits, assign_logits)
+            self.bp_info = None
         else:
-            exists, assign = compute_marginals_persistent_bp(
-                exists_logits, assign_logits, bp_iters, bp_momentum)
+            exists, assign, self.bp_info = compute_marginals_persistent_bp(
+                exists_logits, assign_logits, bp_iters, bp_momentum, bp_tol, bp_init, return_info=True)
 
         # Wrap the results in Distribution objects.
         # This adds a final logit=0 element denoting spurious detection.
         padded_assign = torch.nn.functional.pad(assign, (0, 1), "constant", 0.0)
         self.assign_dist = dist.Categorical(logits=padded_assign)
         self.exists_dist = dist.Bernoulli(logits=exists)
-        assert self.assign_dist.batch_shape == (self.num_frames, self.num_detections)
-        assert self.exists_dist.batch_shape == (self.num_objects,)
+        assert self.assign_dist.batch_shape == batch_shape + (self.num_frames, self.num_detections)
+        assert self.exists_dist.batch_shape == batch_shape + (self.num_objects,)
+
+
+class MarginalAssignmentSparsePersistent(object):
+    """
+    A sparse version of :class:`MarginalAssignmentPersistent`, whose cost is
+    linear in the number of feasible (frame, detection, object) edges.
+
+    :param int num_objects: the number of (potentially existing) objects
+    :param int num_frames: the number of time frames
+    :param int num_detections: the (maximum) number of detections per frame
+    :param torch.LongTensor edges: a ``[3, num_edges]``-shaped tensor of
+        (frame, detection, object) index triples specifying feasible
+        associations.
+    :param torch.Tensor exists_logits: a tensor of shape ``[num_objects]``
+        representing per-object factors for existence of each potential object.
+    :param torch.Tensor assign_logits: a tensor of shape ``[num_edges]``
+        representing per-edge factors of assignment probability, where each
+        edge denotes that at a given time frame a given detection associates
+        with a single object.
+    :param int bp_iters: number of belief propagation iterations.
+    :param float bp_momentum: optional momentum to use for belief propagation.
+        Should be in the interval ``[0,1)``.
+    :param float bp_tol: optional tolerance to stop belief propagation early,
+        once no message changes by more than ``bp_tol`` in an iteration.
+    :param tuple bp_init: optional messages to warm start belief propagation,
+        typically the ``.bp_info.messages`` of a previous solver.
+
+    A batch of independent problems sharing the same ``edges`` can be solved at
+    once by passing ``exists_logits`` of shape ``batch_shape + (num_objects,)``
+    and ``assign_logits`` of shape ``batch_shape + (num_edges,)``.
+
+    :ivar int num_frames: the number of time frames
+    :ivar int num_detections: the (maximum) number of detections per frame
+    :ivar int num_objects: the number of (potentially existing) objects
+    :ivar pyro.distributions.Bernoulli exists_dist: a mean field posterior
+        distribution over object existence.
+    :ivar torch.Tensor assign_logits: posterior logits of each edge, relative
+        to a logit of zero for spurious detection.
+    :ivar torch.Tensor assign_probs: posterior probability of each edge, i.e.
+        that the edge's detection associates with the edge's object.
+    :ivar BPInfo bp_info: diagnostics of belief propagation.
+    """
+    def __init__(self, num_objects, num_frames, num_detections, edges, exists_logits, assign_logits, bp_iters,
+                 bp_momentum=0.5, bp_tol=None, bp_init=None):
+        assert edges.dim() == 2, edges.shape
+        assert edges.shape[0] == 3, edges.shape
+        assert exists_logits.shape[-1:] == (num_objects,), exists_logits.shape
+        assert assign_logits.shape == exists_logits.shape[:-1] + edges.shape[1:], assign_logits.shape
+        self.num_objects = num_objects
+        self.num_frames = num_frames
+        self.num_detections = num_detections
+        self.edges = edges
+
+        # Clamp to avoid NANs.
+        exists_logits = exists_logits.clamp(min=-40, max=40)
+        assign_logits = assign_logits.clamp(min=-40, max=40)
+
+        # This does all the work.
+        exists, assign, self.bp_info = compute_marginals_sparse_persistent_bp(
+            num_objects, num_frames, num_detections, edges, exists_logits, assign_logits,
+            bp_iters, bp_momentum, bp_tol, bp_init, return_info=True)
+
+        # Normalize over the edges of each detection, and spurious detection.
+        self.exists_dist = dist.Bernoulli(logits=exists)
+        self.assign_logits = assign
+        detection_index = torch.unique(edges[0] * num_detections + edges[1], sorted=True, return_inverse=True)[1]
+        odds = assign.exp()
+        total = odds.new_zeros(odds.shape[:-1] + (edges.size(1),))
+        total = total.scatter_add_(-1, detection_index.expand(odds.shape), odds)
+        self.assign_probs = odds / (1 + total[..., detection_index])
 
 
 def compute_marginals(exists_logits, assign_logits):
@@ -221,71 +374,93 @@ def compute_marginals(exists_logits, assign_logits):
     return exists, assign
 
 
-def compute_marginals_bp(exists_logits, assign_logits, bp_iters):
+def compute_marginals_bp(exists_logits, assign_logits, bp_iters, bp_tol=None, bp_init=None,
+                         return_info=False):
     """
     This implements approximate inference of pairwise marginals via
     loopy belief propagation, adapting the approach of [1].
 
     See :class:`MarginalAssignment` for args and problem description.
 
+    :param bool return_info: whether to additionally return a :class:`BPInfo`.
+
     [1] Jason L. Williams, Roslyn A. Lau (2014)
         Approximate evaluation of marginal association probabilities with
         belief propagation
         https://arxiv.org/abs/1209.6299
     """
-    message_e_to_a = exists_logits.new_zeros(assign_logits.shape)
-    message_a_to_e = exists_logits.new_zeros(assign_logits.shape)
-    for i in range(bp_iters):
-        message_e_to_a = -(message_a_to_e - message_a_to_e.sum(0, True) - exists_logits).exp().log1p()
+    exists_factor = exists_logits.unsqueeze(-2)
+
+    def update(messages, i):
+        message_e_to_a, message_a_to_e = messages
+        message_e_to_a = -(message_a_to_e - message_a_to_e.sum(-2, True) - exists_factor).exp().log1p()
         joint = (assign_logits + message_e_to_a).exp()
-        message_a_to_e = (assign_logits - torch.log1p(joint.sum(1, True) - joint)).exp().log1p()
+        message_a_to_e = (assign_logits - torch.log1p(joint.sum(-1, True) - joint)).exp().log1p()
         warn_if_nan(message_e_to_a, 'message_e_to_a iter {}'.format(i))
         warn_if_nan(message_a_to_e, 'message_a_to_e iter {}'.format(i))
+        return message_e_to_a, message_a_to_e
+
+    messages = _init_messages(bp_init, [assign_logits.shape] * 2, assign_logits)
+    messages, info = _run_bp(update, messages, bp_iters, bp_tol)
+    message_e_to_a, message_a_to_e = messages
 
     # Convert from probs to logits.
-    exists = exists_logits + message_a_to_e.sum(0)
+    exists = exists_logits + message_a_to_e.sum(-2)
     assign = assign_logits + message_e_to_a
     warn_if_nan(exists, 'exists')
     warn_if_nan(assign, 'assign')
+    if return_info:
+        return exists, assign, info
     return exists, assign
 
 
 def compute_marginals_sparse_bp(num_objects, num_detections, edges,
-                                exists_logits, assign_logits, bp_iters):
+                                exists_logits, assign_logits, bp_iters, bp_tol=None, bp_init=None,
+                                return_info=False):
     """
     This implements approximate inference of pairwise marginals via
     loopy belief propagation, adapting the approach of [1].
 
     See :class:`MarginalAssignmentSparse` for args and problem description.
 
+    :param bool return_info: whether to additionally return a :class:`BPInfo`.
+
     [1] Jason L. Williams, Roslyn A. Lau (2014)
         Approximate evaluation of marginal association probabilities with
         belief propagation
         https://arxiv.org/abs/1209.6299
     """
-    exists_factor = exists_logits[edges[1]]
+    exists_factor = exists_logits[..., edges[1]]
 
     def sparse_sum(x, dim, keepdim=False):
         assert dim in (0, 1)
-        x = x.new_zeros([num_objects, num_detections][dim]).scatter_add_(0, edges[1 - dim], x)
+        index = edges[1 - dim]
+        size = [num_objects, num_detections][dim]
+        x = x.new_zeros(x.shape[:-1] + (size,)).scatter_add_(-1, index.expand(x.shape), x)
         if keepdim:
-            x = x[edges[1 - dim]]
+            x = x[..., index]
         return x
 
-    message_e_to_a = exists_logits.new_zeros(assign_logits.shape)
-    message_a_to_e = exists_logits.new_zeros(assign_logits.shape)
-    for i in range(bp_iters):
+    def update(messages, i):
+        message_e_to_a, message_a_to_e = messages
         message_e_to_a = -(message_a_to_e - sparse_sum(message_a_to_e, 0, True) - exists_factor).exp().log1p()
         joint = (assign_logits + message_e_to_a).exp()
         message_a_to_e = (assign_logits - torch.log1p(sparse_sum(joint, 1, True) - joint)).exp().log1p()
         warn_if_nan(message_e_to_a, 'message_e_to_a iter {}'.format(i))
         warn_if_nan(message_a_to_e, 'message_a_to_e iter {}'.format(i))
+        return message_e_to_a, message_a_to_e
+
+    messages = _init_messages(bp_init, [assign_logits.shape] * 2, assign_logits)
+    messages, info = _run_bp(update, messages, bp_iters, bp_tol)
+    message_e_to_a, message_a_to_e = messages
 
     # Convert from probs to logits.
     exists = exists_logits + sparse_sum(message_a_to_e, 0)
     assign = assign_logits + message_e_to_a
     warn_if_nan(exists, 'exists')
     warn_if_nan(assign, 'assign')
+    if return_info:
+        return exists, assign, info
     return exists, assign
 
 
@@ -338,13 +513,16 @@ def compute_marginals_persistent(exists_logits, assign_logits):
     return exists, assign
 
 
-def compute_marginals_persistent_bp(exists_logits, assign_logits, bp_iters, bp_momentum=0.5):
+def compute_marginals_persistent_bp(exists_logits, assign_logits, bp_iters, bp_momentum=0.5,
+                                    bp_tol=None, bp_init=None, return_info=False):
     """
     This implements approximate inference of pairwise marginals via
     loopy belief propagation, adapting the approach of [1], [2].
 
     See :class:`MarginalAssignmentPersistent` for args and problem description.
 
+    :param bool return_info: whether to additionally return a :class:`BPInfo`.
+
     [1] Jason L. Williams, Roslyn A. Lau (2014)
         Approximate evaluation of marginal association probabilities with
         belief propagation
@@ -362,32 +540,114 @@ def compute_marginals_persistent_bp(exists_logits, assign_logits, bp_iters, bp_m
     # Only assign = a and exists = e are returned.
     assert 0 <= bp_momentum < 1, bp_momentum
     old, new = bp_momentum, 1 - bp_momentum
-    num_frames, num_detections, num_objects = assign_logits.shape
-    message_b_to_a = assign_logits.new_zeros(num_frames, num_detections, num_objects)
-    message_a_to_b = assign_logits.new_zeros(num_frames, num_detections, num_objects)
-    message_b_to_e = assign_logits.new_zeros(num_frames, num_objects)
-    message_e_to_b = assign_logits.new_zeros(num_frames, num_objects)
+    batch_shape = exists_logits.shape[:-1]
+    num_frames, num_detections, num_objects = assign_logits.shape[-3:]
+    exists_factor = exists_logits.unsqueeze(-2)
 
-    for i in range(bp_iters):
+    def update(messages, i):
+        message_b_to_a, message_a_to_b, message_b_to_e, message_e_to_b = messages
+        odds_a = (assign_logits + message_b_to_a).exp()
+        message_a_to_b = (old * message_a_to_b +
+                          new * (assign_logits - (odds_a.sum(-1, True) - odds_a).log1p()))
+        message_b_to_e = (old * message_b_to_e +
+                          new * message_a_to_b.exp().sum(-2).log1p())
+        message_e_to_b = (old * message_e_to_b +
+                          new * (exists_factor + message_b_to_e.sum(-2, True) - message_b_to_e))
+        odds_b = message_a_to_b.exp()
+        message_b_to_a = (old * message_b_to_a -
+                          new * ((-message_e_to_b).exp().unsqueeze(-2) + (1 + odds_b.sum(-2, True) - odds_b)).log())
+
+        warn_if_nan(message_a_to_b, 'message_a_to_b iter {}'.format(i))
+        warn_if_nan(message_b_to_e, 'message_b_to_e iter {}'.format(i))
+        warn_if_nan(message_e_to_b, 'message_e_to_b iter {}'.format(i))
+        warn_if_nan(message_b_to_a, 'message_b_to_a iter {}'.format(i))
+        return message_b_to_a, message_a_to_b, message_b_to_e, message_e_to_b
+
+    shapes = [batch_shape + (num_frames, num_detections, num_objects)] * 2
+    shapes += [batch_shape + (num_frames, num_objects)] * 2
+    messages = _init_messages(bp_init, shapes, assign_logits)
+    messages, info = _run_bp(update, messages, bp_iters, bp_tol)
+    message_b_to_a, message_a_to_b, message_b_to_e, message_e_to_b = messages
+
+    # Convert from probs to logits.
+    exists = exists_logits + message_b_to_e.sum(-2)
+    assign = assign_logits + message_b_to_a
+    warn_if_nan(exists, 'exists')
+    warn_if_nan(assign, 'assign')
+    if return_info:
+        return exists, assign, info
+    return exists, assign
+
+
+def compute_marginals_sparse_persistent_bp(num_objects, num_frames, num_detections, edges,
+                                           exists_logits, assign_logits, bp_iters, bp_momentum=0.5,
+                                           bp_tol=None, bp_init=None, return_info=False):
+    """
+    This implements approximate inference of pairwise marginals via
+    loopy belief propagation, adapting the approach of [1], [2].
+
+    See :class:`MarginalAssignmentSparsePersistent` for args and problem
+    description, and :func:`compute_marginals_persistent_bp` for the dense
+    version of this algorithm.
+
+    :param bool return_info: whether to additionally return a :class:`BPInfo`.
+
+    [1] Jason L. Williams, Roslyn A. Lau (2014)
+        Approximate evaluation of marginal association probabilities with
+        belief propagation
+        https://arxiv.org/abs/1209.6299
+    [2] Ryan Turner, Steven Bottone, Bhargav Avasarala (2014)
+        A Complete Variational Tracker
+        https://papers.nips.cc/paper/5572-a-complete-variational-tracker.pdf
+    """
+    # Messages between a and b live on edges, and messages between b and e live
+    # on those (frame, object) pairs which have at least one edge; all other
+    # messages of the dense algorithm are constant and do not contribute.
+    assert 0 <= bp_momentum < 1, bp_momentum
+    old, new = bp_momentum, 1 - bp_momentum
+    batch_shape = exists_logits.shape[:-1]
+    frame, detection, obj = edges
+    a_index = torch.unique(frame * num_detections + detection, sorted=True, return_inverse=True)[1]
+    b_keys, b_index = torch.unique(frame * num_objects + obj, sorted=True, return_inverse=True)
+    b_object = b_keys % num_objects
+    num_edges, num_pairs = edges.size(1), b_keys.size(0)
+    exists_factor = exists_logits[..., b_object]
+
+    def segment_sum(x, index, size):
+        return x.new_zeros(x.shape[:-1] + (size,)).scatter_add_(-1, index.expand(x.shape), x)
+
+    def update(messages, i):
+        message_b_to_a, message_a_to_b, message_b_to_e, message_e_to_b = messages
         odds_a = (assign_logits + message_b_to_a).exp()
+        odds_a_sum = segment_sum(odds_a, a_index, num_edges)[..., a_index]
         message_a_to_b = (old * message_a_to_b +
-                          new * (assign_logits - (odds_a.sum(2, True) - odds_a).log1p()))
+                          new * (assign_logits - (odds_a_sum - odds_a).log1p()))
         message_b_to_e = (old * message_b_to_e +
-                          new * message_a_to_b.exp().sum(1).log1p())
+                          new * segment_sum(message_a_to_b.exp(), b_index, num_pairs).log1p())
+        message_b_to_e_sum = segment_sum(message_b_to_e, b_object, num_objects)[..., b_object]
         message_e_to_b = (old * message_e_to_b +
-                          new * (exists_logits + message_b_to_e.sum(0) - message_b_to_e))
+                          new * (exists_factor + message_b_to_e_sum - message_b_to_e))
         odds_b = message_a_to_b.exp()
+        odds_b_sum = segment_sum(odds_b, b_index, num_pairs)[..., b_index]
         message_b_to_a = (old * message_b_to_a -
-                          new * ((-message_e_to_b).exp().unsqueeze(1) + (1 + odds_b.sum(1, True) - odds_b)).log())
+                          new * ((-message_e_to_b).exp()[..., b_index] + (1 + odds_b_sum - odds_b)).log())
 
         warn_if_nan(message_a_to_b, 'message_a_to_b iter {}'.format(i))
         warn_if_nan(message_b_to_e, 'message_b_to_e iter {}'.format(i))
         warn_if_nan(message_e_to_b, 'message_e_to_b iter {}'.format(i))
         warn_if_nan(message_b_to_a, 'message_b_to_a iter {}'.format(i))
+        return message_b_to_a, message_a_to_b, message_b_to_e, message_e_to_b
+
+    shapes = [batch_shape + (num_edges,)] * 2 + [batch_shape + (num_pairs,)] * 2
+    messages = _init_messages(bp_init, shapes, assign_logits)
+    messages, info = _run_bp(update, messages, bp_iters, bp_tol)
+    message_b_to_a, message_a_to_b, message_b_to_e, message_e_to_b = messages
 
     # Convert from probs to logits.
-    exists = exists_logits + message_b_to_e.sum(0)
+    exists = exists_logits + segment_sum(message_b_to_e, b_object, num_objects)
     assign = assign_logits + message_b_to_a
     warn_if_nan(exists, 'exists')
     warn_if_nan(assign, 'assign')
+    if return_info:
+        return exists, assign, info
     return exists, assign
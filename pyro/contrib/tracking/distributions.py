@@ -5,15 +5,57 @@ from torch.distributions import constraints
 
 import pyro.distributions as dist
 from pyro.distributions.torch_distribution import TorchDistribution
+from pyro.distributions.util import eye_like
+from pyro.contrib.tracking.dynamic_models import NcpContinuous, NcpDiscrete, NcvContinuous, NcvDiscrete
 from pyro.contrib.tracking.extended_kalman_filter import EKFState
 from pyro.contrib.tracking.measurements import PositionMeasurement
 
+# dynamic models with linear transitions, which are filtered by a parallel scan
+_LINEAR_DYNAMIC_MODELS = (NcpContinuous, NcpDiscrete, NcvContinuous, NcvDiscrete)
+
+
+def _combine_filtering_elements(elem_i, elem_j):
+    '''
+    Associative operator of parallel Kalman filtering [1], which combines batched
+    elements ``(A, b, C, eta, J)`` of earlier time steps ``i`` with those of later
+    time steps ``j``. An element represents the conditional density
+    ``p(x_j | x_i, z_{i+1:j}) = N(A @ x_i + b, C)`` together with the likelihood
+    ``p(z_{i+1:j} | x_i)``, which is proportional to
+    ``exp(-0.5 * x_i.T @ J @ x_i + eta.T @ x_i)``.
+    '''
+    A_i, b_i, C_i, eta_i, J_i = elem_i
+    A_j, b_j, C_j, eta_j, J_j = elem_j
+    I = eye_like(b_i, b_i.size(-1))  # noqa: E741
+    # A_j @ inv(I + C_i @ J_j) and A_i.T @ inv(I + J_j @ C_i)
+    A_j_M = torch.gesv(A_j.transpose(-1, -2), I + J_j.matmul(C_i))[0].transpose(-1, -2)
+    A_i_N = torch.gesv(A_i, I + C_i.matmul(J_j))[0].transpose(-1, -2)
+
+    A = A_j_M.matmul(A_i)
+    b = A_j_M.matmul((b_i + C_i.matmul(eta_j.unsqueeze(-1)).squeeze(-1)).unsqueeze(-1)).squeeze(-1) + b_j
+    C = A_j_M.matmul(C_i).matmul(A_j.transpose(-1, -2)) + C_j
+    eta = A_i_N.matmul((eta_j - J_j.matmul(b_i.unsqueeze(-1)).squeeze(-1)).unsqueeze(-1)).squeeze(-1) + eta_i
+    J = A_i_N.matmul(J_j).matmul(A_i) + J_i
+    return A, b, C, eta, J
+
 
 class EKFDistribution(TorchDistribution):
     r"""
     Distribution over EKF states.  See :class:`~pyro.contrib.tracking.extended_kalman_filter.EKFState`.
     Currently only supports `log_prob`.
 
+    For the linear dynamic models :class:`~pyro.contrib.tracking.dynamic_models.NcpContinuous`,
+    :class:`~pyro.contrib.tracking.dynamic_models.NcvContinuous`,
+    :class:`~pyro.contrib.tracking.dynamic_models.NcpDiscrete` and
+    :class:`~pyro.contrib.tracking.dynamic_models.NcvDiscrete`, filtering is computed
+    by a parallel associative scan over time steps (see reference [1]), which has
+    :math:`\mathcal{O}(\log T)` sequential depth of batched matrix operations for
+    :math:`T` time steps. Other dynamic models are filtered sequentially.
+
+    References:
+
+    [1] `Temporal Parallelization of Bayesian Smoothers`,
+    Simo Sarkka, Angel F. Garcia-Fernandez
+
     :param x0: PV tensor (mean)
     :type x0: torch.Tensor
     :param P0: covariance
@@ -53,9 +95,19 @@ class EKFDistribution(TorchDistribution):
         :param value: measurement means of shape `(time_steps, event_shape)`
         :type value: torch.Tensor
         """
+        assert value.shape[-1] == self.event_shape[-1]
+        if isinstance(self.dynamic_model, _LINEAR_DYNAMIC_MODELS):
+            means, covs, _ = self._parallel_filter(value)
+            states = []
+            time = 0.
+            for i in range(value.size(0)):
+                if i:
+                    time = time + self.dt
+                states.append(EKFState(self.dynamic_model, means[i], covs[i], time=time))
+            return states
+
         states = []
         state = EKFState(self.dynamic_model, self.x0, self.P0, time=0.)
-        assert value.shape[-1] == self.event_shape[-1]
         for i, measurement_mean in enumerate(value):
             if i:
                 state = state.predict(self.dt)
@@ -72,9 +124,12 @@ class EKFDistribution(TorchDistribution):
         :param value: measurement means of shape `(time_steps, event_shape)`
         :type value: torch.Tensor
         """
+        assert value.shape == self.event_shape
+        if isinstance(self.dynamic_model, _LINEAR_DYNAMIC_MODELS):
+            return self._parallel_filter(value)[2]
+
         state = EKFState(self.dynamic_model, self.x0, self.P0, time=0.)
         result = 0.
-        assert value.shape == self.event_shape
         zero = value.new_zeros(self.event_shape[-1])
         for i, measurement_mean in enumerate(value):
             if i:
@@ -84,3 +139,63 @@ class EKFDistribution(TorchDistribution):
             state, (dz, S) = state.update(measurement)
             result = result + dist.MultivariateNormal(dz, S).log_prob(zero)
         return result
+
+    def _parallel_filter(self, value):
+        """
+        Computes filtered means and covariances of all time steps and the joint log
+        probability of innovations by a parallel scan, for linear dynamic models.
+
+        :param value: measurement means of shape `(time_steps, event_shape)`
+        :type value: torch.Tensor
+        :returns: filtered means, filtered covariances and log probability
+        """
+        T = value.size(0)
+        R = self.measurement_cov
+        F = self.dynamic_model.jacobian(self.dt)
+        Q = self.dynamic_model.process_noise_cov(self.dt)
+        D = F.size(-1)
+        H = PositionMeasurement(value[0], R, time=0.).jacobian()[:, :D]
+        Ht = H.t()
+        I = eye_like(value, D)  # noqa: E741
+
+        # the first element is a Kalman update of the prior with the first measurement
+        S0 = H.mm(self.P0).mm(Ht) + R
+        K0 = torch.gesv(H.mm(self.P0), S0)[0].t()
+        ImKH0 = I - K0.mm(H)
+        b0 = self.x0 + K0.mm((value[0] - H.mv(self.x0)).unsqueeze(-1)).squeeze(-1)
+        C0 = ImKH0.mm(self.P0).mm(ImKH0.t()) + K0.mm(R).mm(K0.t())
+
+        # other elements predict and update with one measurement each
+        S = H.mm(Q).mm(Ht) + R
+        K = torch.gesv(H.mm(Q), S)[0].t()
+        ImKH = I - K.mm(H)
+        HF = H.mm(F)
+        Sinv_HF = torch.gesv(HF, S)[0]
+        z = value[1:]
+        A = ImKH.mm(F).expand(T - 1, D, D)
+        b = z.mm(K.t())
+        C = (ImKH.mm(Q).mm(ImKH.t()) + K.mm(R).mm(K.t())).expand(T - 1, D, D)
+        eta = z.mm(Sinv_HF)
+        J = HF.t().mm(Sinv_HF).expand(T - 1, D, D)
+
+        elems = (torch.cat([value.new_zeros(1, D, D), A]),
+                 torch.cat([b0.unsqueeze(0), b]),
+                 torch.cat([C0.unsqueeze(0), C]),
+                 torch.cat([value.new_zeros(1, D), eta]),
+                 torch.cat([value.new_zeros(1, D, D), J]))
+        # inclusive prefix scan, in ceil(log2(T)) steps of batched combinations
+        offset = 1
+        while offset < T:
+            combined = _combine_filtering_elements(tuple(e[:-offset] for e in elems),
+                                                   tuple(e[offset:] for e in elems))
+            elems = tuple(torch.cat([e[:offset], c]) for e, c in zip(elems, combined))
+            offset *= 2
+        means, covs = elems[1], elems[2]
+
+        # innovations of all time steps, computed from one-step predictions
+        pred_means = torch.cat([self.x0.unsqueeze(0), means[:-1].mm(F.t())])
+        pred_covs = torch.cat([self.P0.unsqueeze(0), F.matmul(covs[:-1]).matmul(F.t()) + Q])
+        dz = value - pred_means.mm(Ht)
+        S = H.matmul(pred_covs).matmul(Ht) + R
+        log_prob = dist.MultivariateNormal(dz, S).log_prob(value.new_zeros(value.size(-1))).sum()
+        return means, covs, log_prob
@@ -1,4 +1,5 @@
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
 from six import add_metaclass
 
 import torch
@@ -18,12 +19,47 @@ class DynamicModel(nn.Module):
     :param num_process_noise_parameters: process noise parameter space dimension.
           This for UKF applications. Can be left as ``None`` for EKF and most
           other filters.
+
+    Matrices which only depend on the time interval ``dt`` (e.g. state transition
+    Jacobians, or process noise covariances up to a learnable scale) are memoized
+    in a least-recently-used cache of at most ``cache_size`` entries per model,
+    keyed on ``dt``, dtype and device.
     '''
+    cache_size = 16
+
     def __init__(self, dimension, dimension_pv, num_process_noise_parameters=None):
         self._dimension = dimension
         self._dimension_pv = dimension_pv
         self._num_process_noise_parameters = num_process_noise_parameters
         super(DynamicModel, self).__init__()
+        self._matrix_cache = OrderedDict()
+
+    def _cached(self, name, dt, like, compute_fn):
+        '''
+        Returns ``compute_fn(dt)``, memoized in a least-recently-used cache.
+        Cached values must not depend on learnable parameters, so that they stay
+        valid when parameters change.
+
+        :param str name: name of the cached quantity.
+        :param dt: time interval.
+        :param torch.Tensor like: a tensor with the dtype and device of the result.
+        :param callable compute_fn: a function of ``dt`` computing the result.
+        '''
+        if isinstance(dt, torch.Tensor):
+            if dt.requires_grad:
+                return compute_fn(dt)
+            dt = dt.item()
+        key = name, dt, like.dtype, like.device
+        cache = self._matrix_cache
+        if key in cache:
+            value = cache.pop(key)
+        else:
+            with torch.no_grad():
+                value = compute_fn(dt)
+            if len(cache) >= self.cache_size:
+                cache.popitem(last=False)
+        cache[key] = value  # most recently used entries are last
+        return value
 
     @property
     def dimension(self):
@@ -109,6 +145,16 @@ class DynamicModel(nn.Module):
         '''
         raise NotImplementedError
 
+    def process_noise_scale_tril(self, dt=0.):
+        '''
+        Compute and return a lower triangular factor ``L`` of process noise
+        covariance ``Q = L @ L.T``.
+
+        :param dt: time interval to integrate over.
+        :return: Read-only lower triangular factor of covariance (Q).
+        '''
+        return self.process_noise_cov(dt).cholesky()
+
     def process_noise_dist(self, dt=0.):
         '''
         Return a distribution object of state displacement from the process noise
@@ -117,8 +163,8 @@ class DynamicModel(nn.Module):
         :param dt: time interval that process noise accumulates over.
         :return: :class:`~pyro.distributions.torch.MultivariateNormal`.
         '''
-        Q = self.process_noise_cov(dt)
-        return dist.MultivariateNormal(Q.new_zeros(Q.shape[-1]), Q)
+        L = self.process_noise_scale_tril(dt)
+        return dist.MultivariateNormal(L.new_zeros(L.shape[-1]), scale_tril=L)
 
 
 class DifferentiableDynamicModel(DynamicModel):
@@ -155,8 +201,6 @@ class Ncp(DifferentiableDynamicModel):
         if not isinstance(sv2, torch.Tensor):
             sv2 = torch.tensor(sv2)
         self.sv2 = Parameter(sv2)
-        self._F_cache = eye_like(sv2, dimension)  # State transition matrix cache
-        self._Q_cache = {}  # Process noise cov cache
 
     def forward(self, x, dt, do_normalization=True):
         '''
@@ -182,8 +226,8 @@ class Ncp(DifferentiableDynamicModel):
         :return: PV state estimate mean.
         '''
         with torch.no_grad():
-            x_pv = x.new_zeros(2*self._dimension)
-            x_pv[:self._dimension] = x
+            x_pv = x.new_zeros(x.shape[:-1] + (2*self._dimension,))
+            x_pv[..., :self._dimension] = x
         return x_pv
 
     def cov2pv(self, P):
@@ -197,8 +241,8 @@ class Ncp(DifferentiableDynamicModel):
         '''
         d = 2*self._dimension
         with torch.no_grad():
-            P_pv = P.new_zeros((d, d))
-            P_pv[:self._dimension, :self._dimension] = P
+            P_pv = P.new_zeros(P.shape[:-2] + (d, d))
+            P_pv[..., :self._dimension, :self._dimension] = P
         return P_pv
 
     def jacobian(self, dt):
@@ -209,7 +253,7 @@ class Ncp(DifferentiableDynamicModel):
         :param dt: time interval to integrate over.
         :return: Read-only Jacobian (F) of integration map (f).
         '''
-        return self._F_cache
+        return self._cached('F', None, self.sv2, lambda dt: eye_like(self.sv2, self._dimension))
 
     @abstractmethod
     def process_noise_cov(self, dt=0.):
@@ -240,8 +284,6 @@ class Ncv(DifferentiableDynamicModel):
         if not isinstance(sa2, torch.Tensor):
             sa2 = torch.tensor(sa2)
         self.sa2 = Parameter(sa2)
-        self._F_cache = {}  # State transition matrix cache
-        self._Q_cache = {}  # Process noise cov cache
 
     def forward(self, x, dt, do_normalization=True):
         '''
@@ -257,7 +299,7 @@ class Ncv(DifferentiableDynamicModel):
         :return: Native state x integrated dt into the future.
         '''
         F = self.jacobian(dt)
-        return F.mm(x.unsqueeze(1)).squeeze(1)
+        return F.matmul(x.unsqueeze(-1)).squeeze(-1)
 
     def mean2pv(self, x):
         '''
@@ -289,14 +331,13 @@ class Ncv(DifferentiableDynamicModel):
         :param dt: time interval to integrate over.
         :return: Read-only Jacobian (F) of integration map (f).
         '''
-        if dt not in self._F_cache:
-            d = self._dimension
-            with torch.no_grad():
-                F = eye_like(self.sa2, d)
-                F[:d//2, d//2:] = dt * eye_like(self.sa2, d//2)
-            self._F_cache[dt] = F
+        return self._cached('F', dt, self.sa2, self._jacobian)
 
-        return self._F_cache[dt]
+    def _jacobian(self, dt):
+        d = self._dimension
+        F = eye_like(self.sa2, d)
+        F[:d//2, d//2:] = dt * eye_like(self.sa2, d//2)
+        return F
 
     @abstractmethod
     def process_noise_cov(self, dt=0.):
@@ -332,15 +373,26 @@ class NcpContinuous(Ncp):
         :return: Read-only covariance (Q) of the native state ``x`` resulting from
             stochastic integration (for use with EKF).
         '''
-        if dt not in self._Q_cache:
-            # q: continuous-time process noise intensity with units
-            #   length^2/time (m^2/s). Choose ``q`` so that changes in position,
-            #   over a sampling period ``dt``, are roughly ``sqrt(q*dt)``.
-            q = self.sv2 * dt
-            Q = q * dt * eye_like(self.sv2, self._dimension)
-            self._Q_cache[dt] = Q
+        # q: continuous-time process noise intensity with units
+        #   length^2/time (m^2/s). Choose ``q`` so that changes in position,
+        #   over a sampling period ``dt``, are roughly ``sqrt(q*dt)``.
+        return self.sv2 * self._cached('Q', dt, self.sv2, self._unit_process_noise_cov)
+
+    def process_noise_scale_tril(self, dt=0.):
+        '''
+        Compute and return a lower triangular factor ``L`` of process noise
+        covariance ``Q = L @ L.T``.
+
+        :param dt: time interval to integrate over.
+        :return: Read-only lower triangular factor of covariance (Q).
+        '''
+        return self.sv2.sqrt() * self._cached('L', dt, self.sv2, self._unit_process_noise_scale_tril)
+
+    def _unit_process_noise_cov(self, dt):
+        return dt * dt * eye_like(self.sv2, self._dimension)
 
-        return self._Q_cache[dt]
+    def _unit_process_noise_scale_tril(self, dt):
+        return abs(dt) * eye_like(self.sv2, self._dimension)
 
 
 class NcvContinuous(Ncv):
@@ -366,24 +418,41 @@ class NcvContinuous(Ncv):
         :return: Read-only covariance (Q) of the native state ``x`` resulting from
             stochastic integration (for use with EKF).
         '''
-        if dt not in self._Q_cache:
+        # sa2 * dt is an intensity factor that changes in velocity
+        # over a sampling period ``dt``, ideally should be ~``sqrt(q*dt)``.
+        return self.sa2 * self._cached('Q', dt, self.sa2, self._unit_process_noise_cov)
 
-            with torch.no_grad():
-                d = self._dimension
-                dt2 = dt * dt
-                dt3 = dt2 * dt
-                Q = self.sa2.new_zeros(d, d)
-                eye = eye_like(self.sa2, d//2)
-                Q[:d//2, :d//2] = dt3 * eye / 3.0
-                Q[:d//2, d//2:] = dt2 * eye / 2.0
-                Q[d//2:, :d//2] = dt2 * eye / 2.0
-                Q[d//2:, d//2:] = dt * eye
-            # sa2 * dt is an intensity factor that changes in velocity
-            # over a sampling period ``dt``, ideally should be ~``sqrt(q*dt)``.
-            Q = Q * (self.sa2 * dt)
-            self._Q_cache[dt] = Q
-
-        return self._Q_cache[dt]
+    def process_noise_scale_tril(self, dt=0.):
+        '''
+        Compute and return a lower triangular factor ``L`` of process noise
+        covariance ``Q = L @ L.T``.
+
+        :param dt: time interval to integrate over.
+        :return: Read-only lower triangular factor of covariance (Q).
+        '''
+        return self.sa2.sqrt() * self._cached('L', dt, self.sa2, self._unit_process_noise_scale_tril)
+
+    def _unit_process_noise_cov(self, dt):
+        d = self._dimension
+        dt2 = dt * dt
+        dt3 = dt2 * dt
+        Q = self.sa2.new_zeros(d, d)
+        eye = eye_like(self.sa2, d//2)
+        Q[:d//2, :d//2] = dt2 * dt2 * eye / 3.0
+        Q[:d//2, d//2:] = dt3 * eye / 2.0
+        Q[d//2:, :d//2] = dt3 * eye / 2.0
+        Q[d//2:, d//2:] = dt2 * eye
+        return Q
+
+    def _unit_process_noise_scale_tril(self, dt):
+        # analytic Cholesky factor of the blocks [[dt^4/3, dt^3/2], [dt^3/2, dt^2]]
+        d = self._dimension
+        L = self.sa2.new_zeros(d, d)
+        eye = eye_like(self.sa2, d//2)
+        L[:d//2, :d//2] = dt * dt * eye / 3.0**0.5
+        L[d//2:, :d//2] = 0.5 * 3.0**0.5 * dt * eye
+        L[d//2:, d//2:] = 0.5 * abs(dt) * eye
+        return L
 
 
 class NcpDiscrete(Ncp):
@@ -408,11 +477,23 @@ class NcpDiscrete(Ncp):
         :return: Read-only covariance (Q) of the native state `x` resulting from
             stochastic integration (for use with EKF).
         '''
-        if dt not in self._Q_cache:
-            Q = self.sv2 * dt * dt * eye_like(self.sv2, self._dimension)
-            self._Q_cache[dt] = Q
+        return self.sv2 * self._cached('Q', dt, self.sv2, self._unit_process_noise_cov)
 
-        return self._Q_cache[dt]
+    def process_noise_scale_tril(self, dt=0.):
+        '''
+        Compute and return a lower triangular factor ``L`` of process noise
+        covariance ``Q = L @ L.T``.
+
+        :param dt: time interval to integrate over.
+        :return: Read-only lower triangular factor of covariance (Q).
+        '''
+        return self.sv2.sqrt() * self._cached('L', dt, self.sv2, self._unit_process_noise_scale_tril)
+
+    def _unit_process_noise_cov(self, dt):
+        return dt * dt * eye_like(self.sv2, self._dimension)
+
+    def _unit_process_noise_scale_tril(self, dt):
+        return abs(dt) * eye_like(self.sv2, self._dimension)
 
 
 class NcvDiscrete(Ncv):
@@ -439,18 +520,34 @@ class NcvDiscrete(Ncv):
             numerical error, has rank `dimension/2`. So, it is only positive
             semi-definite.)
         '''
-        if dt not in self._Q_cache:
-            with torch.no_grad():
-                d = self._dimension
-                dt2 = dt*dt
-                dt3 = dt2*dt
-                dt4 = dt2*dt2
-                Q = self.sa2.new_zeros(d, d)
-                Q[:d//2, :d//2] = 0.25 * dt4 * eye_like(self.sa2, d//2)
-                Q[:d//2, d//2:] = 0.5 * dt3 * eye_like(self.sa2, d//2)
-                Q[d//2:, :d//2] = 0.5 * dt3 * eye_like(self.sa2, d//2)
-                Q[d//2:, d//2:] = dt2 * eye_like(self.sa2, d//2)
-            Q = Q * self.sa2
-            self._Q_cache[dt] = Q
-
-        return self._Q_cache[dt]
+        return self.sa2 * self._cached('Q', dt, self.sa2, self._unit_process_noise_cov)
+
+    def process_noise_scale_tril(self, dt=0.):
+        '''
+        Compute and return a lower triangular factor ``L`` of process noise
+        covariance ``Q = L @ L.T``. (Note that the diagonal of ``L`` is
+        partially zero, since this Q has rank `dimension/2`.)
+
+        :param dt: time interval to integrate over.
+        :return: Read-only lower triangular factor of covariance (Q).
+        '''
+        return self.sa2.sqrt() * self._cached('L', dt, self.sa2, self._unit_process_noise_scale_tril)
+
+    def _unit_process_noise_cov(self, dt):
+        d = self._dimension
+        dt2 = dt*dt
+        dt3 = dt2*dt
+        dt4 = dt2*dt2
+        Q = self.sa2.new_zeros(d, d)
+        Q[:d//2, :d//2] = 0.25 * dt4 * eye_like(self.sa2, d//2)
+        Q[:d//2, d//2:] = 0.5 * dt3 * eye_like(self.sa2, d//2)
+        Q[d//2:, :d//2] = 0.5 * dt3 * eye_like(self.sa2, d//2)
+        Q[d//2:, d//2:] = dt2 * eye_like(self.sa2, d//2)
+        return Q
+
+    def _unit_process_noise_scale_tril(self, dt):
+        d = self._dimension
+        L = self.sa2.new_zeros(d, d)
+        L[:d//2, :d//2] = 0.5 * dt * dt * eye_like(self.sa2, d//2)
+        L[d//2:, :d//2] = dt * eye_like(self.sa2, d//2)
+        return L
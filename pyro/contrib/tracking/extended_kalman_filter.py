@@ -2,6 +2,7 @@ import torch
 from torch.distributions.utils import lazy_property
 
 import pyro.distributions as dist
+from pyro.contrib.tracking.measurements import PositionMeasurement
 from pyro.distributions.util import eye_like
 
 
@@ -207,3 +208,251 @@ class EKFState(object):
         state = EKFState(self._dynamic_model, pred_mean, pred_cov, self._time, self._frame_num)
 
         return state, (dz, S)
+
+
+class BatchedEKFState(object):
+    '''
+    Bank of EKF (Extended Kalman Filter) states of many targets which share a
+    dynamic model and a state time. Means and covariances of all targets are
+    stored as stacked tensors, so :meth:`predict`, :meth:`innovation`,
+    :meth:`log_likelihood_of_update` and :meth:`update` process all targets at
+    once with batched tensor operations instead of one :class:`EKFState` per
+    target.
+
+    .. warning:: For efficiency, the dynamic model is only shallow-copied. Make
+        a deep copy outside as necessary to protect against unexpected changes.
+
+    :param dynamic_model: target dynamic model.
+    :param mean: means of target state estimates, with shape
+        ``(num_tracks, dimension)``.
+    :param cov: covariances of target state estimates, with shape
+        ``(num_tracks, dimension, dimension)``.
+    :param time: time of state estimates.
+    :param frame_num: frame number of state estimates.
+    '''
+    def __init__(self, dynamic_model, mean, cov, time=None, frame_num=None):
+        self._dynamic_model = dynamic_model
+        self._mean = mean
+        self._cov = cov
+        if time is None and frame_num is None:
+            raise ValueError('Must provide time or frame_num!')
+        self._time = time
+        self._frame_num = frame_num
+
+    @classmethod
+    def from_states(cls, states):
+        '''
+        Stacks time-aligned :class:`EKFState` objects which share a dynamic model.
+
+        :param list states: a list of :class:`EKFState` objects.
+        :return: a :class:`BatchedEKFState` with one track per state.
+        '''
+        state = states[0]
+        for other in states[1:]:
+            assert other.dynamic_model is state.dynamic_model, \
+                'States must share a dynamic model!'
+            assert other.time == state.time and other.frame_num == state.frame_num, \
+                'States must be time-aligned!'
+        return cls(state.dynamic_model, torch.stack([s.mean for s in states]),
+                   torch.stack([s.cov for s in states]), state.time, state.frame_num)
+
+    def __len__(self):
+        return self._mean.size(0)
+
+    def __getitem__(self, i):
+        '''
+        Returns the :class:`EKFState` of the ``i``-th track.
+        '''
+        return EKFState(self._dynamic_model, self._mean[i], self._cov[i],
+                        self._time, self._frame_num)
+
+    @property
+    def dynamic_model(self):
+        '''
+        Dynamic model access.
+        '''
+        return self._dynamic_model
+
+    @property
+    def num_tracks(self):
+        '''
+        Number of tracks access.
+        '''
+        return self._mean.size(0)
+
+    @property
+    def dimension(self):
+        '''
+        Native state dimension access.
+        '''
+        return self._dynamic_model.dimension
+
+    @property
+    def mean(self):
+        '''
+        Native state estimate means access.
+        '''
+        return self._mean
+
+    @property
+    def cov(self):
+        '''
+        Native state estimate covariances access.
+        '''
+        return self._cov
+
+    @property
+    def dimension_pv(self):
+        '''
+        PV state dimension access.
+        '''
+        return self._dynamic_model.dimension_pv
+
+    @lazy_property
+    def mean_pv(self):
+        '''
+        Compute and return cached PV state estimate means.
+        '''
+        return self._dynamic_model.mean2pv(self._mean)
+
+    @lazy_property
+    def cov_pv(self):
+        '''
+        Compute and return cached PV state estimate covariances.
+        '''
+        return self._dynamic_model.cov2pv(self._cov)
+
+    @property
+    def time(self):
+        '''
+        Continuous State time access.
+        '''
+        return self._time
+
+    @property
+    def frame_num(self):
+        '''
+        Discrete State time access.
+        '''
+        return self._frame_num
+
+    def predict(self, dt=None, destination_time=None, destination_frame_num=None):
+        '''
+        Use dynamic model to predict (aka propagate aka integrate) state
+        estimates of all tracks.
+
+        :param dt: time to integrate over. The state time will be automatically
+                   incremented this amount unless you provide ``destination_time``.
+        :param destination_time: optional value to set continuous state time to
+            after integration. If this is not provided, then
+            `destination_frame_num` must be.
+        :param destination_frame_num: optional value to set discrete state time to
+            after integration. If this is not provided, then
+            `destination_frame_num` must be.
+        :return: predicted states.
+        :rtype: BatchedEKFState
+        '''
+        assert (dt is None) ^ (destination_time is None)
+        if dt is None:
+            dt = destination_time - self._time
+        elif destination_time is None:
+            destination_time = self._time + dt
+        pred_mean = self._dynamic_model(self._mean, dt)
+
+        F = self._dynamic_model.jacobian(dt)
+        Q = self._dynamic_model.process_noise_cov(dt)
+        pred_cov = F.matmul(self._cov).matmul(F.transpose(-1, -2)) + Q
+
+        if destination_time is None and destination_frame_num is None:
+            raise ValueError('destination_time or destination_frame_num must be specified!')
+
+        return BatchedEKFState(self._dynamic_model, pred_mean, pred_cov,
+                               destination_time, destination_frame_num)
+
+    def _measurement_terms(self, measurements):
+        '''
+        Stacks measurement means ``z``, covariances ``R``, Jacobians ``H`` and
+        innovation means ``dz`` of one measurement per track.
+        '''
+        assert len(measurements) == self.num_tracks, \
+            'Expected one measurement per track!'
+        for measurement in measurements:
+            if self._time is not None:
+                assert self._time == measurement.time, \
+                    'State time and measurement time must be aligned!'
+            if self._frame_num is not None:
+                assert self._frame_num == measurement.frame_num, \
+                    'State time and measurement time must be aligned!'
+
+        x_pv = self.mean_pv
+        z = torch.stack([m.mean for m in measurements])
+        R = torch.stack([m.cov for m in measurements])
+        measurement = measurements[0]
+        if all(type(m) is PositionMeasurement for m in measurements):
+            # the measurement map is linear and shared by all tracks
+            H = measurement.jacobian()[:, :self.dimension].expand(len(measurements), -1, -1)
+            dz = measurement.geodesic_difference(z, measurement(x_pv))
+        else:
+            H = torch.stack([m.jacobian(x)[:, :self.dimension]
+                             for m, x in zip(measurements, x_pv)])
+            dz = torch.stack([m.geodesic_difference(m.mean, m(x))
+                              for m, x in zip(measurements, x_pv)])
+        return z, R, H, dz
+
+    def innovation(self, measurements):
+        '''
+        Compute and return the innovations that measurements would induce if
+        they were used for an update, but don't actually perform the update.
+        Assumes states and measurements are time-aligned.
+
+        :param list measurements: one measurement for each track.
+        :return: Innovation means and covariances of hypothetical updates, with
+            shapes ``(num_tracks, measurement_dim)`` and
+            ``(num_tracks, measurement_dim, measurement_dim)``.
+        :rtype: tuple(``torch.Tensor``, ``torch.Tensor``)
+        '''
+        _, R, H, dz = self._measurement_terms(measurements)
+        S = H.matmul(self._cov).matmul(H.transpose(-1, -2)) + R  # innovation cov
+        return dz, S
+
+    def log_likelihood_of_update(self, measurements):
+        '''
+        Compute and return the likelihoods of potential updates, but don't
+        actually perform the updates. Assumes states and measurements are time-
+        aligned. Useful for gating and calculating costs in assignment problems
+        for data association.
+
+        :param list measurements: one measurement for each track.
+        :return: Likelihoods of hypothetical updates, with shape ``(num_tracks,)``.
+        '''
+        dz, S = self.innovation(measurements)
+        return dist.MultivariateNormal(S.new_zeros(S.shape[-1]),
+                                       S).log_prob(dz)
+
+    def update(self, measurements):
+        '''
+        Use measurements to update state estimates of all tracks and return
+        innovations.
+
+        :param list measurements: one measurement for each track.
+        :returns: updated states, innovation means and covariances.
+        :rtype: tuple(BatchedEKFState, tuple(``torch.Tensor``, ``torch.Tensor``))
+        '''
+        _, R, H, dz = self._measurement_terms(measurements)
+        x = self._mean
+        P = self._cov
+        S = H.matmul(P).matmul(H.transpose(-1, -2)) + R  # innovation cov
+
+        # Kalman gain K = P @ H.T @ inv(S), computed by one batched solve
+        K = torch.gesv(H.matmul(P), S)[0].transpose(-1, -2)
+        dx = K.matmul(dz.unsqueeze(-1)).squeeze(-1)
+        x = self._dynamic_model.geodesic_difference(x, -dx)
+
+        I = eye_like(x, self._dynamic_model.dimension)  # noqa: E741
+        ImKH = I - K.matmul(H)
+        # *Joseph form* of covariance update for numerical stability.
+        P = ImKH.matmul(P).matmul(ImKH.transpose(-1, -2)) \
+            + K.matmul(R).matmul(K.transpose(-1, -2))
+
+        state = BatchedEKFState(self._dynamic_model, x, P, self._time, self._frame_num)
+        return state, (dz, S)
@@ -136,13 +136,151 @@ class ApproxSet(object):
         self._bins.add(_hash)
         return True
 
+    def try_add_batch(self, points):
+        """
+        Attempts to add each of a batch of ``points`` to set, in order. This is
+        equivalent to calling :meth:`try_add` on each point, but hashes all
+        points at once.
+
+
+        :param torch.Tensor points: A tensor of shape ``(K,D)`` of points to be queried.
+        :return: A boolean tensor of shape ``(K,)`` indicating which points were successfully added.
+        :rtype: torch.Tensor
+        """
+        hashes = (points / self._radius).round().long().tolist()
+        added = []
+        for _hash in map(tuple, hashes):
+            added.append(_hash not in self._bins)
+            self._bins.add(_hash)
+        return torch.tensor(added, dtype=torch.uint8)
+
+
+def _searchsorted(sorted_keys, keys):
+    """
+    Returns for each element of ``keys`` the number of ``sorted_keys`` strictly
+    smaller than it, i.e. the leftmost insertion index into ``sorted_keys``.
+    """
+    if hasattr(torch, 'searchsorted'):
+        return torch.searchsorted(sorted_keys, keys)
+    # Sort keys together with sorted_keys, such that keys precede equal sorted_keys.
+    n = sorted_keys.size(0)
+    merged = torch.cat([sorted_keys * 2 + 1, keys.reshape(-1) * 2])
+    order = merged.sort()[1]
+    is_sorted_key = order < n
+    num_smaller = is_sorted_key.long().cumsum(0)
+    result = keys.new_empty(keys.numel())
+    result[order[~is_sorted_key] - n] = num_smaller[~is_sorted_key]
+    return result.reshape(keys.shape)
+
+
+class GridIndex(object):
+    """
+    A grid (cell list) spatial index of a fixed set of points in
+    low-dimensional euclidean space, supporting batched radius queries.
+
+    Unlike :class:`LSH`, which hashes one point at a time, this hashes all
+    points at once into cells of width ``radius`` and sorts them by cell. The
+    candidate neighbours of a batch of query points are then found by binary
+    search over the sorted cells, for each of the ``3 ** D`` cells adjacent to
+    each query point.
+
+    Example:
+
+        >>> objects = torch.tensor([[0., 0.], [1., 0.], [5., 5.]])
+        >>> detections = torch.tensor([[0.1, 0.], [4.9, 5.2], [9., 9.]])
+        >>> index = GridIndex(objects, radius=0.5)
+        >>> index.query(detections)
+        tensor([[0, 1],
+                [0, 2]])
+
+    The resulting ``edges`` can be used for gating in
+    :class:`~pyro.contrib.tracking.assignment.MarginalAssignmentSparse`.
+
+    :param torch.Tensor points: A tensor of shape ``(K,D)`` where ``K`` is
+        the number of points and ``D`` is the number of dimensions.
+    :param float radius: Distance within which points are considered neighbours.
+    """
+    def __init__(self, points, radius):
+        if points.dim() != 2:
+            raise ValueError('Expected points.shape == (K,D), but got {}'.format(points.shape))
+        if not (isinstance(radius, Number) and radius > 0):
+            raise ValueError("radius must be float greater than 0, given: {}".format(radius))
+        self.points = points
+        self.radius = radius
+        dim = points.size(-1)
+
+        # Hash points into integer cell coordinates, which are encoded as keys.
+        coords = self._hash(points)
+        if len(points):
+            self._origin = coords.min(0)[0]
+            self._extent = coords.max(0)[0] - self._origin + 1
+        else:
+            self._origin = coords.new_zeros(dim)
+            self._extent = coords.new_zeros(dim)
+        self._strides = coords.new_tensor([int(self._extent[d + 1:].prod()) for d in range(dim)])
+        self._sorted_keys, self._order = self._encode(coords).sort()
+        offsets = list(itertools.product([-1, 0, 1], repeat=dim))
+        self._offsets = coords.new_tensor(offsets).reshape(len(offsets), dim)
+
+    def _hash(self, points):
+        return (points / self.radius).round().long()
+
+    def _encode(self, coords):
+        return (coords - self._origin).mul(self._strides).sum(-1)
+
+    def query(self, queries):
+        """
+        Finds all pairs of a query point and an indexed point which are closer
+        than ``radius``.
+
+        :param torch.Tensor queries: A tensor of shape ``(Q,D)`` of query points.
+        :return: A ``(2, num_edges)``-shaped tensor of (query, point) index pairs.
+        :rtype: torch.LongTensor
+        """
+        if queries.dim() != 2 or queries.size(-1) != self.points.size(-1):
+            raise ValueError('Expected queries.shape == (Q,{}), but got {}'
+                             .format(self.points.size(-1), queries.shape))
+
+        # Find ranges of sorted points in all cells adjacent to each query point.
+        coords = self._hash(queries).unsqueeze(-2) + self._offsets
+        shifted = coords - self._origin
+        valid = ((shifted >= 0) & (shifted < self._extent)).all(-1)
+        keys = self._encode(coords)
+        begin = _searchsorted(self._sorted_keys, keys)
+        end = _searchsorted(self._sorted_keys, keys + 1)
+        counts = (end - begin) * valid.long()
+        query_index = torch.arange(len(queries), dtype=torch.long).unsqueeze(-1).expand_as(counts)
+        nonempty = counts > 0
+        counts = counts[nonempty]
+        begin = begin[nonempty]
+        query_index = query_index[nonempty]
+
+        # Expand each range into individual (query, point) pairs.
+        total = int(counts.sum())
+        if not total:
+            return torch.zeros(2, 0, dtype=torch.long)
+        starts = counts.cumsum(0) - counts
+        segment = counts.new_zeros(total)
+        segment[starts[1:]] = 1
+        segment = segment.cumsum(0)
+        position = begin[segment] + torch.arange(total, dtype=torch.long) - starts[segment]
+        query_index = query_index[segment]
+        point_index = self._order[position]
+
+        # Filter by exact distance.
+        d2 = (queries[query_index] - self.points[point_index]).pow(2).sum(-1)
+        near = d2 < self.radius ** 2
+        return torch.stack([query_index[near], point_index[near]])
+
 
 def merge_points(points, radius):
     """
     Greedily merge points that are closer than given radius.
 
-    This uses :class:`LSH` to achieve complexity that is linear in the number
-    of merged clusters and quadratic in the size of the largest merged cluster.
+    This uses a :class:`GridIndex` to find all initial pairs of nearby points
+    at once, and :class:`LSH` to find neighbours of merged points, achieving
+    complexity that is linear in the number of merged clusters and quadratic
+    in the size of the largest merged cluster.
 
     :param torch.Tensor points: A tensor of shape ``(K,D)`` where ``K`` is
         the number of points and ``D`` is the number of dimensions.
@@ -162,22 +300,22 @@ def merge_points(points, radius):
     threshold = radius ** 2
 
     # setup data structures to cheaply search for nearest pairs
-    lsh = LSH(radius)
-    priority_queue = []
+    index = GridIndex(points, radius)
+    i, j = index.query(points)
+    pairs = i < j
+    i, j = i[pairs], j[pairs]
+    d2 = (points[i] - points[j]).pow(2).sum(-1)
+    priority_queue = list(zip(d2.tolist(), i.tolist(), j.tolist()))
     groups = [(i,) for i in range(len(points))]
-    for i, point in enumerate(points):
-        lsh.add(i, point)
-        for j in lsh.nearby(i):
-            d2 = (point - points[j]).pow(2).sum().item()
-            if d2 < threshold:
-                heapq.heappush(priority_queue, (d2, j, i))
     if not priority_queue:
         return points, groups
+    heapq.heapify(priority_queue)
 
     # convert from dense to sparse representation
-    next_id = len(points)
+    num_points = next_id = len(points)
     points = dict(enumerate(points))
     groups = dict(enumerate(groups))
+    lsh = LSH(radius)  # indexes merged points
 
     # greedily merge
     while priority_queue:
@@ -188,12 +326,13 @@ def merge_points(points, radius):
         next_id += 1
         points[k] = (points.pop(i) + points.pop(j)) / 2
         groups[k] = groups.pop(i) + groups.pop(j)
-        lsh.remove(i)
-        lsh.remove(j)
+        for merged in (i, j):
+            if merged >= num_points:
+                lsh.remove(merged)
         lsh.add(k, points[k])
-        for i in lsh.nearby(k):
-            if i == k:
-                continue
+        nearby = lsh.nearby(k)
+        nearby.update(i for i in index.query(points[k].unsqueeze(0))[1].tolist() if i in points)
+        for i in nearby:
             d2 = (points[i] - points[k]).pow(2).sum().item()
             if d2 < threshold:
                 heapq.heappush(priority_queue, (d2, i, k))
@@ -123,12 +123,12 @@ class PositionMeasurement(DifferentiableMeasurement):
         Measurement map (h) for predicting a measurement ``z`` from target
         state ``x``.
 
-        :param x: PV state.
+        :param x: PV state, or a batch of PV states stacked along the first dimension.
         :param do_normalization: whether to normalize output. Has no effect for
               this subclass.
         :return: Measurement predicted from state ``x``.
         '''
-        return x[:self._dimension]
+        return x[..., :self._dimension]
 
     def jacobian(self, x=None):
         '''
@@ -6,8 +6,9 @@ from pyro.infer.discrete import infer_discrete
 from pyro.infer.elbo import ELBO
 from pyro.infer.enum import config_enumerate
 from pyro.infer.importance import Importance
+from pyro.infer.marginal import MemoizedMarginal
 from pyro.infer.renyi_elbo import RenyiELBO
-from pyro.infer.svi import SVI
+from pyro.infer.svi import JitSVI, SVI
 from pyro.infer.trace_elbo import JitTrace_ELBO, Trace_ELBO
 from pyro.infer.trace_mean_field_elbo import JitTraceMeanField_ELBO, TraceMeanField_ELBO
 from pyro.infer.traceenum_elbo import JitTraceEnum_ELBO, TraceEnum_ELBO
@@ -23,10 +24,12 @@ __all__ = [
     "EmpiricalMarginal",
     "Importance",
     "infer_discrete",
+    "JitSVI",
     "JitTraceEnum_ELBO",
     "JitTraceGraph_ELBO",
     "JitTraceMeanField_ELBO",
     "JitTrace_ELBO",
+    "MemoizedMarginal",
     "RenyiELBO",
     "SVI",
     "TraceEnum_ELBO",
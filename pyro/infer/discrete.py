@@ -5,8 +5,9 @@ from collections import OrderedDict
 
 import pyro.ops.packed as packed
 from pyro import poutine
+from pyro.infer.util import get_markov_dims
 from pyro.ops.contract import contract_tensor_tree
-from pyro.ops.einsum.adjoint import require_backward
+from pyro.ops.einsum.adjoint import PARTICLE_SYMBOL, particle_sample, require_backward
 from pyro.ops.rings import MapRing, SampleRing
 from pyro.poutine.enumerate_messenger import EnumerateMessenger
 from pyro.poutine.replay_messenger import ReplayMessenger
@@ -33,7 +34,7 @@ class SamplePosteriorMessenger(ReplayMessenger):
             msg["cond_indep_stack"] = self.trace.nodes[msg["name"]]["cond_indep_stack"]
 
 
-def _sample_posterior(model, first_available_dim, temperature, *args, **kwargs):
+def _sample_posterior(model, first_available_dim, temperature, num_samples, *args, **kwargs):
     # For internal use by infer_discrete.
 
     # Create an enumerated trace.
@@ -57,7 +58,7 @@ def _sample_posterior(model, first_available_dim, temperature, *args, **kwargs):
             sum_dims.update(log_prob._pyro_dims)
             for frame in node["cond_indep_stack"]:
                 if frame.vectorized:
-                    sum_dims.remove(plate_to_symbol[frame.name])
+                    sum_dims.discard(plate_to_symbol[frame.name])
             # Note we mark all sample sites with require_backward to gather
             # enumerated sites and adjust cond_indep_stack of all sample sites.
             if not node["is_observed"]:
@@ -66,7 +67,9 @@ def _sample_posterior(model, first_available_dim, temperature, *args, **kwargs):
 
     # Run forward-backward algorithm, collecting the ordinal of each connected component.
     ring = _make_ring(temperature)
-    log_probs = contract_tensor_tree(log_probs, sum_dims, ring=ring)  # run forward algorithm
+    markov_dims = get_markov_dims(enum_trace)
+    log_probs = contract_tensor_tree(log_probs, sum_dims, ring=ring,
+                                     markov_dims=markov_dims)  # run forward algorithm
     query_to_ordinal = {}
     pending = object()  # a constant value for pending queries
     for query in queries:
@@ -74,13 +77,20 @@ def _sample_posterior(model, first_available_dim, temperature, *args, **kwargs):
     for ordinal, terms in log_probs.items():
         for term in terms:
             if hasattr(term, "_pyro_backward"):
-                term._pyro_backward()  # run backward algorithm
+                # run backward algorithm, optionally drawing a batch of samples
+                message = None if num_samples is None else particle_sample(num_samples, term.device)
+                term._pyro_backward(message)
         # Note: this is quadratic in number of ordinals
         for query in queries:
             if query not in query_to_ordinal and query._pyro_backward_result is not pending:
                 query_to_ordinal[query] = ordinal
 
     # Construct a collapsed trace by gathering and adjusting cond_indep_stack.
+    symbol_to_dim = enum_trace.symbol_to_dim
+    if num_samples is not None:
+        # Batches of samples are unpacked to the first available dim.
+        symbol_to_dim = symbol_to_dim.copy()
+        symbol_to_dim[PARTICLE_SYMBOL] = first_available_dim
     collapsed_trace = poutine.Trace()
     for node in enum_trace.nodes.values():
         if node["type"] == "sample" and not node["is_observed"]:
@@ -109,7 +119,7 @@ def _sample_posterior(model, first_available_dim, temperature, *args, **kwargs):
                         if dim in new_value._pyro_dims:
                             index._pyro_dims = sample._pyro_dims[1:]
                             new_value = packed.gather(new_value, index, dim)
-                    new_node["value"] = packed.unpack(new_value, enum_trace.symbol_to_dim)
+                    new_node["value"] = packed.unpack(new_value, symbol_to_dim)
 
             collapsed_trace.add_node(node["name"], **new_node)
 
@@ -118,7 +128,7 @@ def _sample_posterior(model, first_available_dim, temperature, *args, **kwargs):
         return model(*args, **kwargs)
 
 
-def infer_discrete(fn=None, first_available_dim=None, temperature=1):
+def infer_discrete(fn=None, first_available_dim=None, temperature=1, num_samples=None):
     """
     A poutine that samples discrete sites marked with
     ``site["infer"]["enumerate"] = "parallel"`` from the posterior,
@@ -150,10 +160,19 @@ def infer_discrete(fn=None, first_available_dim=None, temperature=1):
         This should be a negative integer.
     :param int temperature: Either 1 (sample via forward-filter backward-sample)
         or 0 (optimize via Viterbi-like MAP inference). Defaults to 1 (sample).
+    :param int num_samples: An optional number of joint samples to draw with a
+        single forward pass. If given, the backward pass draws all samples at
+        once as a batch, and inferred values have an extra leading batch dim
+        of size ``num_samples`` at ``first_available_dim``, so the model must
+        broadcast over that dim as it does for parallel enumeration. Defaults
+        to None (a single sample without this batch dim).
     """
     assert first_available_dim < 0, first_available_dim
+    if num_samples is not None and num_samples < 1:
+        raise ValueError("num_samples must be a positive integer, but got {}".format(num_samples))
     if fn is None:  # support use as a decorator
         return functools.partial(infer_discrete,
                                  first_available_dim=first_available_dim,
-                                 temperature=temperature)
-    return functools.partial(_sample_posterior, fn, first_available_dim, temperature)
+                                 temperature=temperature,
+                                 num_samples=num_samples)
+    return functools.partial(_sample_posterior, fn, first_available_dim, temperature, num_samples)
@@ -0,0 +1,107 @@
+from __future__ import absolute_import, division, print_function
+
+from collections import OrderedDict, namedtuple
+
+import torch
+
+from pyro.infer.abstract_infer import EmpiricalMarginal
+
+MarginalCacheInfo = namedtuple('MarginalCacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+
+def _hashable(value):
+    """
+    Converts a model argument to a hashable cache key, where tensors are
+    compared by value.
+    """
+    if torch.is_tensor(value):
+        value = value.detach().cpu().contiguous()
+        return torch.Tensor, str(value.dtype), tuple(value.shape), value.numpy().tobytes()
+    if isinstance(value, (tuple, list)):
+        return (type(value),) + tuple(_hashable(x) for x in value)
+    if isinstance(value, dict):
+        return (dict,) + tuple((k, _hashable(v)) for k, v in sorted(value.items()))
+    return value
+
+
+class MemoizedMarginal(object):
+    """
+    Memoized marginal distribution of a model, for nested inference.
+
+    Calling this with model arguments runs inference on the model with those
+    arguments and returns the marginal distribution of the resulting traces.
+    Marginals are cached in a bounded LRU cache keyed on the arguments, where
+    tensors are compared by value, so that models which repeatedly condition
+    on the marginals of a sub-model, e.g. recursive speaker/listener models of
+    pragmatics, compute each distinct marginal only once.
+
+    The model should depend only on its arguments, and not e.g. on
+    :func:`~pyro.param` values that change between calls.
+
+    Example::
+
+        @functools.partial(MemoizedMarginal, posterior=Search)
+        def literal_listener(utterance):
+            state = state_prior()
+            pyro.sample("meaning", dist.Bernoulli(meaning(utterance, state)), obs=torch.tensor(1.))
+            return state
+
+        def speaker(state):
+            utterance = utterance_prior()
+            pyro.sample("listener", literal_listener(utterance), obs=state)
+            return utterance
+
+    :param callable model: a stochastic function.
+    :param callable posterior: a function that creates a
+        :class:`~pyro.infer.abstract_infer.TracePosterior` from a model, e.g.
+        ``functools.partial(Importance, num_samples=100)``.
+    :param sites: an optional site name or list of site names whose marginal
+        to compute. Defaults to the return value.
+    :param callable marginal: a function that creates a distribution from a
+        run ``TracePosterior`` and ``sites``. Defaults to
+        :class:`~pyro.infer.abstract_infer.EmpiricalMarginal`.
+    :param int maxsize: the maximum number of cached marginals, or None for an
+        unbounded cache. Defaults to 128.
+    """
+    def __init__(self, model, posterior, sites=None, marginal=EmpiricalMarginal, maxsize=128):
+        self.model = model
+        self.posterior = posterior
+        self.sites = sites
+        self.marginal = marginal
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._cache = OrderedDict()
+
+    def __call__(self, *args, **kwargs):
+        key = _hashable(args), _hashable(kwargs)
+        result = self._cache.pop(key, None)
+        if result is None:
+            self.misses += 1
+            trace_posterior = self.posterior(self.model).run(*args, **kwargs)
+            result = self.marginal(trace_posterior, self.sites)
+        else:
+            self.hits += 1
+        if self.maxsize != 0:
+            self._cache[key] = result
+        if self.maxsize is not None:
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def cache_info(self):
+        """
+        Returns statistics of the cache of marginals.
+
+        :rtype: MarginalCacheInfo
+        """
+        return MarginalCacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._cache))
+
+    def cache_clear(self):
+        """
+        Clears the cache of marginals and its statistics.
+        """
+        self._cache.clear()
+        self.hits = self.misses = self.evictions = 0
@@ -1,6 +1,7 @@
 from __future__ import absolute_import, division, print_function
 
 import math
+import weakref
 from collections import OrderedDict
 
 import torch
@@ -8,6 +9,7 @@ from torch.distributions import biject_to, constraints
 
 import pyro
 import pyro.distributions as dist
+import pyro.ops.jit
 import pyro.poutine as poutine
 from pyro.distributions.util import eye_like
 from pyro.infer import config_enumerate
@@ -16,7 +18,7 @@ from pyro.infer.mcmc.trace_kernel import TraceKernel
 from pyro.infer.mcmc.util import TraceEinsumEvaluator
 from pyro.ops.integrator import velocity_verlet
 from pyro.poutine.subsample_messenger import _Subsample
-from pyro.util import optional, torch_isinf, torch_isnan, ignore_jit_warnings
+from pyro.util import optional, torch_isinf, torch_isnan
 
 
 class HMC(TraceKernel):
@@ -167,29 +169,31 @@ class HMC(TraceKernel):
 
     def _potential_energy_jit(self, z):
         names, vals = zip(*sorted(z.items()))
-        if self._compiled_potential_fn:
-            return self._compiled_potential_fn(*vals)
-
-        def compiled(*zi):
-            z_constrained = list(zi)
-            # transform to constrained space.
-            for i, name in enumerate(names):
-                if name in self.transforms:
-                    transform = self.transforms[name]
-                    z_constrained[i] = transform.inv(z_constrained[i])
-            z_constrained = dict(zip(names, z_constrained))
-            trace = self._get_trace(z_constrained)
-            potential_energy = -self._compute_trace_log_prob(trace)
-            # adjust by the jacobian for this transformation.
-            for i, name in enumerate(names):
-                if name in self.transforms:
-                    transform = self.transforms[name]
-                    potential_energy += transform.log_abs_det_jacobian(z_constrained[name], zi[i]).sum()
-            return potential_energy
-
-        with pyro.validation_enabled(False), optional(ignore_jit_warnings(), self._ignore_jit_warnings):
-            self._compiled_potential_fn = torch.jit.trace(compiled, vals, check_trace=False)
-        return self._compiled_potential_fn(*vals)
+        if self._compiled_potential_fn is None:
+            weakself = weakref.ref(self)
+
+            @pyro.ops.jit.trace(ignore_warnings=self._ignore_jit_warnings)
+            def compiled(*zi, **kwargs):
+                self = weakself()
+                names = kwargs["names"]
+                z_constrained = list(zi)
+                # transform to constrained space.
+                for i, name in enumerate(names):
+                    if name in self.transforms:
+                        transform = self.transforms[name]
+                        z_constrained[i] = transform.inv(z_constrained[i])
+                z_constrained = dict(zip(names, z_constrained))
+                trace = self._get_trace(z_constrained)
+                potential_energy = -self._compute_trace_log_prob(trace)
+                # adjust by the jacobian for this transformation.
+                for i, name in enumerate(names):
+                    if name in self.transforms:
+                        transform = self.transforms[name]
+                        potential_energy += transform.log_abs_det_jacobian(z_constrained[name], zi[i]).sum()
+                return potential_energy
+
+            self._compiled_potential_fn = compiled
+        return self._compiled_potential_fn(*vals, names=names)
 
     def _energy(self, z, r):
         return self._kinetic_energy(r) + self._potential_energy(z)
@@ -4,7 +4,7 @@ import torch
 from opt_einsum import shared_intermediates
 
 from pyro.distributions.util import broadcast_shape, logsumexp
-from pyro.infer.util import is_validation_enabled
+from pyro.infer.util import get_markov_dims, is_validation_enabled
 from pyro.ops.contract import contract_to_tensor
 from pyro.poutine.subsample_messenger import _Subsample
 from pyro.util import check_site_shape
@@ -156,6 +156,7 @@ class TraceEinsumEvaluator(object):
         self.max_plate_nesting = max_plate_nesting
         # To be populated using the model trace once.
         self._enum_dims = set()
+        self._markov_dims = {}
         self.ordering = {}
         self._populate_cache(model_trace)
 
@@ -179,6 +180,7 @@ class TraceEinsumEvaluator(object):
                                                 for f in site["cond_indep_stack"]
                                                 if f.vectorized)
         self._enum_dims = set(model_trace.symbol_to_dim) - set(model_trace.plate_to_symbol.values())
+        self._markov_dims = get_markov_dims(model_trace)
 
     def _get_log_factors(self, model_trace):
         """
@@ -207,4 +209,5 @@ class TraceEinsumEvaluator(object):
             return model_trace.log_prob_sum()
         log_probs = self._get_log_factors(model_trace)
         with shared_intermediates() as cache:
-            return contract_to_tensor(log_probs, self._enum_dims, cache=cache)
+            return contract_to_tensor(log_probs, self._enum_dims, cache=cache,
+                                      markov_dims=self._markov_dims)
@@ -1,5 +1,7 @@
 from __future__ import absolute_import, division, print_function
 
+from collections import OrderedDict
+
 import torch
 
 import pyro
@@ -7,6 +9,8 @@ import pyro.poutine as poutine
 from pyro.infer.abstract_infer import TracePosterior
 from pyro.infer.elbo import ELBO
 from pyro.infer.util import torch_item
+from pyro.optim.fused import get_fused_update
+from pyro.util import ignore_jit_warnings, optional
 
 
 class SVI(TracePosterior):
@@ -109,3 +113,120 @@ class SVI(TracePosterior):
         pyro.infer.util.zero_grads(params)
 
         return torch_item(loss)
+
+
+class JitSVI(SVI):
+    """
+    Like :class:`SVI` but compiles the optimizer step.
+
+    All params are stored as views of a single flat tensor, and their
+    gradients as views of a single flat gradient, so that the update of the
+    optimizer and the zeroing of gradients run as one compiled graph over the
+    flat tensors, rather than one optimizer step per param. The graph is
+    re-traced only when the set of params changes. Since autograd cannot be
+    traced, gradients are computed by ``loss_and_grads`` between the compiled
+    loss, e.g. of :class:`~pyro.infer.trace_elbo.JitTrace_ELBO`, and the
+    compiled update.
+
+    This works only for a limited set of optimizers and params:
+
+    -   ``optim`` must wrap :class:`torch.optim.SGD`, :class:`torch.optim.Adam`
+        or :class:`~pyro.optim.clipped_adam.ClippedAdam` with a dict of optim
+        args. See :func:`~pyro.optim.fused.get_fused_update`.
+    -   All params must have the same dtype and device.
+    -   All params seen in a step are updated, even if their gradients are
+        zero.
+    -   Optimizer state is held by this object rather than by ``optim``, so
+        :meth:`~pyro.optim.optim.PyroOptim.get_state` does not include it.
+
+    :param bool ignore_jit_warnings: Flag to ignore warnings from the JIT
+        tracer. Defaults to False.
+    """
+    def __init__(self, model, guide, optim, loss, ignore_jit_warnings=False, **kwargs):
+        super(JitSVI, self).__init__(model, guide, optim, loss, **kwargs)
+        self.ignore_jit_warnings = ignore_jit_warnings
+        self._state_names, self._update = get_fused_update(optim)
+        self._layout = OrderedDict()
+        self._grads = OrderedDict()
+        self._flat_param = None
+        self._flat_grad = None
+        self._flat_state = ()
+        self._compiled_step = None
+
+    def step(self, *args, **kwargs):
+        """
+        :returns: estimate of the loss
+        :rtype: float
+
+        Take a gradient step on the loss function (and any auxiliary loss functions
+        generated under the hood by `loss_and_grads`).
+        Any args or kwargs are passed to the model and guide
+        """
+        # get loss and compute gradients
+        with poutine.trace(param_only=True) as param_capture:
+            loss = self.loss_and_grads(self.model, self.guide, *args, **kwargs)
+
+        params = OrderedDict((name, site["value"].unconstrained())
+                             for name, site in param_capture.trace.nodes.items())
+
+        if (len(params) != len(self._layout) or
+                any(self._layout.get(name, (None,))[0] is not p for name, p in params.items())):
+            # the set of params changed, so flatten them and re-trace the step
+            self._setup(params)
+        else:
+            for name, p in params.items():
+                grad = self._grads[name]
+                if p.grad is not grad:
+                    # the gradient was replaced, e.g. by pyro.infer.util.zero_grads
+                    if p.grad is not None:
+                        grad.copy_(p.grad)
+                    p.grad = grad
+
+        # update all params and zero their gradients in one compiled graph
+        self._compiled_step(self._flat_param, self._flat_grad, *self._flat_state)
+
+        return torch_item(loss)
+
+    def _setup(self, params):
+        values = list(params.values())
+        if len(set((p.dtype, p.device) for p in values)) > 1:
+            raise NotImplementedError("JitSVI requires all params to have the same dtype and device")
+        flat_param = torch.cat([p.detach().reshape(-1) for p in values])
+        flat_grad = torch.cat([(p.grad if p.grad is not None else torch.zeros_like(p)).reshape(-1)
+                               for p in values])
+        # the first state tensor counts the steps taken by each element
+        flat_state = tuple(torch.zeros_like(flat_param)
+                           for _ in range(1 + len(self._state_names)))
+
+        layout = OrderedDict()
+        grads = OrderedDict()
+        start = 0
+        for name, p in params.items():
+            end = start + p.numel()
+            layout[name] = p, start, end
+            # carry over optimizer state of params seen before
+            if name in self._layout:
+                _, old_start, old_end = self._layout[name]
+                for state, old_state in zip(flat_state, self._flat_state):
+                    state[start:end] = old_state[old_start:old_end]
+            p.data = flat_param[start:end].view(p.shape)
+            grads[name] = p.grad = flat_grad[start:end].view(p.shape)
+            start = end
+
+        update = self._update
+
+        def fused_step(param, grad, step, *state):
+            update(param, grad, step, *state)
+            grad.zero_()
+            return param
+
+        # trace on copies, since tracing runs the in-place update
+        example = (flat_param.clone(), flat_grad.clone()) + tuple(x.clone() for x in flat_state)
+        with optional(ignore_jit_warnings(), self.ignore_jit_warnings):
+            self._compiled_step = torch.jit.trace(fused_step, example, check_trace=False)
+
+        self._layout = layout
+        self._grads = grads
+        self._flat_param = flat_param
+        self._flat_grad = flat_grad
+        self._flat_state = flat_state
@@ -12,12 +12,13 @@ import pyro
 import pyro.distributions as dist
 import pyro.ops.jit
 import pyro.poutine as poutine
-from pyro.distributions.util import is_identically_zero
+from pyro.distributions.score_parts import ScoreParts
+from pyro.distributions.util import is_identically_zero, logsumexp
 from pyro.infer.elbo import ELBO
 from pyro.infer.enum import get_importance_trace, iter_discrete_escape, iter_discrete_extend
-from pyro.infer.util import Dice, is_validation_enabled
+from pyro.infer.util import Dice, get_markov_dims, is_validation_enabled
 from pyro.ops import packed
-from pyro.ops.contract import contract_tensor_tree, contract_to_tensor
+from pyro.ops.contract import ContractionSchedule, contract_tensor_tree, contract_to_tensor
 from pyro.poutine.enumerate_messenger import EnumerateMessenger
 from pyro.util import check_traceenum_requirements, ignore_jit_warnings, warn_if_nan
 
@@ -57,8 +58,22 @@ def _find_ordinal(trace, site):
                      if f.vectorized)
 
 
+def _get_structure(trace):
+    # Summarizes everything that _plan_model_factors() reads from a trace.
+    return tuple((name, _find_ordinal(trace, site),
+                  getattr(site["packed"]["log_prob"], "_pyro_dims", None),
+                  site["infer"].get("_enumerate_symbol"),
+                  site["infer"].get("_markov_curr"))
+                 for name, site in trace.nodes.items()
+                 if site["type"] == "sample")
+
+
 # TODO move this logic into a poutine
-def _compute_model_factors(model_trace, guide_trace):
+def _plan_model_factors(model_trace, guide_trace):
+    """
+    Computes the static structure of :func:`_compute_model_factors`, referring
+    to model sites by name.
+    """
     # y depends on x iff ordering[x] <= ordering[y]
     # TODO refine this coarse dependency ordering using time.
     ordering = {name: _find_ordinal(trace, site)
@@ -82,44 +97,102 @@ def _compute_model_factors(model_trace, guide_trace):
                 enum_sites.setdefault(ordering[name], []).append(site)
                 enum_dims.update(site["packed"]["log_prob"]._pyro_dims)
     enum_dims -= non_enum_dims
-    log_factors = OrderedDict()
-    scale = 1
+    for t, sites_t in list(enum_sites.items()):
+        # Sites pruned to a single value that depend on no enumerated variable
+        # contribute constant factors, so we treat them as costs.
+        is_const = [site["infer"].get("topk") is not None and
+                    enum_dims.isdisjoint(site["packed"]["log_prob"]._pyro_dims)
+                    for site in sites_t]
+        if any(is_const):
+            cost_sites.setdefault(t, []).extend(site for site, c in zip(sites_t, is_const) if c)
+            enum_sites[t] = [site for site, c in zip(sites_t, is_const) if not c]
+            if not enum_sites[t]:
+                del enum_sites[t]
+    cost_names = OrderedDict()
+    log_factor_names = OrderedDict()  # ordinal -> list of (name, is_cost) pairs
     if not enum_sites:
-        marginal_costs = OrderedDict((t, [site["packed"]["log_prob"] for site in sites_t])
-                                     for t, sites_t in cost_sites.items())
-        return marginal_costs, log_factors, ordering, enum_dims, scale
+        cost_names = OrderedDict((t, [site["name"] for site in sites_t])
+                                 for t, sites_t in cost_sites.items())
+        return ordering, cost_names, log_factor_names, enum_dims
     _check_model_guide_enumeration_constraint(enum_sites, guide_trace)
 
     # Marginalize out all variables that have been enumerated in the model.
-    marginal_costs = OrderedDict()
-    scales = []
     for t, sites_t in cost_sites.items():
         for site in sites_t:
             if enum_dims.isdisjoint(site["packed"]["log_prob"]._pyro_dims):
                 # For sites that do not depend on an enumerated variable, proceed as usual.
-                marginal_costs.setdefault(t, []).append(site["packed"]["log_prob"])
+                cost_names.setdefault(t, []).append(site["name"])
             else:
                 # For sites that depend on an enumerated variable, we need to apply
                 # the mask inside- and the scale outside- of the log expectation.
-                cost = packed.scale_and_mask(site["packed"]["unscaled_log_prob"], mask=site["packed"]["mask"])
-                log_factors.setdefault(t, []).append(cost)
-                scales.append(site["scale"])
-    if log_factors:
+                log_factor_names.setdefault(t, []).append((site["name"], True))
+    if log_factor_names:
         for t, sites_t in enum_sites.items():
             # TODO refine this coarse dependency ordering using time and tensor shapes.
-            if any(t <= u for u in log_factors):
+            if any(t <= u for u in log_factor_names):
                 for site in sites_t:
-                    logprob = site["packed"]["unscaled_log_prob"]
-                    log_factors.setdefault(t, []).append(logprob)
-                    scales.append(site["scale"])
-        scale = _get_common_scale(scales)
-    return marginal_costs, log_factors, ordering, enum_dims, scale
+                    log_factor_names.setdefault(t, []).append((site["name"], False))
+    return ordering, cost_names, log_factor_names, enum_dims
+
 
+def _normalize_topk_sites(guide_trace):
+    # Guide sites enumerated over a pruned support are renormalized over their
+    # top k values, so that the enumerated guide is a proper distribution.
+    for name, site in guide_trace.nodes.items():
+        if site["type"] != "sample" or site["infer"].get("topk") is None:
+            continue
+        enum_dim = site["infer"].get("_enumerate_dim")
+        log_prob = site["unscaled_log_prob"]
+        if enum_dim is None or log_prob.dim() < -enum_dim:
+            continue
+        log_norm = logsumexp(log_prob, dim=enum_dim, keepdim=True)
+        site["unscaled_log_prob"] = log_prob - log_norm
+        log_norm = ScoreParts(log_norm, log_norm, 0.).scale_and_mask(site["scale"], site["mask"])
+        site["score_parts"] = ScoreParts(*(part - norm for part, norm in zip(site["score_parts"], log_norm)))
+        site["log_prob"] = site["score_parts"].log_prob
+        site["log_prob_sum"] = site["log_prob"].sum()
+
+
+def _compute_model_factors(model_trace, guide_trace, plan=None):
+    if plan is None:
+        plan = _plan_model_factors(model_trace, guide_trace)
+    ordering, cost_names, log_factor_names, enum_dims = plan
+
+    marginal_costs = OrderedDict((t, [model_trace.nodes[name]["packed"]["log_prob"] for name in names])
+                                 for t, names in cost_names.items())
+    log_factors = OrderedDict()
+    scales = []
+    for t, names in log_factor_names.items():
+        log_factors_t = log_factors.setdefault(t, [])
+        for name, is_cost in names:
+            site = model_trace.nodes[name]
+            if is_cost:
+                log_factors_t.append(packed.scale_and_mask(site["packed"]["unscaled_log_prob"],
+                                                           mask=site["packed"]["mask"]))
+            else:
+                log_factors_t.append(site["packed"]["unscaled_log_prob"])
+            scales.append(site["scale"])
+    scale = _get_common_scale(scales) if scales else 1
+    return marginal_costs, log_factors, ordering, set(enum_dims), scale
 
-def _compute_dice_elbo(model_trace, guide_trace):
+
+class _DiceElboSchedule(object):
+    """
+    Static schedule of :func:`_compute_dice_elbo` for a fixed structure of
+    model and guide traces, as determined by :func:`_get_structure`. This
+    captures dependency ordering, the roles of model sites, sum dims, markov
+    chains and the sequence of tensor contractions, so that each step merely
+    feeds packed log_prob tensors through precomputed contractions.
+    """
+    def __init__(self, model_trace, guide_trace):
+        self.plan = _plan_model_factors(model_trace, guide_trace)
+        self.contract = ContractionSchedule(set(self.plan[3]), markov_dims=get_markov_dims(model_trace))
+
+
+def _compute_dice_elbo(model_trace, guide_trace, schedule=None):
     # Accumulate marginal model costs.
     marginal_costs, log_factors, ordering, sum_dims, scale = _compute_model_factors(
-            model_trace, guide_trace)
+            model_trace, guide_trace, None if schedule is None else schedule.plan)
     if log_factors:
         # Note that while most applications of tensor message passing use the
         # contract_to_tensor() interface and can be easily refactored to use ubersum(),
@@ -130,7 +203,11 @@ def _compute_dice_elbo(model_trace, guide_trace):
         # replace contract_tensor_tree() with a RaggedTensor -> RaggedTensor contraction
         # that preserves some dependency structure.
         with shared_intermediates() as cache:
-            log_factors = contract_tensor_tree(log_factors, sum_dims, cache=cache)
+            if schedule is None:
+                log_factors = contract_tensor_tree(log_factors, sum_dims, cache=cache,
+                                                   markov_dims=get_markov_dims(model_trace))
+            else:
+                log_factors = schedule.contract(log_factors, cache=cache)
         for t, log_factors_t in log_factors.items():
             marginal_costs_t = marginal_costs.setdefault(t, [])
             for term in log_factors_t:
@@ -158,6 +235,7 @@ def _compute_marginals(model_trace, guide_trace):
     args = _compute_model_factors(model_trace, guide_trace)
     marginal_costs, log_factors, ordering, sum_dims, scale = args
 
+    markov_dims = get_markov_dims(model_trace)
     marginal_dists = OrderedDict()
     with shared_intermediates() as cache:
         for name, site in model_trace.nodes.items():
@@ -166,12 +244,15 @@ def _compute_marginals(model_trace, guide_trace):
                     site["infer"].get("_enumerate_dim") is None):
                 continue
 
+            if site["infer"].get("topk") is not None:
+                raise NotImplementedError("compute_marginals does not support topk enumeration, "
+                                          "but found topk at site '{}'".format(name))
             enum_dim = site["infer"]["_enumerate_dim"]
             enum_symbol = site["infer"]["_enumerate_symbol"]
             ordinal = _find_ordinal(model_trace, site)
             logits = contract_to_tensor(log_factors, sum_dims,
                                         target_ordinal=ordinal, target_dims={enum_symbol},
-                                        cache=cache)
+                                        cache=cache, markov_dims=markov_dims)
             logits = packed.unpack(logits, model_trace.symbol_to_dim)
             logits = logits.unsqueeze(-1).transpose(-1, enum_dim - 1)
             while logits.shape[0] == 1:
@@ -190,6 +271,7 @@ class BackwardSampleMessenger(pyro.poutine.messenger.Messenger):
         args = _compute_model_factors(enum_trace, guide_trace)
         self.log_factors = args[1]
         self.sum_dims = args[3]
+        self.markov_dims = get_markov_dims(enum_trace)
 
     def __enter__(self):
         self.cache = {}
@@ -207,12 +289,15 @@ class BackwardSampleMessenger(pyro.poutine.messenger.Messenger):
         enum_symbol = enum_msg["infer"].get("_enumerate_symbol")
         if enum_symbol is None:
             return
+        if enum_msg["infer"].get("topk") is not None:
+            raise NotImplementedError("sample_posterior does not support topk enumeration, "
+                                      "but found topk at site '{}'; try infer_discrete".format(msg["name"]))
         enum_dim = enum_msg["infer"]["_enumerate_dim"]
         with shared_intermediates(self.cache):
             ordinal = _find_ordinal(self.enum_trace, msg)
             logits = contract_to_tensor(self.log_factors, self.sum_dims,
                                         target_ordinal=ordinal, target_dims={enum_symbol},
-                                        cache=self.cache)
+                                        cache=self.cache, markov_dims=self.markov_dims)
             logits = packed.unpack(logits, self.enum_trace.symbol_to_dim)
             logits = logits.unsqueeze(-1).transpose(-1, enum_dim - 1)
             while logits.shape[0] == 1:
@@ -248,10 +333,59 @@ class TraceEnum_ELBO(ELBO):
     site in the ``model``, mark the site ``infer={'enumerate': 'parallel'}``
     and ensure the site does not appear in the ``guide``.
 
+    To approximately enumerate over only the ``k`` most probable values of a
+    site with a large support, additionally mark the site
+    ``infer={'enumerate': 'parallel', 'topk': k}``. Model sites are pruned by
+    their local factors, yielding a lower bound on the fully enumerated
+    objective, and guide sites are pruned by and renormalized over the pruned
+    support of the guide.
+
     This assumes restricted dependency structure on the model and guide:
     variables outside of an :class:`~pyro.plate` can never depend on
     variables inside that :class:`~pyro.plate`.
+
+    The tensor contraction schedule of each model and guide structure is
+    compiled on its first step and reused in later steps. Schedules are kept
+    in an LRU cache of at most ``max_schedules`` structures, so models whose
+    structure changes between steps do not accumulate schedules.
+
+    :param int max_schedules: the maximum number of cached contraction
+        schedules, or None for an unbounded cache. Defaults to 16.
     """
+    def __init__(self,
+                 num_particles=1,
+                 max_plate_nesting=float('inf'),
+                 max_iarange_nesting=None,  # DEPRECATED
+                 vectorize_particles=False,
+                 strict_enumeration_warning=True,
+                 ignore_jit_warnings=False,
+                 retain_graph=None,
+                 max_schedules=16):
+        super(TraceEnum_ELBO, self).__init__(num_particles=num_particles,
+                                             max_plate_nesting=max_plate_nesting,
+                                             max_iarange_nesting=max_iarange_nesting,
+                                             vectorize_particles=vectorize_particles,
+                                             strict_enumeration_warning=strict_enumeration_warning,
+                                             ignore_jit_warnings=ignore_jit_warnings,
+                                             retain_graph=retain_graph)
+        self.max_schedules = max_schedules
+        self._schedules = OrderedDict()
+
+    def _get_schedule(self, model_trace, guide_trace):
+        """
+        Returns a compiled schedule for the structure of the given traces,
+        building it on first use.
+        """
+        key = _get_structure(model_trace), _get_structure(guide_trace)
+        schedule = self._schedules.pop(key, None)
+        if schedule is None:
+            schedule = _DiceElboSchedule(model_trace, guide_trace)
+        if self.max_schedules != 0:
+            self._schedules[key] = schedule
+        if self.max_schedules is not None:
+            while len(self._schedules) > self.max_schedules:
+                self._schedules.popitem(last=False)
+        return schedule
 
     def _get_trace(self, model, guide, *args, **kwargs):
         """
@@ -260,6 +394,7 @@ class TraceEnum_ELBO(ELBO):
         """
         model_trace, guide_trace = get_importance_trace(
             "flat", self.max_plate_nesting, model, guide, *args, **kwargs)
+        _normalize_topk_sites(guide_trace)
 
         if is_validation_enabled():
             check_traceenum_requirements(model_trace, guide_trace)
@@ -316,7 +451,8 @@ class TraceEnum_ELBO(ELBO):
         """
         elbo = 0.0
         for model_trace, guide_trace in self._get_traces(model, guide, *args, **kwargs):
-            elbo_particle = _compute_dice_elbo(model_trace, guide_trace)
+            schedule = self._get_schedule(model_trace, guide_trace)
+            elbo_particle = _compute_dice_elbo(model_trace, guide_trace, schedule)
             if is_identically_zero(elbo_particle):
                 continue
 
@@ -339,7 +475,8 @@ class TraceEnum_ELBO(ELBO):
         """
         elbo = 0.0
         for model_trace, guide_trace in self._get_traces(model, guide, *args, **kwargs):
-            elbo_particle = _compute_dice_elbo(model_trace, guide_trace)
+            schedule = self._get_schedule(model_trace, guide_trace)
+            elbo_particle = _compute_dice_elbo(model_trace, guide_trace, schedule)
             if is_identically_zero(elbo_particle):
                 continue
 
@@ -363,7 +500,8 @@ class TraceEnum_ELBO(ELBO):
         """
         elbo = 0.0
         for model_trace, guide_trace in self._get_traces(model, guide, *args, **kwargs):
-            elbo_particle = _compute_dice_elbo(model_trace, guide_trace)
+            schedule = self._get_schedule(model_trace, guide_trace)
+            elbo_particle = _compute_dice_elbo(model_trace, guide_trace, schedule)
             if is_identically_zero(elbo_particle):
                 continue
 
@@ -450,7 +588,8 @@ class JitTraceEnum_ELBO(TraceEnum_ELBO):
                 self = weakself()
                 elbo = 0.0
                 for model_trace, guide_trace in self._get_traces(model, guide, *args, **kwargs):
-                    elbo = elbo + _compute_dice_elbo(model_trace, guide_trace)
+                    schedule = self._get_schedule(model_trace, guide_trace)
+                    elbo = elbo + _compute_dice_elbo(model_trace, guide_trace, schedule)
                 return elbo * (-1.0 / self.num_particles)
 
             self._differentiable_loss = differentiable_loss
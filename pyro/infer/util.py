@@ -82,6 +82,29 @@ def get_plate_stacks(trace):
             if node["type"] == "sample" and not site_is_subsample(node)}
 
 
+def get_markov_dims(trace):
+    """
+    This builds a dict mapping the symbol of each :class:`~pyro.markov_plate`
+    in a packed trace to a pair ``(prev_dims, curr_dims)`` of strings of the
+    enumeration symbols of previous and current values of its chain sites.
+    This information is used by :func:`~pyro.ops.contract.contract_tensor_tree`
+    to eliminate markov chains.
+    """
+    markov_dims = {}
+    for name, node in trace.nodes.items():
+        if node["type"] != "sample" or "_markov_plate" not in node["infer"]:
+            continue
+        curr_node = trace.nodes.get(node["infer"]["_markov_curr"])
+        if curr_node is None or curr_node["infer"].get("_enumerate_symbol") is None:
+            raise ValueError("Expected markov_plate('{}') site '{}' to be enumerated in parallel"
+                             .format(node["infer"]["_markov_plate"], node["infer"]["_markov_curr"]))
+        step = trace.plate_to_symbol[node["infer"]["_markov_plate"]]
+        prev_dims, curr_dims = markov_dims.get(step, ('', ''))
+        markov_dims[step] = (prev_dims + node["infer"]["_enumerate_symbol"],
+                             curr_dims + curr_node["infer"]["_enumerate_symbol"])
+    return markov_dims
+
+
 class MultiFrameTensor(dict):
     """
     A container for sums of Tensors among different :class:`plate` contexts.
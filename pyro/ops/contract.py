@@ -68,7 +68,7 @@ def _partition_terms(ring, terms, dims):
     return components
 
 
-def _contract_component(ring, tensor_tree, sum_dims, target_dims):
+def _contract_component(ring, tensor_tree, sum_dims, target_dims, markov_dims=None):
     """
     Contract out ``sum_dims - target_dims`` in a tree of tensors in-place, via
     message passing. This reduces all tensors down to a single tensor in the
@@ -86,9 +86,21 @@ def _contract_component(ring, tensor_tree, sum_dims, target_dims):
         dimensions from product-contraction dimensions.
     :param set target_dims: An subset of ``sum_dims`` that should be preserved
         in the result.
+    :param dict markov_dims: An optional dict mapping each batch dim of a
+        markov chain to a pair ``(prev_dims, curr_dims)`` of strings of sum
+        dims denoting the previous and current state at each step.
     :return: a pair ``(ordinal, tensor)``
     :rtype: tuple of frozenset and torch.Tensor
     """
+    # Find markov chains in this component.
+    chains = {}
+    for step, (prev_dims, curr_dims) in (markov_dims or {}).items():
+        chain_dims = set(prev_dims + curr_dims)
+        if chain_dims <= sum_dims:
+            if chain_dims & target_dims:
+                raise NotImplementedError('markov chain dims cannot be preserved in the result')
+            chains[step] = prev_dims, curr_dims
+
     # Group sum dims by ordinal.
     dim_to_ordinal = {}
     for t, terms in tensor_tree.items():
@@ -103,7 +115,7 @@ def _contract_component(ring, tensor_tree, sum_dims, target_dims):
     local_terms = []
     local_dims = target_dims.copy()
     local_ordinal = frozenset()
-    min_ordinal = frozenset.intersection(*tensor_tree)
+    min_ordinal = frozenset.intersection(*tensor_tree) - frozenset(chains)
     while any(dims_tree.values()):
         # Arbitrarily deterministically choose a leaf.
         leaf = max(tensor_tree, key=len)
@@ -113,6 +125,22 @@ def _contract_component(ring, tensor_tree, sum_dims, target_dims):
         # Split terms at the current ordinal into connected components.
         for terms, dims in _partition_terms(ring, leaf_terms, leaf_dims):
 
+            # Eliminate markov chains via a sumproduct contraction of each step,
+            # followed by a product contraction along steps.
+            step = next((step for step in sorted(leaf.intersection(chains))
+                         if set(''.join(chains[step])) <= dims), None)
+            if step is not None:
+                prev_dims, curr_dims = chains[step]
+                chain_dims = set(prev_dims + curr_dims)
+                if chain_dims & local_dims:
+                    raise NotImplementedError('markov chain dims cannot be preserved in the result')
+                term = ring.sumproduct(terms, dims - chain_dims - local_dims)
+                term = ring.markov_product(term, step, prev_dims, curr_dims)
+                parent = leaf - frozenset(step)
+                dims_tree[parent] |= chain_dims
+                tensor_tree.setdefault(parent, []).append(term)
+                continue
+
             # Eliminate sum dims via a sumproduct contraction.
             term = ring.sumproduct(terms, dims - local_dims)
 
@@ -149,7 +177,8 @@ def _contract_component(ring, tensor_tree, sum_dims, target_dims):
     return ordinal, term
 
 
-def contract_tensor_tree(tensor_tree, sum_dims, cache=None, ring=None):
+def contract_tensor_tree(tensor_tree, sum_dims, cache=None, ring=None, markov_dims=None,
+                         memory_limit=None):
     """
     Contract out ``sum_dims`` in a tree of tensors via message passing.
     This partially contracts out plate dimensions.
@@ -165,6 +194,12 @@ def contract_tensor_tree(tensor_tree, sum_dims, cache=None, ring=None):
         cache.
     :param pyro.ops.rings.Ring ring: an optional algebraic ring defining tensor
         operations.
+    :param dict markov_dims: An optional dict mapping each batch dim of a
+        markov chain to a pair ``(prev_dims, curr_dims)`` of strings of sum
+        dims denoting the previous and current state at each step.
+    :param int memory_limit: An optional bound on the number of elements of
+        intermediate tensors of the default ring's sum-product contractions,
+        which are otherwise computed in slices. Ignored if a ``ring`` is given.
     :returns: A contracted version of ``tensor_tree``
     :rtype: OrderedDict
     """
@@ -172,7 +207,7 @@ def contract_tensor_tree(tensor_tree, sum_dims, cache=None, ring=None):
     assert isinstance(sum_dims, set)
 
     if ring is None:
-        ring = LogRing(cache)
+        ring = LogRing(cache, memory_limit=memory_limit)
 
     ordinals = {term: t for t, terms in tensor_tree.items() for term in terms}
     all_terms = [term for terms in tensor_tree.values() for term in terms]
@@ -185,14 +220,145 @@ def contract_tensor_tree(tensor_tree, sum_dims, cache=None, ring=None):
             component.setdefault(ordinals[term], []).append(term)
 
         # Contract this connected component down to a single tensor.
-        ordinal, term = _contract_component(ring, component, dims, set())
+        ordinal, term = _contract_component(ring, component, dims, set(), markov_dims)
         contracted_tree.setdefault(ordinal, []).append(term)
 
     return contracted_tree
 
 
+class _RecordingRing(object):
+    """
+    Wrapper around a :class:`~pyro.ops.rings.Ring` that records a program of
+    ring operations, referring to tensors by their position in a list of slots
+    initially holding the input terms.
+    """
+    def __init__(self, ring, terms):
+        self.ring = ring
+        self.slots = list(terms)  # keeps tensors alive so that ids are not reused
+        self.slot_ids = {id(term): i for i, term in reversed(list(enumerate(terms)))}
+        self.program = []
+
+    def _encode(self, arg):
+        if isinstance(arg, torch.Tensor):
+            return _Slot(self.slot_ids[id(arg)])
+        if isinstance(arg, list):
+            return [self._encode(x) for x in arg]
+        return arg
+
+    def _record(self, name, *args):
+        result = getattr(self.ring, name)(*args)
+        results = result if isinstance(result, tuple) else (result,)
+        for term in results:
+            self.slot_ids[id(term)] = len(self.slots)
+            self.slots.append(term)
+        outputs = tuple(range(len(self.slots) - len(results), len(self.slots)))
+        self.program.append((name, [self._encode(arg) for arg in args], outputs))
+        return result
+
+    def sumproduct(self, terms, dims):
+        return self._record('sumproduct', terms, dims)
+
+    def product(self, term, ordinal):
+        return self._record('product', term, ordinal)
+
+    def broadcast(self, term, ordinal):
+        return self._record('broadcast', term, ordinal)
+
+    def inv(self, term):
+        return self._record('inv', term)
+
+    def markov_product(self, term, step_dim, prev_dims, curr_dims):
+        return self._record('markov_product', term, step_dim, prev_dims, curr_dims)
+
+    def global_local(self, term, dims, ordinal):
+        return self._record('global_local', term, dims, ordinal)
+
+
+class _Slot(int):
+    pass
+
+
+def _decode(arg, slots):
+    if isinstance(arg, _Slot):
+        return slots[arg]
+    if isinstance(arg, list):
+        return [_decode(x, slots) for x in arg]
+    return arg
+
+
+class ContractionSchedule(object):
+    """
+    Compiled version of :func:`contract_tensor_tree` for repeated contractions
+    of tensor trees with fixed structure, e.g. in each step of
+    :class:`~pyro.infer.traceenum_elbo.TraceEnum_ELBO`.
+
+    The first contraction of each tree structure (ordinals and ``._pyro_dims``
+    of terms) records the sequence of ring operations performed by
+    :func:`contract_tensor_tree`. Later contractions of the same structure
+    replay that sequence, skipping the partitioning of terms and construction
+    of the message passing tree. The following are equivalent::
+
+        schedule = ContractionSchedule(sum_dims)
+        contracted_tree = schedule(tensor_tree, cache=cache)
+
+        contracted_tree = contract_tensor_tree(tensor_tree, sum_dims, cache=cache)
+
+    :param set sum_dims: the complete set of sum-contractions dimensions
+        (indexed from the right). This is needed to distinguish sum-contraction
+        dimensions from product-contraction dimensions.
+    :param dict markov_dims: An optional dict mapping each batch dim of a
+        markov chain to a pair ``(prev_dims, curr_dims)`` of strings of sum
+        dims denoting the previous and current state at each step.
+    """
+    def __init__(self, sum_dims, markov_dims=None):
+        assert isinstance(sum_dims, set)
+        self.sum_dims = frozenset(sum_dims)
+        self.markov_dims = markov_dims
+        self._programs = {}
+
+    def __call__(self, tensor_tree, cache=None, ring=None):
+        """
+        :param OrderedDict tensor_tree: a dictionary mapping ordinals to lists
+            of tensors. An ordinal is a frozenset of ``CondIndepStack`` frames.
+        :param dict cache: an optional :func:`~opt_einsum.shared_intermediates`
+            cache.
+        :param pyro.ops.rings.Ring ring: an optional algebraic ring defining
+            tensor operations.
+        :returns: A contracted version of ``tensor_tree``
+        :rtype: OrderedDict
+        """
+        assert isinstance(tensor_tree, OrderedDict)
+        if ring is None:
+            ring = LogRing(cache)
+        terms = [term for terms in tensor_tree.values() for term in terms]
+
+        # Tensors are identified by position, so structure includes aliasing.
+        first_positions = {}
+        key = tuple((ordinal, tuple((term._pyro_dims, first_positions.setdefault(id(term), len(first_positions)))
+                                    for term in terms))
+                    for ordinal, terms in tensor_tree.items())
+        program = self._programs.get(key)
+        if program is None:
+            recorder = _RecordingRing(ring, terms)
+            contracted_tree = contract_tensor_tree(tensor_tree, set(self.sum_dims), ring=recorder,
+                                                   markov_dims=self.markov_dims)
+            outputs = OrderedDict((ordinal, [recorder.slot_ids[id(term)] for term in terms])
+                                  for ordinal, terms in contracted_tree.items())
+            self._programs[key] = recorder.program, outputs
+            return contracted_tree
+
+        # Replay the recorded ring operations.
+        operations, outputs = program
+        slots = terms
+        for name, args, results in operations:
+            result = getattr(ring, name)(*(_decode(arg, slots) for arg in args))
+            slots.extend(result if len(results) > 1 else (result,))
+        return OrderedDict((ordinal, [slots[i] for i in positions])
+                           for ordinal, positions in outputs.items())
+
+
 def contract_to_tensor(tensor_tree, sum_dims, target_ordinal=None, target_dims=None,
-                       cache=None, ring=None):
+                       cache=None, ring=None, markov_dims=None, memory_limit=None):
     """
     Contract out ``sum_dims`` in a tree of tensors, via message
     passing. This reduces all terms down to a single tensor in the plate
@@ -214,6 +380,12 @@ def contract_to_tensor(tensor_tree, sum_dims, target_ordinal=None, target_dims=N
         cache.
     :param pyro.ops.rings.Ring ring: an optional algebraic ring defining tensor
         operations.
+    :param dict markov_dims: An optional dict mapping each batch dim of a
+        markov chain to a pair ``(prev_dims, curr_dims)`` of strings of sum
+        dims denoting the previous and current state at each step.
+    :param int memory_limit: An optional bound on the number of elements of
+        intermediate tensors of the default ring's sum-product contractions,
+        which are otherwise computed in slices. Ignored if a ``ring`` is given.
     :returns: a single tensor
     :rtype: torch.Tensor
     """
@@ -226,7 +398,7 @@ def contract_to_tensor(tensor_tree, sum_dims, target_ordinal=None, target_dims=N
     assert isinstance(target_ordinal, frozenset)
     assert isinstance(target_dims, set) and target_dims <= sum_dims
     if ring is None:
-        ring = LogRing(cache)
+        ring = LogRing(cache, memory_limit=memory_limit)
 
     ordinals = {term: t for t, terms in tensor_tree.items() for term in terms}
     all_terms = [term for terms in tensor_tree.values() for term in terms]
@@ -242,7 +414,7 @@ def contract_to_tensor(tensor_tree, sum_dims, target_ordinal=None, target_dims=N
             component.setdefault(ordinals[term], []).append(term)
 
         # Contract this connected component down to a single tensor.
-        ordinal, term = _contract_component(ring, component, dims, target_dims & dims)
+        ordinal, term = _contract_component(ring, component, dims, target_dims & dims, markov_dims)
         _check_batch_dims_are_sensible(target_dims.intersection(term._pyro_dims),
                                        ordinal - target_ordinal)
 
@@ -333,6 +505,21 @@ def ubersum(equation, *operands, **kwargs):
         each result batch, which can significantly reduce computation. This is
         safe to set whenever each result batch denotes a nonnormalized
         probability distribution whose total is not of interest.
+    :param dict markov_dims: An optional dict mapping some ``batch_dims`` to
+        markov chains. Each entry ``step: (prev_dims, curr_dims)`` declares
+        that sum dims ``prev_dims`` at each slice of ``step`` are identified
+        with sum dims ``curr_dims`` at the previous slice, so that e.g. the
+        following are equivalent::
+
+            z = ubersum('iab->', x, batch_dims='i', markov_dims={'i': ('a', 'b')})
+
+            z = contract('ab,bc,cd->', *x, backend=backend)
+
+        These are contracted by a parallel scan along ``step``.
+    :param int memory_limit: An optional bound on the number of elements of
+        intermediate tensors. Sum-product contractions exceeding this bound
+        are computed in slices of their largest sum dims, accumulating partial
+        results in the ring of the ``backend``.
     :return: a tuple of tensors of requested shape, one entry per output.
     :rtype: tuple
     :raises ValueError: if tensor sizes mismatch or an output requests a
@@ -345,6 +532,8 @@ def ubersum(equation, *operands, **kwargs):
     batch_dims = kwargs.pop('batch_dims', '')
     backend = kwargs.pop('backend', 'pyro.ops.einsum.torch_log')
     modulo_total = kwargs.pop('modulo_total', False)
+    markov_dims = kwargs.pop('markov_dims', None)
+    memory_limit = kwargs.pop('memory_limit', None)
     try:
         Ring = BACKEND_TO_RING[backend]
     except KeyError:
@@ -388,13 +577,13 @@ def ubersum(equation, *operands, **kwargs):
     # Compute outputs, sharing intermediate computations.
     results = []
     with shared_intermediates(cache) as cache:
-        ring = Ring(cache, dim_to_size=dim_to_size)
+        ring = Ring(cache, dim_to_size=dim_to_size, memory_limit=memory_limit)
         for output in outputs:
             sum_dims = set(output).union(*inputs) - set(batch_dims)
             term = contract_to_tensor(tensor_tree, sum_dims,
                                       target_ordinal=batch_dims.intersection(output),
                                       target_dims=sum_dims.intersection(output),
-                                      ring=ring)
+                                      ring=ring, markov_dims=markov_dims)
             if term._pyro_dims != output:
                 term = term.permute(*map(term._pyro_dims.index, output))
                 term._pyro_dims = output
@@ -1,10 +1,113 @@
 from __future__ import absolute_import, division, print_function
 
+import json
+from collections import OrderedDict, namedtuple
+
 import opt_einsum
+from opt_einsum.helpers import flop_count
 
 from pyro.util import ignore_jit_warnings
 
-_PATH_CACHE = {}
+PathCacheInfo = namedtuple('PathCacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+ContractionPlan = namedtuple('ContractionPlan', ['equation', 'shapes', 'path', 'flops', 'largest_intermediate'])
+
+
+class _PathCache(object):
+    """
+    LRU cache of contraction expressions, keyed on equation, shapes and
+    optimizer kwargs. Each entry keeps its optimized contraction path, so that
+    entries loaded from a file are rebuilt without re-optimizing the path.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> [expr or None, path]
+
+    def get(self, equation, shapes, kwargs):
+        key = equation, tuple(map(tuple, shapes)), tuple(sorted(kwargs.items()))
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            expr = opt_einsum.contract_expression(equation, *shapes, **kwargs)
+            entry = [expr, [tuple(step[0]) for step in expr.contraction_list]]
+        else:
+            self.hits += 1
+            if entry[0] is None:
+                kwargs = dict(kwargs, optimize=entry[1])
+                entry[0] = opt_einsum.contract_expression(equation, *shapes, **kwargs)
+        self._entries[key] = entry
+        self._evict()
+        return entry[0]
+
+    def _evict(self):
+        if self.maxsize is None:
+            return
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def info(self):
+        return PathCacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._entries))
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def plans(self):
+        plans = []
+        for (equation, shapes, _), (_, path) in self._entries.items():
+            flops, largest_intermediate = _estimate_cost(equation, shapes, path)
+            plans.append(ContractionPlan(equation, shapes, path, flops, largest_intermediate))
+        return plans
+
+    def save(self, filename):
+        entries = [{'equation': equation, 'shapes': shapes, 'kwargs': kwargs, 'path': path}
+                   for (equation, shapes, kwargs), (_, path) in self._entries.items()]
+        with open(filename, 'w') as f:
+            json.dump(entries, f)
+
+    def load(self, filename):
+        with open(filename) as f:
+            entries = json.load(f)
+        for entry in entries:
+            key = (entry['equation'],
+                   tuple(map(tuple, entry['shapes'])),
+                   tuple(tuple(item) for item in entry['kwargs']))
+            if key not in self._entries:
+                self._entries[key] = [None, [tuple(step) for step in entry['path']]]
+        self._evict()
+
+
+def _estimate_cost(equation, shapes, path):
+    """
+    Estimates the number of floating point operations and the number of
+    elements of the largest intermediate tensor of a contraction path,
+    following :func:`opt_einsum.contract_path`.
+    """
+    inputs, output = equation.split('->')
+    inputs = inputs.split(',')
+    sizes = {dim: size for dims, shape in zip(inputs, shapes) for dim, size in zip(dims, shape)}
+    flops = 0
+    largest_intermediate = 0
+    for step in path:
+        contracted = [inputs[i] for i in sorted(step, reverse=True)]
+        for i in sorted(step, reverse=True):
+            del inputs[i]
+        dims = set(''.join(contracted))
+        remaining = set(''.join(inputs)) | set(output)
+        result = ''.join(sorted(dims & remaining))
+        flops += flop_count(dims, bool(dims - remaining), len(contracted), sizes)
+        intermediate = 1
+        for dim in result:
+            intermediate *= sizes[dim]
+        largest_intermediate = max(largest_intermediate, intermediate)
+        inputs.append(result)
+    return flops, largest_intermediate
+
+
+_PATH_CACHE = _PathCache()
 
 
 def contract_expression(equation, *shapes, **kwargs):
@@ -12,21 +115,17 @@ def contract_expression(equation, *shapes, **kwargs):
     Wrapper around :func:`opt_einsum.contract_expression` that optionally uses
     Pyro's cheap optimizer and optionally caches contraction paths.
 
+    Cached paths are kept in a bounded LRU cache, see
+    :func:`set_path_cache_size`.
+
     :param bool cache_path: whether to cache the contraction path.
         Defaults to True.
     """
     # memoize the contraction path
     cache_path = kwargs.pop('cache_path', True)
     if cache_path:
-        kwargs_key = tuple(kwargs.items())
-        key = equation, shapes, kwargs_key
-        if key in _PATH_CACHE:
-            return _PATH_CACHE[key]
-
-    expr = opt_einsum.contract_expression(equation, *shapes, **kwargs)
-    if cache_path:
-        _PATH_CACHE[key] = expr
-    return expr
+        return _PATH_CACHE.get(equation, shapes, kwargs)
+    return opt_einsum.contract_expression(equation, *shapes, **kwargs)
 
 
 def contract(equation, *operands, **kwargs):
@@ -45,4 +144,78 @@ def contract(equation, *operands, **kwargs):
         return expr(*operands, backend=backend, out=out)
 
 
-__all__ = ['contract', 'contract_expression']
+def set_path_cache_size(maxsize):
+    """
+    Sets the maximum number of contraction paths cached by
+    :func:`contract_expression`, evicting least recently used paths as needed.
+
+    :param maxsize: the maximum number of cached paths, or None for an
+        unbounded cache. Defaults to 1024.
+    :type maxsize: int or None
+    """
+    _PATH_CACHE.maxsize = maxsize
+    _PATH_CACHE._evict()
+
+
+def path_cache_info():
+    """
+    Returns statistics of the contraction path cache.
+
+    :returns: a namedtuple ``(hits, misses, evictions, maxsize, currsize)``
+    :rtype: PathCacheInfo
+    """
+    return _PATH_CACHE.info()
+
+
+def clear_path_cache():
+    """
+    Clears the contraction path cache and resets its statistics.
+    """
+    _PATH_CACHE.clear()
+
+
+def path_cache_plans():
+    """
+    Returns the cached contraction plans, from least to most recently used,
+    together with their estimated cost.
+
+    :returns: a list of namedtuples ``(equation, shapes, path, flops,
+        largest_intermediate)``, where ``flops`` is the estimated number of
+        floating point operations and ``largest_intermediate`` is the number of
+        elements of the largest intermediate tensor.
+    :rtype: list
+    """
+    return _PATH_CACHE.plans()
+
+
+def save_path_cache(filename):
+    """
+    Saves cached contraction paths to a JSON file, to be loaded by
+    :func:`load_path_cache` e.g. in a new process.
+
+    :param str filename: the path of the file to write.
+    """
+    _PATH_CACHE.save(filename)
+
+
+def load_path_cache(filename):
+    """
+    Loads contraction paths saved by :func:`save_path_cache`, so that
+    subsequent contractions of those equations and shapes skip path
+    optimization. Paths that are already cached are kept.
+
+    :param str filename: the path of the file to read.
+    """
+    _PATH_CACHE.load(filename)
+
+
+__all__ = [
+    'clear_path_cache',
+    'contract',
+    'contract_expression',
+    'load_path_cache',
+    'path_cache_info',
+    'path_cache_plans',
+    'save_path_cache',
+    'set_path_cache_size',
+]
@@ -10,17 +10,20 @@ from pyro.ops import packed
 from pyro.util import jit_iter
 
 SAMPLE_SYMBOL = " "  # must be unique and precede alphanumeric characters
+PARTICLE_SYMBOL = "_"  # must be unique, see particle_sample()
 
 
 @add_metaclass(ABCMeta)
 class Backward(object):
     is_leaf = False
 
-    def __call__(self):
+    def __call__(self, message=None):
         """
         Performs entire backward pass in depth-first order.
+
+        :param torch.Tensor message: an optional initial sample, e.g. a
+            :func:`particle_sample` to draw a batch of samples.
         """
-        message = None
         stack = [(self, message)]
         while stack:
             bwd, message = stack.pop()
@@ -75,6 +78,40 @@ def transpose(a, axes):
     return result
 
 
+def particle_sample(num_samples, device=None):
+    """
+    Creates an initial message for :meth:`Backward.__call__` to draw a batch
+    of ``num_samples`` independent samples in a single backward pass.
+
+    The batch is represented by a packed batch dim ``PARTICLE_SYMBOL`` of all
+    downstream samples, together with a sample dim ``PARTICLE_SYMBOL`` whose
+    index is the identity, so that the batch is passed on to all sites.
+
+    :param int num_samples: the number of samples.
+    :returns: a sample of shape ``(1, num_samples)``
+    :rtype: torch.LongTensor
+    """
+    sample = torch.arange(num_samples, device=device).unsqueeze(0)
+    sample._pyro_dims = SAMPLE_SYMBOL + PARTICLE_SYMBOL
+    sample._pyro_sample_dims = PARTICLE_SYMBOL
+    return sample
+
+
+def broadcast_particles(logits, message):
+    """
+    Broadcasts packed ``logits`` along the particle dim of an upstream
+    ``message``, if any, so that samples are drawn independently for each
+    particle.
+    """
+    if (message is None or PARTICLE_SYMBOL not in message._pyro_sample_dims or
+            PARTICLE_SYMBOL in logits._pyro_dims):
+        return logits
+    num_samples = message.size(message._pyro_dims.index(PARTICLE_SYMBOL))
+    result = logits.expand((num_samples,) + logits.shape)
+    result._pyro_dims = PARTICLE_SYMBOL + logits._pyro_dims
+    return result
+
+
 def einsum_backward_sample(operands, sample1, sample2):
     """
     Cuts down samples to pass on to subsequent steps.
@@ -95,10 +132,15 @@ def einsum_backward_sample(operands, sample1, sample2):
                 index._pyro_dims = sample2._pyro_dims[1:]
                 sample1 = packed.gather(sample1, index, dim)
 
-        # Concatenate the two samples.
-        parts = packed.broadcast_all(sample1, sample2)
-        sample = torch.cat(parts)
-        sample._pyro_dims = parts[0]._pyro_dims
+        # Concatenate the two samples, whose numbers of rows may differ.
+        rows = []
+        for x in (sample1, sample2):
+            for row in jit_iter(x):
+                row._pyro_dims = x._pyro_dims[1:]
+                rows.append(row)
+        rows = packed.broadcast_all(*rows)
+        sample = torch.stack(rows)
+        sample._pyro_dims = SAMPLE_SYMBOL + rows[0]._pyro_dims
         sample._pyro_sample_dims = sample_dims
         assert sample.dim() == len(sample._pyro_dims)
         if not torch._C._get_tracing_state():
@@ -112,6 +154,8 @@ def einsum_backward_sample(operands, sample1, sample2):
             yield x._pyro_backward, None
             continue
         x_sample_dims = set(x._pyro_dims) & set(sample._pyro_sample_dims)
+        if PARTICLE_SYMBOL in sample._pyro_sample_dims:
+            x_sample_dims.add(PARTICLE_SYMBOL)  # pass particles on to all sites
         if not x_sample_dims:
             yield x._pyro_backward, None
             continue
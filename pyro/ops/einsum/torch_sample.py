@@ -7,7 +7,8 @@ from six.moves import reduce
 import pyro.distributions as dist
 import pyro.ops.einsum.torch_log
 from pyro.ops import packed
-from pyro.ops.einsum.adjoint import Backward, einsum_backward_sample, transpose, unflatten
+from pyro.ops.einsum.adjoint import (PARTICLE_SYMBOL, Backward, broadcast_particles, einsum_backward_sample, transpose,
+                                     unflatten)
 from pyro.ops.einsum.util import Tensordot
 from pyro.util import jit_iter
 
@@ -34,9 +35,14 @@ class _EinsumBackward(Backward):
                         x = packed.gather(x, index, dim)
                     operands[i] = x
 
-        # Combine terms.
+        # Combine terms, drawing independent samples for each particle.
+        if PARTICLE_SYMBOL not in batch_dims and any(PARTICLE_SYMBOL in x._pyro_dims for x in operands):
+            batch_dims = PARTICLE_SYMBOL + batch_dims
         dims = batch_dims + contract_dims
         logits = reduce(operator.add, packed.broadcast_all(*operands, dims=dims))
+        logits._pyro_dims = dims
+        logits = broadcast_particles(logits, sample2)
+        batch_dims = logits._pyro_dims[:logits.dim() - len(contract_dims)]
 
         # Sample.
         sample1 = None  # work around lack of pytorch support for zero-sized tensors
@@ -1,8 +1,10 @@
 from __future__ import absolute_import, division, print_function
 
 import argparse
+import timeit
 import warnings
 import weakref
+from collections import OrderedDict, namedtuple
 
 import torch
 
@@ -10,6 +12,9 @@ import pyro
 import pyro.poutine as poutine
 from pyro.util import ignore_jit_warnings, optional
 
+CompileCacheInfo = namedtuple('CompileCacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize',
+                                                   'compile_time', 'run_time'])
+
 
 def _hash(value, allow_id):
     try:
@@ -29,6 +34,12 @@ def _hash(value, allow_id):
         raise e
 
 
+def _signature(value):
+    if torch.is_tensor(value):
+        return tuple(value.shape), value.dtype, value.device
+    return _hash(value, True)
+
+
 def _hashable_args_kwargs(args, kwargs):
     items = sorted(kwargs.items())
     hashable_kwargs = tuple((key, _hash(value, False)) for key, value in items)
@@ -37,7 +48,7 @@ def _hashable_args_kwargs(args, kwargs):
     except TypeError:
         warnings.warn("Failed to hash kwargs; attempting to hash by id.")
         hashable_kwargs = tuple((key, _hash(value, True)) for key, value in items)
-    return len(args), hashable_kwargs
+    return tuple(_signature(arg) for arg in args), hashable_kwargs
 
 
 class CompiledFunction(object):
@@ -47,68 +58,121 @@ class CompiledFunction(object):
     Wrapper around the output of :func:`torch.jit.trace`
     that handles parameter plumbing.
 
-    The actual PyTorch compilation artifact is stored in :attr:`compiled`.
+    Since traces are specialized to the shapes of their inputs, a function is
+    compiled once per distinct shapes, dtypes and devices of ``*args`` and
+    per distinct ``**kwargs``. Compiled traces are kept in an LRU cache of
+    at most ``maxsize`` entries; :meth:`cache_info` reports its statistics.
+
+    The actual PyTorch compilation artifacts are stored in :attr:`compiled`.
     Call diagnostic methods on this attribute.
     """
-    def __init__(self, fn, ignore_warnings=False):
+    def __init__(self, fn, ignore_warnings=False, maxsize=16):
         self.fn = fn
-        self.compiled = {}  # len(args) -> callable
+        self.compiled = OrderedDict()  # signature -> callable
         self.ignore_warnings = ignore_warnings
-        self._param_names = None
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.compile_time = 0.
+        self.run_time = 0.
+        self._param_names = {}  # signature -> list of param names
 
     def __call__(self, *args, **kwargs):
         key = _hashable_args_kwargs(args, kwargs)
 
         # if first time
         if key not in self.compiled:
+            self.misses += 1
+            start = timeit.default_timer()
             # param capture
             with poutine.block():
                 with poutine.trace(param_only=True) as first_param_capture:
                     self.fn(*args, **kwargs)
 
-            self._param_names = list(set(first_param_capture.trace.nodes.keys()))
+            param_names = list(set(first_param_capture.trace.nodes.keys()))
+            self._param_names[key] = param_names
             unconstrained_params = tuple(pyro.param(name).unconstrained()
-                                         for name in self._param_names)
+                                         for name in param_names)
             params_and_args = unconstrained_params + args
             weakself = weakref.ref(self)
 
             def compiled(*params_and_args):
                 self = weakself()
-                unconstrained_params = params_and_args[:len(self._param_names)]
-                args = params_and_args[len(self._param_names):]
+                unconstrained_params = params_and_args[:len(param_names)]
+                args = params_and_args[len(param_names):]
                 constrained_params = {}
-                for name, unconstrained_param in zip(self._param_names, unconstrained_params):
+                for name, unconstrained_param in zip(param_names, unconstrained_params):
                     constrained_param = pyro.param(name)  # assume param has been initialized
                     assert constrained_param.unconstrained() is unconstrained_param
                     constrained_params[name] = constrained_param
                 return poutine.replay(self.fn, params=constrained_params)(*args, **kwargs)
 
             with pyro.validation_enabled(False), optional(ignore_jit_warnings(), self.ignore_warnings):
-                self.compiled[key] = torch.jit.trace(compiled, params_and_args, check_trace=False)
+                compiled_fn = torch.jit.trace(compiled, params_and_args, check_trace=False)
+            self.compiled[key] = compiled_fn
+            self.compile_time += timeit.default_timer() - start
+            self._evict()
         else:
+            self.hits += 1
+            compiled_fn = self.compiled.pop(key)
+            self.compiled[key] = compiled_fn  # mark as most recently used
+            param_names = self._param_names[key]
             unconstrained_params = [pyro.param(name).unconstrained()
-                                    for name in self._param_names]
+                                    for name in param_names]
             params_and_args = unconstrained_params + list(args)
 
-        with poutine.block(hide=self._param_names):
+        start = timeit.default_timer()
+        with poutine.block(hide=param_names):
             with poutine.trace(param_only=True) as param_capture:
-                ret = self.compiled[key](*params_and_args)
+                ret = compiled_fn(*params_and_args)
+        self.run_time += timeit.default_timer() - start
 
         for name in param_capture.trace.nodes.keys():
-            if name not in self._param_names:
+            if name not in param_names:
                 raise NotImplementedError('pyro.ops.jit.trace assumes all params are created on '
                                           'first invocation, but found new param: {}'.format(name))
 
         return ret
 
-
-def trace(fn=None, ignore_warnings=False):
+    def _evict(self):
+        if self.maxsize is None:
+            return
+        while len(self.compiled) > self.maxsize:
+            key, _ = self.compiled.popitem(last=False)
+            del self._param_names[key]
+            self.evictions += 1
+
+    def cache_info(self):
+        """
+        Returns statistics of the cache of compiled traces, where ``misses``
+        is the number of compilations, and ``compile_time`` and ``run_time``
+        are the total wall-clock seconds spent compiling and running traces.
+
+        :rtype: CompileCacheInfo
+        """
+        return CompileCacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self.compiled),
+                                self.compile_time, self.run_time)
+
+    def cache_clear(self):
+        """
+        Clears the cache of compiled traces and resets its statistics.
+        """
+        self.compiled.clear()
+        self._param_names.clear()
+        self.hits = self.misses = self.evictions = 0
+        self.compile_time = self.run_time = 0.
+
+
+def trace(fn=None, ignore_warnings=False, maxsize=16):
     """
     Lazy replacement for :func:`torch.jit.trace` that works with
     Pyro functions that call :func:`pyro.param`.
 
-    The actual compilation artifact is stored in the ``compiled`` attribute of
-    the output. Call diagnostic methods on this attribute.
+    The function is compiled once per distinct shapes, dtypes and devices of
+    its tensor arguments, keeping at most ``maxsize`` compiled traces.
+    The actual compilation artifacts are stored in the ``compiled`` attribute
+    of the output. Call diagnostic methods on this attribute.
 
     Example::
 
@@ -121,7 +185,14 @@ def trace(fn=None, ignore_warnings=False):
             cond_model = pyro.condition(model, data={"y": y})
             tr = pyro.poutine.trace(cond_model).get_trace(x)
             return tr.log_prob_sum()
+
+    :param callable fn: a function whose tensor inputs are passed via
+        ``*args`` and whose other inputs are passed via ``**kwargs``.
+    :param bool ignore_warnings: whether to ignore jit warnings while tracing.
+    :param maxsize: the maximum number of cached compiled traces, or None for
+        an unbounded cache. Defaults to 16.
+    :type maxsize: int or None
     """
     if fn is None:
-        return lambda fn: trace(fn, ignore_warnings=ignore_warnings)
-    return CompiledFunction(fn, ignore_warnings=ignore_warnings)
+        return lambda fn: trace(fn, ignore_warnings=ignore_warnings, maxsize=maxsize)
+    return CompiledFunction(fn, ignore_warnings=ignore_warnings, maxsize=maxsize)
@@ -85,14 +85,21 @@ def broadcast_all(*values, **kwargs):
 def gather(value, index, dim):
     """
     Packed broadcasted gather of indexed values along a named dim.
+
+    If ``index`` also varies along ``dim``, this gathers elementwise along
+    ``dim`` and preserves ``dim`` in the result.
     """
     assert dim in value._pyro_dims
-    assert dim not in index._pyro_dims
+    diagonal = dim in index._pyro_dims
     value, index = broadcast_all(value, index)
-    dims = value._pyro_dims.replace(dim, '')
-    pos = value._pyro_dims.index(dim)
-    index = index.index_select(pos, index.new_tensor([0]))
-    value = value.gather(pos, index).squeeze(pos)
+    dims = value._pyro_dims
+    pos = dims.index(dim)
+    if diagonal:
+        value = value.gather(pos, index)
+    else:
+        dims = dims.replace(dim, '')
+        index = index.index_select(pos, index.new_tensor([0]))
+        value = value.gather(pos, index).squeeze(pos)
     value._pyro_dims = dims
     assert value.dim() == len(value._pyro_dims)
     return value
@@ -7,9 +7,12 @@ import numpy as np
 import torch
 from six import add_metaclass
 
-from pyro.ops.einsum import contract
-from pyro.ops.einsum.adjoint import SAMPLE_SYMBOL, Backward
-from pyro.util import ignore_jit_warnings
+import pyro.distributions as dist
+from pyro.distributions.util import logsumexp
+from pyro.ops import packed
+from pyro.ops.einsum import contract, contract_expression
+from pyro.ops.einsum.adjoint import SAMPLE_SYMBOL, Backward, broadcast_particles, einsum_backward_sample
+from pyro.util import ignore_jit_warnings, jit_iter
 
 
 def _finfo(tensor):
@@ -97,6 +100,23 @@ class Ring(object):
         """
         raise NotImplementedError
 
+    def markov_product(self, term, step_dim, prev_dims, curr_dims):
+        """
+        Product-contract the given ``term`` along a batch dimension
+        ``step_dim`` of a markov chain, whose state at each step is given by
+        the sum dims ``curr_dims`` and whose state at the previous step is given
+        by the sum dims ``prev_dims``. The result retains ``prev_dims`` denoting
+        the state before the first step and ``curr_dims`` denoting the state
+        at the last step.
+
+        :param torch.Tensor term: the term to contract
+        :param str step_dim: the batch dim of steps to contract
+        :param str prev_dims: sum dims of the previous state at each step
+        :param str curr_dims: sum dims of the current state at each step,
+            aligned with ``prev_dims``
+        """
+        raise NotImplementedError
+
     def global_local(self, term, dims, ordinal):
         r"""
         Computes global and local terms for tensor message passing
@@ -139,21 +159,83 @@ class LogRing(Ring):
 
     Dims are characters (string or unicode).
     Ordinals are frozensets of characters.
+
+    If a ``memory_limit`` is given, sum-product contractions whose largest
+    pairwise contraction step would exceed this number of tensor elements are
+    computed in slices along their largest sum dims, accumulating partial
+    results via :meth:`_add`.
+
+    :param dict cache: an optional :func:`~opt_einsum.shared_intermediates`
+        cache.
+    :param dict dim_to_size: an optional mapping from dims to sizes, needed
+        for :meth:`broadcast`.
+    :param int memory_limit: an optional bound on the number of elements of
+        each intermediate tensor in :meth:`sumproduct`.
     """
     _backend = 'pyro.ops.einsum.torch_log'
 
-    def __init__(self, cache=None, dim_to_size=None):
+    def __init__(self, cache=None, dim_to_size=None, memory_limit=None):
         super(LogRing, self).__init__(cache=cache)
         self._dim_to_size = {} if dim_to_size is None else dim_to_size
+        self._memory_limit = memory_limit
 
     def sumproduct(self, terms, dims):
         inputs = [term._pyro_dims for term in terms]
         output = ''.join(sorted(set(''.join(inputs)) - set(dims)))
         equation = ','.join(inputs) + '->' + output
+        if self._memory_limit is not None:
+            sliced = self._sliced_sumproduct(terms, dims, equation)
+            if sliced is not None:
+                return sliced
         term = contract(equation, *terms, backend=self._backend)
         term._pyro_dims = output
         return term
 
+    @staticmethod
+    def _add(x, y):
+        """
+        Sum-contracts a pair of partial results of a sliced :meth:`sumproduct`.
+        """
+        result = logsumexp(torch.stack([x, y]), 0)
+        result._pyro_dims = x._pyro_dims
+        return result
+
+    def _sliced_sumproduct(self, terms, dims, equation):
+        """
+        Computes a :meth:`sumproduct` in slices of its largest sum dim, or
+        returns None if no slicing is needed or possible.
+        """
+        if any(hasattr(term, '_pyro_backward') for term in terms) and self._backward_sample is None:
+            return None  # this ring cannot sample sliced dims
+
+        # Find the largest pairwise step of the contraction path.
+        sizes = {dim: size for term in terms for dim, size in zip(term._pyro_dims, term.shape)}
+        with ignore_jit_warnings():
+            shapes = [tuple(map(int, term.shape)) for term in terms]
+            expr = contract_expression(equation, *shapes)
+        step_size, step_dims = 0, ''
+        for step in expr.contraction_list:
+            dims_i = ''.join(sorted(set(step[2].split('->')[0]) - set(',')))
+            size_i = int(np.prod([sizes[dim] for dim in dims_i]))
+            if size_i > step_size:
+                step_size, step_dims = size_i, dims_i
+        if step_size <= self._memory_limit:
+            return None
+        candidates = [dim for dim in step_dims if dim in dims and sizes[dim] > 1]
+        if not candidates:
+            return None
+
+        # Slice the largest sum dim into chunks that (heuristically) fit in memory.
+        dim = max(candidates, key=lambda d: (sizes[d], d))
+        chunk_size = max(1, sizes[dim] * self._memory_limit // step_size)
+        result = None
+        for begin in range(0, sizes[dim], chunk_size):
+            part = self.sumproduct(_narrow_terms(terms, dim, begin, chunk_size), dims)
+            result = part if result is None else self._add(result, part)
+        if any(hasattr(term, '_pyro_backward') for term in terms):
+            result._pyro_backward = _SlicedSumProductBackward(self, terms, dims, dim, chunk_size)
+        return result
+
     def product(self, term, ordinal):
         dims = term._pyro_dims
         for dim in sorted(ordinal, reverse=True):
@@ -180,6 +262,264 @@ class LogRing(Ring):
         self._cache[key] = result
         return result
 
+    def markov_product(self, term, step_dim, prev_dims, curr_dims):
+        """
+        This is implemented by a parallel scan, which combines pairs of
+        adjacent steps in :math:`\\mathcal{O}(\\log T)` rounds of batched
+        matrix operations for a chain of :math:`T` steps.
+        """
+        key = 'markov_product', self._hash_by_id(term), step_dim, prev_dims, curr_dims
+        if key in self._cache:
+            return self._cache[key]
+
+        # Permute and flatten to shape batch_shape + (num_steps, num_states, num_states).
+        chain = _MarkovChain(term, step_dim, prev_dims, curr_dims)
+        x = chain.flatten(term)
+        levels = []
+        while x.size(-3) > 1:
+            num_pairs = x.size(-3) // 2
+            even = x[..., 0:2 * num_pairs:2, :, :]
+            odd = x[..., 1:2 * num_pairs:2, :, :]
+            contracted = self._markov_combine(even, odd)
+            if x.size(-3) % 2:
+                contracted = torch.cat([contracted, x[..., -1:, :, :]], dim=-3)
+            levels.append((even, odd))
+            x = contracted
+        result = chain.unflatten(x.squeeze(-3))
+
+        if hasattr(term, '_pyro_backward') and self._backward_sample is not None:
+            result._pyro_backward = _MarkovProductBackward(self, term, chain, levels)
+        self._cache[key] = result
+        return result
+
+    @staticmethod
+    def _markov_combine(x, y):
+        # Computes a batched log-sum-product of log matrices.
+        finfo = _finfo(x)
+        x_shift = x.max(-1, keepdim=True)[0].clamp(min=finfo.min)
+        y_shift = y.max(-2, keepdim=True)[0].clamp(min=finfo.min)
+        xy = torch.matmul((x - x_shift).exp(), (y - y_shift).exp()).log()
+        return xy + x_shift + y_shift
+
+    _backward_sample = None  # draws an index from logits along the rightmost dim, in backward algorithms
+
+
+def _narrow_terms(terms, dim, begin, size):
+    """
+    Slices packed terms along a dim, dropping any ``._pyro_backward``.
+    """
+    result = []
+    for term in terms:
+        pos = term._pyro_dims.find(dim)
+        if pos != -1:
+            dims = term._pyro_dims
+            term = term.narrow(pos, begin, min(size, term.size(pos) - begin))
+            term._pyro_dims = dims
+        result.append(term)
+    return result
+
+
+class _SlicedSumProductBackward(Backward):
+    """
+    Backward-sample implementation of a sliced :meth:`LogRing.sumproduct`.
+
+    Given an upstream sample, this first samples the sliced dim conditioned
+    on that sample, one chunk at a time. It then recomputes the contraction
+    of terms gathered at the sampled slice and continues the backward pass
+    through that contraction.
+    """
+    def __init__(self, ring, terms, dims, dim, chunk_size):
+        self.ring = ring
+        self.terms = terms
+        self.dims = set(dims)
+        self.dim = dim
+        self.chunk_size = chunk_size
+
+    def process(self, message):
+        ring, terms, dim = self.ring, self.terms, self.dim
+        size = next(term.size(term._pyro_dims.index(dim)) for term in terms if dim in term._pyro_dims)
+
+        # Compute logits of the sliced dim, conditioned on the upstream sample.
+        parts = []
+        for begin in range(0, size, self.chunk_size):
+            part = ring.sumproduct(_narrow_terms(terms, dim, begin, self.chunk_size), self.dims - set(dim))
+            if message is not None:
+                for sample_dim, index in zip(message._pyro_sample_dims, jit_iter(message)):
+                    if sample_dim in part._pyro_dims:
+                        index._pyro_dims = message._pyro_dims[1:]
+                        part = packed.gather(part, index, sample_dim)
+            parts.append(part)
+        dims = parts[0]._pyro_dims.replace(dim, '') + dim
+        logits = torch.cat([part.permute(tuple(map(part._pyro_dims.index, dims))) for part in parts], -1)
+        logits._pyro_dims = dims
+        logits = broadcast_particles(logits, message)
+        index = ring._backward_sample(logits)
+        index._pyro_dims = logits._pyro_dims[:-1]
+        sample = index.unsqueeze(0)
+        sample._pyro_dims = SAMPLE_SYMBOL + index._pyro_dims
+        sample._pyro_sample_dims = dim
+
+        # Recompute the contraction at the sampled slice.
+        gathered = []
+        for term in terms:
+            if dim in term._pyro_dims:
+                gathered_term = packed.gather(term, index, dim)
+                if hasattr(term, '_pyro_backward'):
+                    gathered_term._pyro_backward = _SliceGatherBackward(term, sample)
+                term = gathered_term
+            gathered.append(term)
+        result = ring.sumproduct(gathered, self.dims - set(dim))
+        yield result._pyro_backward, message
+
+
+class _SliceGatherBackward(Backward):
+    """
+    Backward-sample implementation of gathering a term at a sampled slice,
+    which combines the sample of the sliced dim with downstream samples.
+    """
+    def __init__(self, term, sample):
+        self.term = term
+        self.sample = sample
+
+    def process(self, message):
+        return einsum_backward_sample([self.term], self.sample, message)
+
+
+class _MarkovChain(object):
+    """
+    Helper to reshape terms of a markov chain between packed and flattened
+    representations, for use in :meth:`Ring.markov_product`.
+    """
+    def __init__(self, term, step_dim, prev_dims, curr_dims):
+        assert len(prev_dims) == len(curr_dims)
+        chain_dims = step_dim + prev_dims + curr_dims
+        self.step_dim = step_dim
+        self.prev_dims = prev_dims
+        self.curr_dims = curr_dims
+        self.batch_dims = ''.join(sorted(set(term._pyro_dims) - set(chain_dims)))
+        # Note that chain dims of size 1 may be missing from packed terms.
+        self.sizes = dict(zip(term._pyro_dims, term.shape))
+        self.state_shape = tuple(self.sizes.get(dim, 1) for dim in curr_dims)
+        assert self.state_shape == tuple(self.sizes.get(dim, 1) for dim in prev_dims)
+        self.num_states = int(np.prod(self.state_shape))
+
+    def flatten(self, term):
+        dims = self.batch_dims + self.step_dim + self.prev_dims + self.curr_dims
+        x = term.permute(tuple(term._pyro_dims.index(dim) for dim in dims if dim in term._pyro_dims))
+        batch_shape = x.shape[:len(self.batch_dims)]
+        return x.reshape(batch_shape + (self.sizes.get(self.step_dim, 1), self.num_states, self.num_states))
+
+    def unflatten(self, x):
+        result = x.reshape(x.shape[:-2] + self.state_shape + self.state_shape)
+        result._pyro_dims = self.batch_dims + self.prev_dims + self.curr_dims
+        return result
+
+    def unravel(self, index):
+        """
+        Converts a tensor of flat state indices to a list of index tensors,
+        one per dim in ``prev_dims`` (equivalently ``curr_dims``).
+        """
+        result = []
+        for size in reversed(self.state_shape):
+            result.append(index % size)
+            index = index // size
+        return result[::-1]
+
+    def ravel(self, indices):
+        """
+        Converts a list of index tensors to a tensor of flat state indices.
+        """
+        result = 0
+        for index, size in zip(indices, self.state_shape):
+            result = result * size + index
+        return result
+
+
+class _MarkovProductBackward(Backward):
+    """
+    Backward-sample implementation of :meth:`Ring.markov_product`.
+
+    Given a sample of the states at both ends of the chain, this samples the
+    states of all intermediate steps by reversing the parallel scan, sampling
+    the midpoints of each pair of adjacent segments in turn.
+    """
+    def __init__(self, ring, term, chain, levels):
+        self.ring = ring
+        self.term = term
+        self.chain = chain
+        self.levels = levels
+
+    def process(self, message):
+        chain = self.chain
+        assert message is not None, 'expected a sample of chain endpoints'
+        sample_dims = message._pyro_sample_dims
+        rows = dict(zip(sample_dims, jit_iter(message)))
+        rest_dims = ''.join(dim for dim in sample_dims if dim not in chain.prev_dims + chain.curr_dims)
+
+        # Slice down stored factors by upstream samples of other dims.
+        step, prev, curr = chain.step_dim, chain.prev_dims[0], chain.curr_dims[0]
+        levels = []
+        for even, odd in self.levels:
+            parts = []
+            for x in (even, odd):
+                x = x[...]
+                x._pyro_dims = chain.batch_dims + step + prev + curr
+                for dim in rest_dims:
+                    if dim in x._pyro_dims:
+                        index = rows[dim]
+                        index._pyro_dims = message._pyro_dims[1:]
+                        x = packed.gather(x, index, dim)
+                parts.append(x)
+            levels.append(parts)
+
+        # Broadcast all tensors to common batch dims.
+        sizes = dict(zip(message._pyro_dims[1:], message.shape[1:]))
+        for parts in levels:
+            for x in parts:
+                sizes.update(zip(x._pyro_dims, x.shape))
+        batch_dims = ''.join(sorted(set(sizes) - set(step + prev + curr)))
+        batch_shape = tuple(sizes[dim] for dim in batch_dims)
+
+        def align(x, extra_dims):
+            dims = ''.join(dim for dim in batch_dims if dim in x._pyro_dims) + extra_dims
+            x = x.permute(tuple(map(x._pyro_dims.index, dims)))
+            extra_shape = x.shape[x.dim() - len(extra_dims):]
+            x = x.reshape(tuple(sizes[dim] if dim in dims else 1 for dim in batch_dims) + extra_shape)
+            return x.expand(batch_shape + extra_shape)
+
+        levels = [[align(x, step + prev + curr) for x in parts] for parts in levels]
+        p = chain.ravel([rows[dim] for dim in chain.prev_dims])
+        c = chain.ravel([rows[dim] for dim in chain.curr_dims])
+        p._pyro_dims = c._pyro_dims = message._pyro_dims[1:]
+        p = align(p, '').unsqueeze(-1)
+        c = align(c, '').unsqueeze(-1)
+
+        # Reverse the parallel scan, splitting segments at sampled midpoints.
+        for even, odd in reversed(levels):
+            num_pairs = even.size(-3)
+            p_pair, c_pair = p[..., :num_pairs], c[..., :num_pairs]
+            logits = (even.gather(-2, p_pair[..., None, None].expand(even.shape[:-2] + (1, even.size(-1))))
+                      .squeeze(-2) +
+                      odd.gather(-1, c_pair[..., None, None].expand(odd.shape[:-1] + (1,))).squeeze(-1))
+            mid = self.ring._backward_sample(logits)
+            new_p = torch.stack([p_pair, mid], -1).reshape(batch_shape + (2 * num_pairs,))
+            new_c = torch.stack([mid, c_pair], -1).reshape(batch_shape + (2 * num_pairs,))
+            p = torch.cat([new_p, p[..., num_pairs:]], -1)
+            c = torch.cat([new_c, c[..., num_pairs:]], -1)
+
+        # Construct a sample of both states at each step.
+        sample = torch.stack(chain.unravel(p) + chain.unravel(c))
+        sample._pyro_dims = SAMPLE_SYMBOL + batch_dims + step
+        sample._pyro_sample_dims = chain.prev_dims + chain.curr_dims
+        assert sample.dim() == len(sample._pyro_dims)
+
+        rest = None
+        if rest_dims:
+            rest = message[[sample_dims.index(dim) for dim in rest_dims]]
+            rest._pyro_dims = message._pyro_dims
+            rest._pyro_sample_dims = rest_dims
+        return einsum_backward_sample([self.term], sample, rest)
+
 
 class _SampleProductBackward(Backward):
     """
@@ -214,6 +554,20 @@ class MapRing(LogRing):
     """
     _backend = 'pyro.ops.einsum.torch_map'
 
+    @staticmethod
+    def _add(x, y):
+        result = torch.max(x, y)
+        result._pyro_dims = x._pyro_dims
+        return result
+
+    @staticmethod
+    def _markov_combine(x, y):
+        return (x.unsqueeze(-1) + y.unsqueeze(-3)).max(-2)[0]
+
+    @staticmethod
+    def _backward_sample(logits):
+        return logits.max(-1)[1]
+
     def product(self, term, ordinal):
         result = super(MapRing, self).product(term, ordinal)
         if hasattr(term, '_pyro_backward'):
@@ -227,6 +581,10 @@ class SampleRing(LogRing):
     """
     _backend = 'pyro.ops.einsum.torch_sample'
 
+    @staticmethod
+    def _backward_sample(logits):
+        return dist.Categorical(logits=logits).sample()
+
     def product(self, term, ordinal):
         result = super(SampleRing, self).product(term, ordinal)
         if hasattr(term, '_pyro_backward'):
@@ -267,6 +625,9 @@ class MarginalRing(LogRing):
     """
     _backend = 'pyro.ops.einsum.torch_marginal'
 
+    def markov_product(self, term, step_dim, prev_dims, curr_dims):
+        raise NotImplementedError('MarginalRing does not support markov chains')
+
     def product(self, term, ordinal):
         result = super(MarginalRing, self).product(term, ordinal)
         if hasattr(term, '_pyro_backward'):
@@ -0,0 +1,94 @@
+from __future__ import absolute_import, division, print_function
+
+import math
+
+import torch
+
+from pyro.optim.clipped_adam import ClippedAdam
+
+
+def _pow(base, exponent):
+    # Computes base ** exponent for a python number base and a tensor exponent.
+    if base == 0:
+        return torch.zeros_like(exponent)
+    return torch.exp(exponent * math.log(base))
+
+
+def _sgd(lr, momentum=0, dampening=0, weight_decay=0, nesterov=False):
+    state_names = ("momentum_buffer",) if momentum != 0 else ()
+
+    def update(param, grad, step, *state):
+        step.add_(1)
+        if weight_decay != 0:
+            grad = grad + weight_decay * param
+        if momentum != 0:
+            buf, = state
+            # The first step initializes the buffer to the undampened gradient.
+            first = (step == 1).type_as(buf)
+            buf.mul_(momentum).add_((1 - dampening * (1 - first)) * grad)
+            grad = grad + momentum * buf if nesterov else buf
+        param.sub_(lr * grad)
+
+    return state_names, update
+
+
+def _adam(lr=1e-3, betas=(0.9, 0.999), eps=1e-8, weight_decay=0, amsgrad=False, clip_norm=None, lrd=1.0):
+    if amsgrad:
+        raise NotImplementedError("Fused Adam does not support amsgrad")
+    beta1, beta2 = betas
+
+    def update(param, grad, step, exp_avg, exp_avg_sq):
+        step.add_(1)
+        if clip_norm is not None:
+            grad = grad.clamp(-clip_norm, clip_norm)
+        if weight_decay != 0:
+            grad = grad + weight_decay * param
+        exp_avg.mul_(beta1).add_((1 - beta1) * grad)
+        exp_avg_sq.mul_(beta2).add_((1 - beta2) * grad * grad)
+        denom = exp_avg_sq.sqrt().add_(eps)
+        bias_correction1 = 1 - _pow(beta1, step)
+        bias_correction2 = 1 - _pow(beta2, step)
+        step_size = lr * bias_correction2.sqrt() / bias_correction1
+        if lrd != 1.0:
+            step_size = step_size * _pow(lrd, step)
+        param.sub_(step_size * exp_avg / denom)
+
+    return ("exp_avg", "exp_avg_sq"), update
+
+
+def _clipped_adam(lr=1e-3, betas=(0.9, 0.999), eps=1e-8, weight_decay=0, clip_norm=10.0, lrd=1.0):
+    return _adam(lr=lr, betas=betas, eps=eps, weight_decay=weight_decay, clip_norm=clip_norm, lrd=lrd)
+
+
+_FUSED_UPDATES = {
+    torch.optim.SGD: _sgd,
+    torch.optim.Adam: _adam,
+    ClippedAdam: _clipped_adam,
+}
+
+
+def get_fused_update(optim):
+    """
+    Returns the update rule of a :class:`~pyro.optim.optim.PyroOptim` as a
+    function of flat tensors, so that all params can be updated at once.
+
+    The returned function ``update(param, grad, step, *state)`` updates
+    ``param``, ``step`` and each ``state`` tensor in place, where ``step``
+    counts the steps taken by each element of ``param``, and ``state`` are
+    tensors of optimizer state of the same shape as ``param``, initially
+    zero.
+
+    :param optim: a :class:`~pyro.optim.optim.PyroOptim` wrapping
+        :class:`torch.optim.SGD`, :class:`torch.optim.Adam` or
+        :class:`~pyro.optim.clipped_adam.ClippedAdam` with a dict of optim args.
+    :returns: a pair ``(state_names, update)``, where ``state_names`` is a
+        tuple of names of the state tensors.
+    :raises NotImplementedError: if the optimizer is not supported.
+    """
+    rule = _FUSED_UPDATES.get(optim.pt_optim_constructor)
+    if rule is None:
+        raise NotImplementedError("Fused updates are not implemented for {}"
+                                  .format(optim.pt_optim_constructor.__name__))
+    if callable(optim.pt_optim_args):
+        raise NotImplementedError("Fused updates require optim args to be a dict shared by all params")
+    return rule(**optim.pt_optim_args)
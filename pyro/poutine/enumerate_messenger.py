@@ -1,5 +1,7 @@
 from __future__ import absolute_import, division, print_function
 
+import numbers
+
 from pyro.distributions.torch_distribution import TorchDistributionMixin
 from pyro.util import ignore_jit_warnings
 
@@ -7,10 +9,35 @@ from .messenger import Messenger
 from .runtime import _ENUM_ALLOCATOR
 
 
+def _enumerate_topk(dist, topk, expand=False):
+    """
+    Enumerates over the ``topk`` values of the support of ``dist`` with
+    highest log probability, independently for each batch element.
+    """
+    values = dist.enumerate_support(expand=False)
+    if topk >= values.size(0):
+        return dist.enumerate_support(expand=expand)
+    log_prob = dist.log_prob(values)
+    index = log_prob.topk(topk, 0)[1]
+    event_shape = values.shape[log_prob.dim():]
+    values = values.expand(log_prob.shape + event_shape)
+    index = index.reshape(index.shape + (1,) * len(event_shape)).expand(index.shape + event_shape)
+    return values.gather(0, index)
+
+
 def enumerate_site(msg):
     dist = msg["fn"]
     num_samples = msg["infer"].get("num_samples")
-    if num_samples is None:
+    topk = msg["infer"].get("topk")
+    if topk is not None:
+        if num_samples is not None:
+            raise ValueError("Expected at most one of num_samples and topk at site '{}'".format(msg["name"]))
+        if not (isinstance(topk, numbers.Integral) and topk > 0):
+            raise ValueError("Invalid topk at site '{}', expected a positive integer, but got {}"
+                             .format(msg["name"], repr(topk)))
+        # Enumerate over a pruned support of the distribution.
+        value = _enumerate_topk(dist, topk, expand=msg["infer"].get("expand", False))
+    elif num_samples is None:
         # Enumerate over the support of the distribution.
         value = dist.enumerate_support(expand=msg["infer"].get("expand", False))
     else:
@@ -25,6 +52,12 @@ class EnumerateMessenger(Messenger):
     Enumerates in parallel over discrete sample sites marked
     ``infer={"enumerate": "parallel"}``.
 
+    Sites marked ``infer={"enumerate": "parallel", "topk": k}`` are
+    enumerated approximately over only the ``k`` values of highest log
+    probability under the site's distribution, chosen independently for each
+    batch element. This trades accuracy for memory and time at sites with
+    large supports.
+
     :param int first_available_dim: The first tensor dimension (counting
         from the right) that is available for parallel enumeration. This
         dimension and all dimensions left may be used internally by Pyro.
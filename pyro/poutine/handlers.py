@@ -48,8 +48,6 @@ in just a few lines of code::
 
 from __future__ import absolute_import, division, print_function
 
-import functools
-
 from six.moves import xrange
 
 from pyro.poutine import util
@@ -64,6 +62,7 @@ from .lift_messenger import LiftMessenger
 from .markov_messenger import MarkovMessenger
 from .mask_messenger import MaskMessenger
 from .plate_messenger import PlateMessenger  # noqa F403
+from .queue_messenger import QueueMessenger
 from .replay_messenger import ReplayMessenger
 from .runtime import NonlocalExit
 from .scale_messenger import ScaleMessenger
@@ -428,6 +427,13 @@ def queue(fn=None, queue=None, max_tries=None,
     Given a stochastic function and a queue,
     return a return value from a complete trace in the queue.
 
+    At each site where ``escape_fn`` is True, the partial trace is extended
+    with ``extend_fn`` and the extended traces are put in the queue. If the
+    next trace in the queue is one of these, e.g. for a LIFO queue,
+    execution continues from the site rather than restarting the function,
+    so that the prefix of the trace is executed only once. Otherwise the
+    function is re-executed, replaying the next trace in the queue.
+
     :param fn: a stochastic function (callable containing Pyro primitive calls)
     :param queue: a queue data structure like multiprocessing.Queue to hold partial traces
     :param max_tries: maximum number of attempts to compute a single complete trace
@@ -454,21 +460,22 @@ def queue(fn=None, queue=None, max_tries=None,
     def wrapper(wrapped):
         def _fn(*args, **kwargs):
 
+            next_trace = None
             for i in xrange(max_tries):
-                assert not queue.empty(), \
-                    "trying to get() from an empty queue will deadlock"
-
-                next_trace = queue.get()
+                if next_trace is None:
+                    assert not queue.empty(), \
+                        "trying to get() from an empty queue will deadlock"
+                    next_trace = queue.get()
+
+                trace_msngr = TraceMessenger()
+                queue_msngr = QueueMessenger(queue, next_trace, trace_msngr, escape_fn, extend_fn,
+                                             num_samples=num_samples)
                 try:
-                    ftr = trace(escape(replay(wrapped, trace=next_trace),
-                                       escape_fn=functools.partial(escape_fn,
-                                                                   next_trace)))
+                    ftr = trace_msngr(queue_msngr(replay(wrapped, trace=next_trace)))
                     return ftr(*args, **kwargs)
                 except NonlocalExit as site_container:
                     site_container.reset_stack()
-                    for tr in extend_fn(ftr.trace.copy(), site_container.site,
-                                        num_samples=num_samples):
-                        queue.put(tr)
+                    next_trace = queue_msngr.next_trace
 
             raise ValueError("max tries ({}) exceeded".format(str(max_tries)))
         return _fn
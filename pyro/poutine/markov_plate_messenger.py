@@ -0,0 +1,117 @@
+from __future__ import absolute_import, division, print_function
+
+import math
+
+import torch
+from torch.distributions import constraints
+
+from pyro.distributions.torch_distribution import TorchDistribution
+from pyro.distributions.util import broadcast_shape
+
+from .plate_messenger import PlateMessenger
+from .runtime import apply_stack
+
+
+class _MarkovPrevious(TorchDistribution):
+    """
+    Improper flat distribution over the previous state of a markov chain at
+    each step of a :class:`MarkovPlateMessenger`, which is a proper uniform
+    distribution at the first step (where the previous state is ignored).
+
+    Internal use only. This should only be used by ``markov_plate``.
+    """
+    arg_constraints = {}
+    has_enumerate_support = True
+
+    def __init__(self, num_states, step_dim, batch_shape=None, validate_args=None):
+        self.num_states = num_states
+        self.step_dim = step_dim
+        super(_MarkovPrevious, self).__init__(batch_shape, validate_args=validate_args)
+
+    @constraints.dependent_property
+    def support(self):
+        return constraints.integer_interval(0, self.num_states - 1)
+
+    def expand(self, batch_shape, _instance=None):
+        new = self._get_checked_instance(_MarkovPrevious, _instance)
+        new.num_states = self.num_states
+        new.step_dim = self.step_dim
+        super(_MarkovPrevious, new).__init__(torch.Size(batch_shape), validate_args=False)
+        new._validate_args = self._validate_args
+        return new
+
+    def sample(self, sample_shape=torch.Size()):
+        raise NotImplementedError("markov_plate requires parallel enumeration, "
+                                  "try wrapping the model in poutine.enum")
+
+    def log_prob(self, value):
+        shape = broadcast_shape(value.shape, self.batch_shape)
+        num_steps = self.batch_shape[self.step_dim]
+        steps = torch.arange(num_steps, device=value.device)
+        first = (steps == 0).reshape((num_steps,) + (1,) * (-1 - self.step_dim))
+        result = value.new_zeros(shape, dtype=torch.get_default_dtype())
+        return result - first.to(result.dtype) * math.log(self.num_states)
+
+    def enumerate_support(self, expand=True):
+        values = torch.arange(self.num_states)
+        values = values.reshape((self.num_states,) + (1,) * len(self.batch_shape))
+        if expand:
+            values = values.expand((self.num_states,) + self.batch_shape)
+        return values
+
+
+class MarkovPlateMessenger(PlateMessenger):
+    """
+    Vectorized :class:`PlateMessenger` over the steps of a markov chain.
+
+    Unlike an ordinary plate, sites in different steps of a markov plate may
+    depend on each other through the values of designated sites at the
+    previous step, as returned by :meth:`previous`. Enumerated variables of
+    all steps are eliminated jointly by
+    :class:`~pyro.infer.traceenum_elbo.TraceEnum_ELBO` and
+    :func:`~pyro.infer.discrete.infer_discrete` via a parallel scan, in
+    :math:`\\mathcal{O}(\\log T)` rounds of batched matrix operations for a
+    chain of :math:`T` steps.
+
+    Markov plates do not support subsampling.
+    """
+    def __init__(self, name, size, dim=None, device=None):
+        super(MarkovPlateMessenger, self).__init__(name, size, dim=dim, device=device)
+
+    def previous(self, name, num_states):
+        """
+        Returns the enumerated value of the site ``name`` at the previous step
+        of this markov plate. The site ``name`` must be an enumerated sample
+        site with ``num_states`` states in the scope of this plate. The value
+        returned at the first step is arbitrary, so models must ignore it,
+        e.g. ``torch.where((t == 0).unsqueeze(-1), init_probs, trans_probs[x_prev])``.
+
+        This must be called inside the context of this plate.
+
+        :param str name: the name of a sample site in this plate.
+        :param int num_states: the number of states of that site.
+        :returns: an enumerated tensor of previous values
+        :rtype: torch.LongTensor
+        """
+        if self.dim is None:
+            raise ValueError("markov_plate('{}').previous() must be called inside its plate context"
+                             .format(self.name))
+        batch_shape = (self.size,) + (1,) * (-1 - self.dim)
+        msg = {
+            "type": "sample",
+            "name": "{}_prev".format(name),
+            "fn": _MarkovPrevious(num_states, self.dim, batch_shape),
+            "is_observed": False,
+            "args": (),
+            "kwargs": {},
+            "value": None,
+            "infer": {"enumerate": "parallel", "_markov_plate": self.name, "_markov_curr": name},
+            "scale": 1.0,
+            "mask": None,
+            "cond_indep_stack": (),
+            "done": False,
+            "stop": False,
+            "continuation": None
+        }
+        apply_stack(msg)
+        return msg["value"]
@@ -0,0 +1,74 @@
+from __future__ import absolute_import, division, print_function
+
+from .messenger import Messenger
+from .runtime import NonlocalExit
+
+
+class QueueMessenger(Messenger):
+    """
+    Messenger for sequential enumeration from a queue of partial traces.
+
+    At a site where ``escape_fn`` is True, extends the partial trace recorded
+    so far with ``extend_fn``, puts the extended traces in the queue, and gets
+    the next partial trace from the queue. If that trace is one of the traces
+    just put, execution continues with its value at the site, sharing the
+    execution of the prefix. Otherwise, performs a nonlocal exit by raising a
+    :class:`~pyro.poutine.runtime.NonlocalExit` exception, and the next
+    partial trace is stored in ``self.next_trace`` for re-execution.
+
+    :param queue: a queue data structure of partial traces
+    :param next_trace: the partial trace currently being replayed
+    :param trace_msngr: a :class:`~pyro.poutine.trace_messenger.TraceMessenger`
+        recording the current execution, outside this messenger
+    :param escape_fn: function that takes a partial trace and a site,
+        and returns a boolean value to decide whether to extend at that site
+    :param extend_fn: function that takes a partial trace and a site,
+        and returns a list of extended traces
+    :param num_samples: optional number of extended traces for extend_fn to return
+    """
+    def __init__(self, queue, next_trace, trace_msngr, escape_fn, extend_fn, num_samples=None):
+        super(QueueMessenger, self).__init__()
+        self.queue = queue
+        self.trace = next_trace
+        self.trace_msngr = trace_msngr
+        self.escape_fn = escape_fn
+        self.extend_fn = extend_fn
+        self.num_samples = num_samples
+        self.next_trace = None
+
+    def _pyro_sample(self, msg):
+        """
+        :param msg: current message at a trace site
+        :returns: a sample from the stochastic function at the site.
+
+        Evaluates self.escape_fn on the site. If this returns True, extends
+        the current trace at the site and either continues execution with a
+        value from the queue or raises an exception NonlocalExit(msg).
+        Else, implements default _pyro_sample behavior with no additional effects.
+        """
+        if not self.escape_fn(self.trace, msg):
+            return None
+
+        extended_traces = list(self.extend_fn(self.trace_msngr.trace.copy(), msg,
+                                              num_samples=self.num_samples))
+        for tr in extended_traces:
+            self.queue.put(tr)
+        next_trace = None if self.queue.empty() else self.queue.get()
+
+        if any(tr is next_trace for tr in extended_traces):
+            # Continue execution as if replaying next_trace from the start.
+            site = next_trace.nodes[msg["name"]]
+            msg["done"] = True
+            msg["value"] = site["value"]
+            msg["infer"] = site["infer"]
+            self.trace = next_trace
+            return None
+
+        self.next_trace = next_trace
+        msg["done"] = True
+        msg["stop"] = True
+
+        def cont(m):
+            raise NonlocalExit(m)
+        msg["continuation"] = cont
+        return None
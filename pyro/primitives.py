@@ -10,6 +10,7 @@ import pyro.distributions as dist
 import pyro.infer as infer
 import pyro.poutine as poutine
 from pyro.params import param_with_module_name
+from pyro.poutine.markov_plate_messenger import MarkovPlateMessenger
 from pyro.poutine.plate_messenger import PlateMessenger
 from pyro.poutine.runtime import _MODULE_NAMESPACE_DIVIDER, _PYRO_PARAM_STORE, am_i_wrapped, apply_stack, effectful
 from pyro.poutine.subsample_messenger import SubsampleMessenger
@@ -206,6 +207,40 @@ class plate(PlateMessenger):
     pass
 
 
+class markov_plate(MarkovPlateMessenger):
+    """
+    Construct for vectorized markov chains of variables.
+
+    :class:`markov_plate` is a vectorized :class:`plate` whose steps may
+    depend on each other through the values of enumerated sites at the
+    previous step, as returned by :meth:`markov_plate.previous`. This is a
+    vectorized alternative to a sequential :func:`pyro.markov` loop, and
+    enumerated variables of all steps are eliminated jointly in logarithmic
+    depth by :class:`~pyro.infer.traceenum_elbo.TraceEnum_ELBO` and
+    :func:`~pyro.infer.discrete.infer_discrete`. Markov plates require
+    parallel enumeration of each chain site and do not support subsampling.
+
+    Example::
+
+        time = pyro.markov_plate("time", len(data), dim=-1)
+        with time as t:
+            x_prev = time.previous("x", num_states)
+            probs = torch.where((t == 0).unsqueeze(-1), init_probs, trans_probs[x_prev])
+            x = pyro.sample("x", dist.Categorical(probs),
+                            infer={"enumerate": "parallel"})
+            pyro.sample("y", dist.Normal(locs[x], 1.), obs=data)
+
+    :param str name: A unique name of the plate.
+    :param int size: The number of steps of the chain.
+    :param int dim: An optional dimension to use for the steps.
+    :param str device: Optional keyword specifying which device to place
+        the indices on.
+    :return: A reusable context manager yielding a single 1-dimensional
+        :class:`torch.Tensor` of step indices.
+    """
+    pass
+
+
 class iarange(plate):
     def __init__(self, *args, **kwargs):
         warnings.warn("pyro.iarange is deprecated; use pyro.plate instead", DeprecationWarning)
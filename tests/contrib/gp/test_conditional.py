@@ -83,3 +83,14 @@ def test_conditional_whiten(Xnew, X, kernel, f_loc, f_scale_tril, loc, cov):
 
     assert_equal(loc0, loc1)
     assert_equal(cov0, cov1)
+
+
+@pytest.mark.parametrize("Xnew, X, kernel, f_loc, f_scale_tril, loc, cov",
+                         TEST_CASES, ids=TEST_IDS)
+def test_conditional_block_size(Xnew, X, kernel, f_loc, f_scale_tril, loc, cov):
+    loc0, var0 = conditional(Xnew, X, kernel, f_loc, f_scale_tril, full_cov=False)
+    loc1, var1 = conditional(Xnew, X, kernel, f_loc, f_scale_tril, full_cov=False,
+                             block_size=1)
+
+    assert_equal(loc0, loc1)
+    assert_equal(var0, var1)
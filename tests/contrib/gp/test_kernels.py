@@ -6,9 +6,9 @@ import pytest
 import torch
 
 from pyro.contrib.gp.kernels import (RBF, Brownian, Constant, Coregionalize, Cosine, Exponent,
-                                     Exponential, Linear, Matern32, Matern52, Periodic,
-                                     Polynomial, Product, RationalQuadratic, Sum,
-                                     VerticalScaling, Warping, WhiteNoise)
+                                     Exponential, GridInterpolation, Isotropy, Linear, Matern32,
+                                     Matern52, Periodic, Polynomial, Product, RandomFourierFeatures,
+                                     RationalQuadratic, Sum, VerticalScaling, Warping, WhiteNoise)
 from tests.common import assert_equal
 
 T = namedtuple("TestGPKernel", ["kernel", "X", "Z", "K_sum"])
@@ -122,6 +122,15 @@ def test_kernel_forward(kernel, X, Z, K_sum):
         assert_equal(kernel(X, Z), kernel(Z, X).t())
 
 
+@pytest.mark.parametrize("kernel, X, Z, K_sum", TEST_CASES, ids=TEST_IDS)
+def test_kernel_blocks(kernel, X, Z, K_sum):
+    K = kernel(X, Z)
+    V = torch.arange(2. * K.size(1)).reshape(-1, 2)
+    assert_equal(kernel.matmul(X, V, Z, block_size=2), K.matmul(V))
+    blocks = {(i, j): block for i, j, block in kernel.iter_blocks(X, Z, block_size=1)}
+    assert_equal(torch.stack([blocks[i, j] for i, j in sorted(blocks)]).reshape(K.shape), K)
+
+
 def test_combination():
     k0 = TEST_CASES[0][0]
     k5 = TEST_CASES[5][0]   # TEST_CASES[1] is Brownian, only work for 1D
@@ -136,6 +145,34 @@ def test_combination():
     assert_equal(K.data, k(X, Z).data)
 
 
+def test_combination_shares_distances(monkeypatch):
+    num_calls = [0]
+    square_dist = Isotropy._square_dist
+
+    def counted_square_dist(self, X, Z, lengthscale=None):
+        num_calls[0] += 1
+        return square_dist(self, X, Z, lengthscale)
+
+    monkeypatch.setattr(Isotropy, "_square_dist", counted_square_dist)
+    k1 = RBF(3, variance, torch.tensor(2.))
+    k2 = Matern52(3, variance, torch.tensor(0.5))
+    k3 = RationalQuadratic(3, variance, lengthscale)
+    k4 = Periodic(3, variance, lengthscale, period=torch.ones(1))
+    k = Product(Sum(Sum(k1, k2), k3), Sum(k3, k4))
+
+    expected = (k1(X, Z) + k2(X, Z) + k3(X, Z)) * (k3(X, Z) + k4(X, Z))
+    num_calls[0] = 0
+    assert_equal(k(X, Z), expected)
+    # k1 and k2 share unscaled distances, k3 shares scaled distances with itself
+    assert num_calls[0] == 2
+
+    # inputs with different identities do not share distances
+    num_calls[0] = 0
+    Sum(k1, k2)(X, Z.clone())
+    Sum(k1, k2)(X.clone(), Z)
+    assert num_calls[0] == 2
+
+
 def test_active_dims_overlap_ok():
     k1 = Matern52(2, variance, lengthscale[0], active_dims=[0, 1])
     k2 = Matern32(2, variance, lengthscale[0], active_dims=[1, 2])
@@ -168,3 +205,71 @@ def test_transforming():
     assert_equal(K_owarp.data, Warping(k, owarping_coef=owarping_coef)(X, Z).data)
     assert_equal(K_vscale.data, VerticalScaling(k, vscaling_fn=vscaling_fn)(X, Z).data)
     assert_equal(K.exp().data, Exponent(k)(X, Z).data)
+
+
+@pytest.mark.parametrize("kernel_class", [RBF, Exponential, Matern32, Matern52, RationalQuadratic])
+def test_random_fourier_features(kernel_class):
+    torch.manual_seed(0)
+    X = torch.rand(10, 2, dtype=torch.double)
+    Z = torch.rand(5, 2, dtype=torch.double)
+    V = torch.randn(5, 3, dtype=torch.double)
+    kernel = kernel_class(input_dim=2, lengthscale=torch.tensor([0.5, 0.7])).double()
+    rff = RandomFourierFeatures(kernel, num_features=10000).double()
+
+    assert_equal(rff(X, Z), kernel(X, Z), prec=0.05)
+    assert_equal(rff(X, diag=True), kernel(X, diag=True))
+    assert_equal(rff.matmul(X, V, Z), rff(X, Z).matmul(V), prec=1e-10)
+
+
+@pytest.mark.parametrize("input_dim", [1, 2])
+def test_grid_interpolation(input_dim):
+    torch.manual_seed(0)
+    X = torch.rand(10, input_dim, dtype=torch.double)
+    Z = torch.rand(5, input_dim, dtype=torch.double)
+    V = torch.randn(5, 3, dtype=torch.double)
+    kernel = RBF(input_dim, lengthscale=torch.tensor(0.3)).double()
+    ski = GridInterpolation(kernel, grid_size=50, grid_bounds=[(0, 1)] * input_dim).double()
+
+    assert_equal(ski(X, Z), kernel(X, Z), prec=1e-4)
+    assert_equal(ski(X, diag=True), ski(X).diag(), prec=1e-10)
+    assert_equal(ski.matmul(X, V, Z), ski(X, Z).matmul(V), prec=1e-10)
+
+
+@pytest.mark.parametrize("kernel_class", [RBF, RationalQuadratic, Exponential, Matern32, Matern52])
+def test_batched_kernel(kernel_class):
+    X = torch.rand(3, 5, 2)
+    Z = torch.rand(3, 4, 2)
+    variance = torch.rand(3) + 0.5
+    lengthscale = torch.rand(3, 2) + 0.5
+    kernel = Sum(kernel_class(2, variance, lengthscale), Constant(2, torch.tensor(0.5)))
+    kernel = Sum(kernel, WhiteNoise(2, torch.tensor([0.1, 0.2, 0.3])))
+
+    K = kernel(X, Z)
+    Kdiag = kernel(X, diag=True)
+    KX = kernel(X)
+    for i in range(3):
+        kernel_i = Sum(kernel_class(2, variance[i], lengthscale[i]), Constant(2, torch.tensor(0.5)))
+        kernel_i = Sum(kernel_i, WhiteNoise(2, torch.tensor(0.1 * (i + 1))))
+        assert_equal(K[i], kernel_i(X[i], Z[i]))
+        assert_equal(Kdiag[i], kernel_i(X[i], diag=True))
+        assert_equal(KX[i], kernel_i(X[i]))
+
+
+@pytest.mark.parametrize("kernel", [
+    Brownian(1),
+    Coregionalize(2),
+    Linear(2),
+    Periodic(2),
+    Polynomial(2, degree=2),
+    RandomFourierFeatures(RBF(2), num_features=10),
+    GridInterpolation(RBF(2), grid_size=10, grid_bounds=[(0, 1)] * 2),
+    Sum(RBF(2), Periodic(2)),
+], ids=lambda kernel: type(kernel).__name__)
+def test_unbatched_kernel_raises(kernel):
+    X = torch.rand(3, 10, kernel.input_dim)
+    with pytest.raises(NotImplementedError):
+        kernel(X)
+    with pytest.raises(NotImplementedError):
+        kernel(X, diag=True)
+    with pytest.raises(NotImplementedError):
+        kernel(X, X)
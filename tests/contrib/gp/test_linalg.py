@@ -0,0 +1,127 @@
+from __future__ import absolute_import, division, print_function
+
+import pytest
+import torch
+
+import pyro
+import pyro.distributions as dist
+from pyro.contrib.gp.kernels import RBF, GridInterpolation, Matern32, RandomFourierFeatures
+from pyro.contrib.gp.linalg import IterativeSolver
+from pyro.contrib.gp.models import GPRegression
+from pyro.infer import Trace_ELBO
+from tests.common import assert_equal
+
+
+def _data(N=20):
+    pyro.set_rng_seed(0)
+    X = torch.rand(N, 2, dtype=torch.double)
+    y = (3 * X.sum(-1)).sin() + 0.1 * torch.randn(N, dtype=torch.double)
+    return X, y
+
+
+@pytest.mark.parametrize("precond_rank", [0, 5])
+@pytest.mark.parametrize("block_size", [7, 1024])
+def test_solve(precond_rank, block_size):
+    X, y = _data()
+    kernel = RBF(input_dim=2).double()
+    solver = IterativeSolver(tol=1e-10, precond_rank=precond_rank, block_size=block_size)
+    B = torch.stack([y, y.flip(0)], dim=-1)
+
+    K = kernel(X).detach() + 0.1 * torch.eye(20, dtype=torch.double)
+    assert_equal(solver.matmul(kernel, X, B, 0.1), K.matmul(B), prec=1e-8)
+    assert_equal(solver.solve(kernel, X, B, 0.1), torch.gesv(B, K)[0], prec=1e-6)
+
+
+@pytest.mark.parametrize("kernel_class", [RBF, Matern32])
+def test_log_prob(kernel_class):
+    X, y = _data()
+    noise = torch.tensor(0.1, dtype=torch.double, requires_grad=True)
+    kernel = kernel_class(input_dim=2).double()
+    kernel.set_mode("guide")
+    params = [kernel.variance_unconstrained, kernel.lengthscale_unconstrained, noise]
+    solver = IterativeSolver(tol=1e-10, num_probes=2000, num_lanczos=15, block_size=7)
+
+    K = kernel(X) + noise * torch.eye(20, dtype=torch.double)
+    expected = dist.MultivariateNormal(torch.zeros(20, dtype=torch.double), K).log_prob(y)
+    expected_grads = torch.autograd.grad(expected, params)
+
+    kernel.set_mode("guide")
+    actual = solver.log_prob(kernel, X, y, noise)
+    actual_grads = torch.autograd.grad(actual, params)
+
+    assert_equal(actual, expected, prec=0.5)
+    for actual_grad, expected_grad in zip(actual_grads, expected_grads):
+        assert_equal(actual_grad, expected_grad, prec=0.1 * expected_grad.abs().max().item())
+
+
+@pytest.mark.parametrize("full_cov", [False, True])
+@pytest.mark.parametrize("noiseless", [False, True])
+def test_gpr_forward(full_cov, noiseless):
+    X, y = _data()
+    Xnew = torch.rand(5, 2, dtype=torch.double)
+    kernel = RBF(input_dim=2).double()
+    noise = torch.tensor(0.1, dtype=torch.double)
+    gpr = GPRegression(X, y, kernel, noise=noise.clone())
+    solver = IterativeSolver(tol=1e-10)
+    gpr_iterative = GPRegression(X, y, kernel, noise=noise.clone(), solver=solver)
+
+    loc, cov = gpr(Xnew, full_cov, noiseless)
+    actual_loc, actual_cov = gpr_iterative(Xnew, full_cov, noiseless)
+    assert_equal(actual_loc, loc, prec=1e-6)
+    assert_equal(actual_cov, cov, prec=1e-6)
+
+
+def test_gpr_forward_switch_solver():
+    X, y = _data()
+    Xnew = torch.rand(5, 2, dtype=torch.double)
+    kernel = RBF(input_dim=2).double()
+    gpr = GPRegression(X, y, kernel, noise=torch.tensor(0.1, dtype=torch.double))
+    with torch.no_grad():
+        expected_loc, expected_cov = gpr(Xnew)
+        # cached factorizations of one solver must not be reused by another
+        for solver in [IterativeSolver(tol=1e-10), None, IterativeSolver(tol=1e-10), None]:
+            gpr.solver = solver
+            loc, cov = gpr(Xnew)
+            assert_equal(loc, expected_loc, prec=1e-6)
+            assert_equal(cov, expected_cov, prec=1e-6)
+
+
+def test_gpr_train():
+    X, y = _data()
+    kernel = RBF(input_dim=2).double()
+    gpr = GPRegression(X, None, kernel, noise=torch.tensor(0.1, dtype=torch.double),
+                       solver=IterativeSolver(tol=1e-10, num_probes=1000, num_lanczos=15))
+    f_loc, f_var = gpr.model()
+    assert_equal(f_loc, torch.zeros(20, dtype=torch.double))
+    assert_equal(f_var, kernel(X, diag=True) + 0.1 + gpr.jitter, prec=1e-6)
+
+    gpr.set_data(X, y)
+    loss = Trace_ELBO().differentiable_loss(gpr.model, gpr.guide)
+    grads = torch.autograd.grad(loss, [gpr.noise_unconstrained, kernel.lengthscale_unconstrained])
+    for grad in grads:
+        assert torch.isfinite(grad).all()
+
+
+@pytest.mark.parametrize("approximate", ["rff", "ski"])
+def test_log_prob_structured_kernel(approximate):
+    X, y = _data()
+    noise = torch.tensor(0.1, dtype=torch.double, requires_grad=True)
+    if approximate == "rff":
+        kernel = RandomFourierFeatures(RBF(input_dim=2), num_features=50).double()
+    else:
+        kernel = GridInterpolation(RBF(input_dim=2), grid_size=20, grid_bounds=[(0, 1), (0, 1)]).double()
+    kernel.set_mode("guide")
+    params = [kernel.kern.variance_unconstrained, kernel.kern.lengthscale_unconstrained, noise]
+    solver = IterativeSolver(tol=1e-10, num_probes=2000, num_lanczos=15)
+
+    K = kernel(X) + noise * torch.eye(20, dtype=torch.double)
+    expected = dist.MultivariateNormal(torch.zeros(20, dtype=torch.double), K).log_prob(y)
+    expected_grads = torch.autograd.grad(expected, params)
+
+    kernel.set_mode("guide")
+    actual = solver.log_prob(kernel, X, y, noise)
+    actual_grads = torch.autograd.grad(actual, params)
+
+    assert_equal(actual, expected, prec=0.5)
+    for actual_grad, expected_grad in zip(actual_grads, expected_grads):
+        assert_equal(actual_grad, expected_grad, prec=0.1 * expected_grad.abs().max().item())
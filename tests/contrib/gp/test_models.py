@@ -6,12 +6,14 @@ from collections import defaultdict, namedtuple
 import pytest
 import torch
 
+import pyro
 import pyro.distributions as dist
-from pyro.contrib.gp.kernels import Cosine, Matern32, RBF, WhiteNoise
+from pyro.contrib.gp.kernels import Cosine, Matern32, RBF, Sum, WhiteNoise
 from pyro.contrib.gp.likelihoods import Gaussian
 from pyro.contrib.gp.models import (GPLVM, GPRegression, SparseGPRegression,
                                     VariationalGP, VariationalSparseGP)
-from pyro.contrib.gp.util import train
+from pyro.contrib.gp.util import conditional, minibatches, train
+from pyro.infer import TraceMeanField_ELBO
 from pyro.infer.mcmc.hmc import HMC
 from pyro.infer.mcmc.mcmc import MCMC
 from tests.common import assert_equal
@@ -164,6 +166,77 @@ def test_forward_with_empty_latent_shape(model_class, X, y, kernel, likelihood):
     assert_equal(cov0.diag(), var1)
 
 
+@pytest.mark.parametrize("model_class, X, y, kernel, likelihood", _TEST_CASES(), ids=TEST_IDS)
+def test_forward_block_size(model_class, X, y, kernel, likelihood):
+    if model_class is SparseGPRegression or model_class is VariationalSparseGP:
+        gp = model_class(X, y, kernel, X, likelihood)
+    else:
+        gp = model_class(X, y, kernel, likelihood)
+
+    Xnew = torch.tensor([[2.0, 3.0, 1.0], [4.0, 1.0, 2.0], [1.0, 2.0, 3.0]])
+    expected_loc, expected_var = gp(Xnew)
+    expected_cov = gp(Xnew, full_cov=True)[1]
+    gp.block_size = 2
+    loc, var = gp(Xnew)
+    assert_equal(loc, expected_loc)
+    assert_equal(var, expected_var)
+    assert_equal(gp(Xnew, full_cov=True)[1], expected_cov)
+
+
+@pytest.mark.parametrize("whiten", [False, True])
+@pytest.mark.parametrize("model_class, X, y, kernel, likelihood", _TEST_CASES(), ids=TEST_IDS)
+def test_forward_cache(model_class, X, y, kernel, likelihood, whiten):
+    if model_class is SparseGPRegression:
+        gp = model_class(X, y, kernel, X.clone(), likelihood)
+    elif model_class is VariationalSparseGP:
+        gp = model_class(X, y, kernel, X.clone(), likelihood, whiten=whiten)
+    elif model_class is VariationalGP:
+        gp = model_class(X, y, kernel, likelihood, whiten=whiten)
+    else:
+        gp = model_class(X, y, kernel, likelihood)
+    if model_class in (VariationalGP, VariationalSparseGP):
+        scale_tril_name = "f_scale_tril" if model_class is VariationalGP else "u_scale_tril"
+        scale_tril = getattr(gp, scale_tril_name + "_unconstrained")
+        scale_tril.data.copy_(torch.rand(scale_tril.shape).tril())
+
+    num_factorizations = [0]
+    posterior_factor = gp._posterior_factor
+
+    def counted_posterior_factor():
+        num_factorizations[0] += 1
+        return posterior_factor()
+
+    gp._posterior_factor = counted_posterior_factor
+    Xnew = torch.tensor([[2.0, 3.0, 1.0], [4.0, 1.0, 2.0]])
+
+    expected_loc, expected_cov = gp(Xnew, full_cov=True)
+    assert num_factorizations[0] == 1  # no cache when gradients are required
+    with torch.no_grad():
+        for _ in range(3):
+            loc, cov = gp(Xnew, full_cov=True)
+            assert_equal(loc, expected_loc)
+            assert_equal(cov, expected_cov)
+    assert num_factorizations[0] == 2
+
+    # updating parameters in-place invalidates the cache
+    with torch.no_grad():
+        gp.kernel.lengthscale_unconstrained.data.add_(0.5)
+        gp(Xnew)
+    assert num_factorizations[0] == 3
+    expected_loc, expected_cov = gp(Xnew, full_cov=True)
+    with torch.no_grad():
+        loc, cov = gp(Xnew, full_cov=True)
+    assert_equal(loc, expected_loc)
+    assert_equal(cov, expected_cov)
+    assert num_factorizations[0] == 4
+
+    # changing training data invalidates the cache
+    with torch.no_grad():
+        gp.set_data(X + 1, y)
+        gp(Xnew)
+    assert num_factorizations[0] == 5
+
+
 @pytest.mark.parametrize("model_class, X, y, kernel, likelihood", _TEST_CASES(), ids=TEST_IDS)
 @pytest.mark.init(rng_seed=0)
 def test_inference(model_class, X, y, kernel, likelihood):
@@ -244,6 +317,64 @@ def test_inference_whiten_vsgp():
     assert_equal((loc - target).abs().mean().item(), 0, prec=0.07)
 
 
+@pytest.mark.init(rng_seed=0)
+def test_inference_minibatch_vsgp():
+    N = 1000
+    X = dist.Uniform(torch.zeros(N), torch.ones(N)*5).sample()
+    y = 0.5 * torch.sin(3*X) + dist.Normal(torch.zeros(N), torch.ones(N)*0.5).sample()
+    kernel = RBF(input_dim=1)
+    Xu = torch.arange(0., 5.5, 0.5)
+
+    vsgp = VariationalSparseGP(X, y, kernel, Xu, Gaussian(), whiten=True)
+    optimizer = torch.optim.Adam(vsgp.parameters(), lr=0.03)
+    train(vsgp, optimizer, batch_size=100)
+    assert vsgp.X is X and vsgp.y is y
+
+    Xnew = torch.arange(0., 5.05, 0.05)
+    loc, var = vsgp(Xnew, full_cov=False)
+    target = 0.5 * torch.sin(3*Xnew)
+
+    assert_equal((loc - target).abs().mean().item(), 0, prec=0.07)
+
+
+@pytest.mark.parametrize("model_class", [SparseGPRegression, VariationalSparseGP])
+def test_subsample(model_class):
+    N, B = 100, 10
+    X = torch.rand(N, 3)
+    y = torch.rand(2, N)
+    if model_class is SparseGPRegression:
+        gp = model_class(X, y, _kernel(), X[:5].clone(), subsample_size=B)
+    else:
+        gp = model_class(X, y, _kernel(), X[:5].clone(), _likelihood(), subsample_size=B)
+
+    trace = pyro.poutine.trace(gp.model).get_trace()
+    name = "SGPR/y" if model_class is SparseGPRegression else "VSGP/y"
+    assert trace.nodes[name]["value"].shape == (2, B)
+    assert trace.nodes[name]["scale"] == N / B
+
+    # the subsampled log likelihood of VariationalSparseGP is unbiased
+    if model_class is VariationalSparseGP:
+        pyro.set_rng_seed(0)
+        loss_fn = TraceMeanField_ELBO().differentiable_loss
+        with torch.no_grad():
+            actual_loss = sum(loss_fn(gp.model, gp.guide) for _ in range(1000)) / 1000
+            gp.subsample_size = None
+            expected_loss = sum(loss_fn(gp.model, gp.guide) for _ in range(100)) / 100
+        assert_equal(actual_loss, expected_loss, prec=0.05 * expected_loss.abs().item())
+
+
+@pytest.mark.parametrize("batch_size", [3, 4])
+def test_minibatches(batch_size):
+    X = torch.arange(10.).unsqueeze(-1)
+    y = torch.stack([torch.arange(10.), -torch.arange(10.)])
+    batches = list(minibatches(X, y, batch_size))
+    assert len(batches) == -(-10 // batch_size)
+    for X_batch, y_batch in batches:
+        assert_equal(X_batch.squeeze(-1), y_batch[0])
+        assert_equal(X_batch.squeeze(-1), -y_batch[1])
+    assert_equal(torch.cat([X_batch for X_batch, _ in batches]).sort(0)[0], X)
+
+
 @pytest.mark.parametrize("model_class, X, y, kernel, likelihood", _TEST_CASES(), ids=TEST_IDS)
 def test_inference_with_empty_latent_shape(model_class, X, y, kernel, likelihood):
     # regression models don't use latent_shape (default=torch.Size([]))
@@ -351,6 +482,50 @@ def test_gplvm(model_class, X, y, kernel, likelihood):
     gplvm(Xnew=X)
 
 
+@pytest.mark.parametrize("noiseless", [True, False])
+def test_iter_sample(noiseless):
+    X = torch.linspace(-1, 1, 10).unsqueeze(-1)
+    y = X.squeeze(-1).sin()
+    gpr = GPRegression(X, y, RBF(input_dim=1), noise=torch.tensor(0.01), jitter=1e-4)
+    Xnews = [torch.rand(1, 1) * 4 - 2 for _ in range(25)]
+
+    pyro.set_rng_seed(0)
+    sampler = gpr.iter_sample(noiseless=noiseless)
+    ynews = [sampler(xnew) for xnew in Xnews]
+
+    # compare against recomputing the Cholesky factor from scratch for each point
+    pyro.set_rng_seed(0)
+    X, y = X.clone(), y.clone()
+    Kff = gpr.kernel(X).detach() + torch.eye(10) * gpr.noise.detach()
+    for xnew, ynew in zip(Xnews, ynews):
+        loc, var = conditional(xnew, X, gpr.kernel, y, None, Kff.cholesky(), jitter=gpr.jitter)
+        if not noiseless:
+            var = var + gpr.noise
+        expected_ynew = dist.Normal(loc, var.sqrt()).sample()
+        assert_equal(ynew, expected_ynew, prec=1e-6)
+
+        N = X.size(0)
+        Kffnew = Kff.new_empty(N + 1, N + 1)
+        Kffnew[:N, :N] = Kff
+        Kffnew[N, :N] = Kffnew[:N, N] = gpr.kernel(X, xnew).squeeze()
+        Kffnew[N, N] = gpr.kernel(xnew, xnew).squeeze() + gpr.jitter
+        if Kffnew.logdet() > -15.:
+            Kff = Kffnew.detach()
+            X = torch.cat((X, xnew))
+            y = torch.cat((y, expected_ynew))
+
+
+def test_iter_sample_grad():
+    X = torch.linspace(-1, 1, 10).unsqueeze(-1)
+    gpr = GPRegression(X, X.squeeze(-1).sin(), RBF(input_dim=1), noise=torch.tensor(0.01))
+    sampler = gpr.iter_sample(noiseless=False)
+    for _ in range(5):
+        xnew = torch.rand(1, 1, requires_grad=True)
+        ynew = sampler(xnew)
+        ynew.sum().backward()
+        assert xnew.grad is not None
+
+
 def _pre_test_mean_function():
     def f(x):
         return 2 * x + 3 + 5 * torch.sin(7 * x)
@@ -455,3 +630,35 @@ def test_mean_function_VSGP_whiten():
     optimizer = torch.optim.Adam(gpmodule.parameters(), lr=0.1)
     train(gpmodule, optimizer)
     _post_test_mean_function(gpmodule, Xnew, ynew)
+
+
+@pytest.mark.parametrize("latent_shape", [(), (2,)])
+def test_batched_gpr(latent_shape):
+    batch_size, N, M = 3, 6, 4
+    X = torch.rand(batch_size, N, 2)
+    Xnew = torch.rand(batch_size, M, 2)
+    y = torch.randn(latent_shape + (batch_size, N))
+    variance = torch.rand(batch_size) + 0.5
+    lengthscale = torch.rand(batch_size, 2) + 0.5
+    noise = torch.rand(batch_size) + 0.1
+
+    def make_kernel(variance, lengthscale):
+        return Sum(Matern32(2, variance, lengthscale), WhiteNoise(2, torch.tensor(0.1)))
+
+    gpr = GPRegression(X, y, make_kernel(variance, lengthscale), noise=noise)
+    loss = TraceMeanField_ELBO().differentiable_loss(gpr.model, gpr.guide)
+    loc, cov = gpr(Xnew, full_cov=True, noiseless=False)
+    loc_diag, var = gpr(Xnew, noiseless=False)
+    assert loc.shape == latent_shape + (batch_size, M)
+    assert cov.shape == latent_shape + (batch_size, M, M)
+
+    expected_loss = 0
+    for i in range(batch_size):
+        gpr_i = GPRegression(X[i], y[..., i, :], make_kernel(variance[i], lengthscale[i]), noise=noise[i])
+        expected_loss = expected_loss + TraceMeanField_ELBO().differentiable_loss(gpr_i.model, gpr_i.guide)
+        loc_i, cov_i = gpr_i(Xnew[i], full_cov=True, noiseless=False)
+        assert_equal(loc[..., i, :], loc_i)
+        assert_equal(cov[..., i, :, :], cov_i)
+        assert_equal(loc_diag[..., i, :], loc_i)
+        assert_equal(var[..., i, :], cov_i.diagonal(dim1=-2, dim2=-1))
+    assert_equal(loss, expected_loss)
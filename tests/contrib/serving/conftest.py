@@ -0,0 +1,6 @@
+from __future__ import absolute_import, division, print_function
+
+import sys
+
+# pyro.contrib.serving uses async syntax, which requires Python 3.5 or later.
+collect_ignore = ["test_batching.py"] if sys.version_info < (3, 5) else []
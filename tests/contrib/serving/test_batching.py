@@ -0,0 +1,116 @@
+from __future__ import absolute_import, division, print_function
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import torch
+
+import pyro
+import pyro.distributions as dist
+from pyro.contrib.serving import BatchingServer
+from tests.common import assert_equal
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+def serve(server, requests):
+    async def main():
+        async with server:
+            return await asyncio.gather(*[server.submit(*args) for args in requests])
+    return run(main())
+
+
+@pytest.mark.parametrize("max_batch_size", [1, 3, 10, 100])
+@pytest.mark.parametrize("use_executor", [False, True])
+def test_matches_unbatched(max_batch_size, use_executor):
+    weight = torch.randn(3, 2)
+
+    def fn(x, y):
+        return {"sum": x.matmul(weight) + y, "pair": (x, y.sum(-1))}
+
+    requests = [(torch.randn(3), torch.randn(2)) for _ in range(20)]
+    executor = ThreadPoolExecutor(1) if use_executor else None
+    server = BatchingServer(fn, max_batch_size=max_batch_size, max_latency=0.01, executor=executor)
+    results = serve(server, requests)
+
+    assert server.num_requests == len(requests)
+    assert server.num_batches >= len(requests) / max_batch_size
+    for (x, y), result in zip(requests, results):
+        expected = fn(x.unsqueeze(0), y.unsqueeze(0))
+        assert_equal(result["sum"], expected["sum"][0])
+        assert_equal(result["pair"][0], x)
+        assert_equal(result["pair"][1], expected["pair"][1][0])
+
+
+def test_batch_size_bound():
+    sizes = []
+
+    def fn(x):
+        sizes.append(x.size(0))
+        return x * 2
+
+    server = BatchingServer(fn, max_batch_size=4, max_latency=1.0)
+    serve(server, [(torch.tensor(float(i)),) for i in range(10)])
+    assert max(sizes) <= 4
+    assert sum(sizes) == 10
+
+
+def test_latency_flush():
+    sizes = []
+
+    def fn(x):
+        sizes.append(x.size(0))
+        return x
+
+    server = BatchingServer(fn, max_batch_size=1000, max_latency=0.001)
+
+    async def main():
+        async with server:
+            first = await server.submit(torch.tensor(1.))
+            second = await server.submit(torch.tensor(2.))
+            return first, second
+
+    assert run(main()) == (1., 2.)
+    assert sizes == [1, 1]
+
+
+def test_dim():
+    def fn(x):
+        assert x.shape == (2, 5)
+        return x * 2
+
+    server = BatchingServer(fn, max_batch_size=5, max_latency=1.0, dim=-1)
+    results = serve(server, [(torch.tensor([i, -i]),) for i in range(5)])
+    for i, result in enumerate(results):
+        assert_equal(result, torch.tensor([2 * i, -2 * i]))
+
+
+def test_error_propagates():
+    def fn(x):
+        raise ValueError("bad batch")
+
+    server = BatchingServer(fn, max_batch_size=2, max_latency=0.001)
+    with pytest.raises(ValueError, match="bad batch"):
+        serve(server, [(torch.zeros(1),)] * 3)
+
+
+def test_not_running():
+    server = BatchingServer(lambda x: x)
+    with pytest.raises(RuntimeError):
+        run(server.submit(torch.zeros(1)))
+
+
+def test_plate_guide():
+    loc = torch.randn(2)
+
+    def guide(x):
+        with pyro.plate("data", x.size(0)):
+            return pyro.sample("z", dist.Normal(x.matmul(loc), 1e-6))
+
+    requests = [(torch.randn(2),) for _ in range(7)]
+    results = serve(BatchingServer(guide, max_batch_size=4), requests)
+    for (x,), z in zip(requests, results):
+        assert_equal(z, x.matmul(loc), prec=1e-4)
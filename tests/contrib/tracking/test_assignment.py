@@ -8,7 +8,8 @@ import logging
 
 import pyro
 import pyro.distributions as dist
-from pyro.contrib.tracking.assignment import MarginalAssignment, MarginalAssignmentPersistent, MarginalAssignmentSparse
+from pyro.contrib.tracking.assignment import (MarginalAssignment, MarginalAssignmentPersistent,
+                                              MarginalAssignmentSparse, MarginalAssignmentSparsePersistent)
 from tests.common import assert_equal
 
 INF = float('inf')
@@ -312,3 +313,71 @@ def test_persistent_independent_subproblems(num_objects, num_frames, num_detecti
     assert_equal(assign_probs_1[:, :, -1], assign_probs[:, :num_detections, -1])
     assert_equal(assign_probs_2[:, :, :-1], assign_probs[:, num_detections:, num_objects:-1])
     assert_equal(assign_probs_2[:, :, -1], assign_probs[:, num_detections:, -1])
+
+
+@pytest.mark.parametrize('structure', ['dense', 'sparse', 'persistent'])
+def test_bp_tol_warm_start_batched(structure):
+    num_objects, num_detections, num_frames = 4, 3, 2
+    batch_shape = (3,)
+    pyro.set_rng_seed(0)
+    exists_logits = torch.randn(batch_shape + (num_objects,))
+    args = ()
+    if structure == 'persistent':
+        assign_logits = torch.randn(batch_shape + (num_frames, num_detections, num_objects))
+        Solver = MarginalAssignmentPersistent
+    else:
+        assign_logits = torch.randn(batch_shape + (num_detections, num_objects))
+        Solver = MarginalAssignment
+        if structure == 'sparse':
+            edges, _ = dense_to_sparse(assign_logits[0])
+            assign_logits = assign_logits[..., edges[0], edges[1]]
+            Solver = MarginalAssignmentSparse
+            args = (num_objects, num_detections, edges)
+
+    def solve(exists_logits, assign_logits, **kwargs):
+        return Solver(*(args + (exists_logits, assign_logits)), **kwargs)
+
+    # stopping early at convergence
+    solver = solve(exists_logits, assign_logits, bp_iters=200, bp_tol=1e-6)
+    assert solver.bp_info.num_iters < 200
+    assert solver.bp_info.residual <= 1e-6
+
+    # batched problems match individual problems
+    for b in range(batch_shape[0]):
+        expected = solve(exists_logits[b], assign_logits[b], bp_iters=200)
+        assert_equal(solver.exists_dist.probs[b], expected.exists_dist.probs, prec=1e-4)
+        assert_equal(solver.assign_dist.probs[b], expected.assign_dist.probs, prec=1e-4)
+
+    # warm starting a similar problem converges faster to the same solution
+    assign_logits = assign_logits + 0.01 * torch.randn(assign_logits.shape)
+    cold = solve(exists_logits, assign_logits, bp_iters=200, bp_tol=1e-6)
+    warm = solve(exists_logits, assign_logits, bp_iters=200, bp_tol=1e-6, bp_init=solver.bp_info.messages)
+    assert warm.bp_info.num_iters < cold.bp_info.num_iters
+    assert_equal(warm.exists_dist.probs, cold.exists_dist.probs, prec=1e-4)
+    assert_equal(warm.assign_dist.probs, cold.assign_dist.probs, prec=1e-4)
+
+
+@pytest.mark.parametrize('gated', [False, True], ids=['full', 'gated'])
+@pytest.mark.parametrize('batch_shape', [(), (2,)], ids=str)
+def test_sparse_persistent_vs_dense(batch_shape, gated):
+    num_objects, num_frames, num_detections = 4, 5, 3
+    pyro.set_rng_seed(0)
+    exists_logits = torch.randn(batch_shape + (num_objects,))
+    assign_logits = torch.randn(batch_shape + (num_frames, num_detections, num_objects))
+    edges = torch.tensor([[t, j, i]
+                          for t in range(num_frames)
+                          for j in range(num_detections)
+                          for i in range(num_objects)
+                          if not gated or (t + j + i) % 3]).t()
+    if gated:
+        gate = assign_logits.new_empty(num_frames, num_detections, num_objects).fill_(-INF)
+        gate[edges[0], edges[1], edges[2]] = 0
+        assign_logits = assign_logits + gate
+    expected = MarginalAssignmentPersistent(exists_logits, assign_logits, bp_iters=50)
+
+    sparse_assign_logits = assign_logits[..., edges[0], edges[1], edges[2]]
+    actual = MarginalAssignmentSparsePersistent(num_objects, num_frames, num_detections, edges,
+                                                exists_logits, sparse_assign_logits, bp_iters=50)
+    assert_equal(actual.exists_dist.probs, expected.exists_dist.probs)
+    assert_equal(actual.assign_probs,
+                 expected.assign_dist.probs[..., edges[0], edges[1], edges[2]])
@@ -2,8 +2,10 @@ from __future__ import absolute_import, division, print_function
 
 import torch
 
+from pyro.contrib.tracking import distributions
 from pyro.contrib.tracking.distributions import EKFDistribution
-from pyro.contrib.tracking.dynamic_models import NcpContinuous, NcvContinuous
+from pyro.contrib.tracking.dynamic_models import NcpContinuous, NcpDiscrete, NcvContinuous, NcvDiscrete
+from tests.common import assert_equal
 
 import pytest
 
@@ -23,3 +25,34 @@ def test_EKFDistribution_smoke(Model, dim, time):
     dP0, dR = torch.autograd.grad(log_prob, [P0, R])
     assert dP0.shape == P0.shape
     assert dR.shape == R.shape
+
+
+@pytest.mark.parametrize('Model', [NcpContinuous, NcvContinuous, NcpDiscrete, NcvDiscrete])
+@pytest.mark.parametrize('time', [1, 2, 7])
+def test_EKFDistribution_parallel_filter(Model, time, monkeypatch):
+    dim = 2
+    x0 = torch.rand(2*dim, dtype=torch.double)
+    ys = torch.randn(time, dim, dtype=torch.double)
+    P0 = torch.eye(2*dim, dtype=torch.double).requires_grad_()
+    R = 0.5 * torch.eye(dim, dtype=torch.double).requires_grad_()
+    model = Model(2*dim, torch.tensor(2.0, dtype=torch.double))
+    dist = EKFDistribution(x0, P0, model, R, time_steps=time, dt=0.5)
+    log_prob = dist.log_prob(ys)
+    states = dist.filter_states(ys)
+    grads = torch.autograd.grad(log_prob, [P0, R])
+
+    # compare with the sequential filter
+    monkeypatch.setattr(distributions, '_LINEAR_DYNAMIC_MODELS', ())
+    expected_log_prob = dist.log_prob(ys)
+    expected_states = dist.filter_states(ys)
+    expected_grads = torch.autograd.grad(expected_log_prob, [P0, R])
+    assert_equal(log_prob, expected_log_prob)
+    for state, expected_state in zip(states, expected_states):
+        assert state.time == expected_state.time
+        assert_equal(state.mean, expected_state.mean)
+        assert_equal(state.cov, expected_state.cov)
+    # gradients agree on symmetric perturbations of the covariance matrices; the
+    # sequential filter of Ncp models does not differentiate through mean2pv
+    if Model in (NcvContinuous, NcvDiscrete):
+        for grad, expected_grad in zip(grads, expected_grads):
+            assert_equal(grad + grad.t(), expected_grad + expected_grad.t())
@@ -1,5 +1,6 @@
 from __future__ import absolute_import, division, print_function
 
+import pytest
 import torch
 
 from pyro.contrib.tracking.dynamic_models import (NcpContinuous, NcvContinuous,
@@ -181,3 +182,30 @@ def test_NcvDiscrete():
     assert_equal(Q, Q1)
     assert Q1.shape == (d, d)
     # Q has rank `dimension/2`, so it is not a valid cov matrix
+
+
+@pytest.mark.parametrize('Model', [NcpContinuous, NcpDiscrete, NcvContinuous, NcvDiscrete])
+def test_process_noise_cache(Model):
+    d = 4
+    model = Model(d, 2.0)
+    param = next(model.parameters())
+    for dt in [0.5, 2.0, torch.tensor(3.0)]:
+        L = model.process_noise_scale_tril(dt)
+        assert_equal(L.tril(), L)
+        assert_equal(L.mm(L.t()), model.process_noise_cov(dt), prec=1e-5)
+
+    # cached matrices follow changes of noise parameters
+    Q = model.process_noise_cov(0.5)
+    param.data.mul_(2)
+    assert_equal(model.process_noise_cov(0.5), 2 * Q)
+
+    # gradients can be computed repeatedly from cached matrices
+    for _ in range(2):
+        grad = torch.autograd.grad(model.process_noise_cov(0.5).sum(), [param])[0]
+        assert_equal(grad, Q.sum() / param.detach() * 2)
+
+    # the cache is bounded
+    for i in range(2 * model.cache_size):
+        model.jacobian(0.1 * i)
+        model.process_noise_cov(0.1 * i)
+    assert len(model._matrix_cache) == model.cache_size
@@ -1,8 +1,9 @@
 from __future__ import absolute_import, division, print_function
 
+import pytest
 import torch
 
-from pyro.contrib.tracking.extended_kalman_filter import EKFState
+from pyro.contrib.tracking.extended_kalman_filter import BatchedEKFState, EKFState
 from pyro.contrib.tracking.dynamic_models import NcpContinuous, NcvContinuous
 from pyro.contrib.tracking.measurements import PositionMeasurement
 
@@ -78,3 +79,39 @@ def test_EKFState_with_NcvContinuous():
     assert dz.shape == (measurement.dimension,)
     assert S.shape == (measurement.dimension, measurement.dimension)
     assert_not_equal(ekf_state3.mean, ekf_state2.mean, prec=1e-5)
+
+
+@pytest.mark.parametrize('dynamic_model', [NcpContinuous(dimension=3, sv2=2.0),
+                                           NcvContinuous(dimension=6, sa2=2.0)],
+                         ids=['ncp', 'ncv'])
+def test_BatchedEKFState(dynamic_model):
+    num_tracks = 4
+    d = dynamic_model.dimension
+    t = 0.0
+    dt = 2.0
+    states = [EKFState(dynamic_model, torch.rand(d), (1 + i) * torch.eye(d), time=t)
+              for i in range(num_tracks)]
+    batched_state = BatchedEKFState.from_states(states)
+    assert len(batched_state) == num_tracks
+    assert batched_state.mean.shape == (num_tracks, d)
+    assert batched_state.cov.shape == (num_tracks, d, d)
+    assert_equal(batched_state.mean_pv, torch.stack([s.mean_pv for s in states]))
+    assert_equal(batched_state.cov_pv, torch.stack([s.cov_pv for s in states]))
+
+    batched_state = batched_state.predict(dt)
+    states = [state.predict(dt) for state in states]
+    assert batched_state.time == t + dt
+    measurements = [PositionMeasurement(mean=torch.rand(3), cov=torch.eye(3), time=t + dt)
+                    for _ in range(num_tracks)]
+
+    dz, S = batched_state.innovation(measurements)
+    log_likelihood = batched_state.log_likelihood_of_update(measurements)
+    updated_state, _ = batched_state.update(measurements)
+    for i, (state, measurement) in enumerate(zip(states, measurements)):
+        expected_dz, expected_S = state.innovation(measurement)
+        assert_equal(dz[i], expected_dz)
+        assert_equal(S[i], expected_S)
+        assert_equal(log_likelihood[i], state.log_likelihood_of_update(measurement))
+        expected_state, _ = state.update(measurement)
+        assert_equal(updated_state[i].mean, expected_state.mean, prec=1e-5)
+        assert_equal(updated_state[i].cov, expected_state.cov, prec=1e-5)
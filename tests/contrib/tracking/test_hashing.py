@@ -5,7 +5,7 @@ import logging
 import pytest
 import torch
 
-from pyro.contrib.tracking.hashing import LSH, ApproxSet, merge_points
+from pyro.contrib.tracking.hashing import LSH, ApproxSet, GridIndex, merge_points
 from tests.common import assert_equal
 
 logger = logging.getLogger(__name__)
@@ -153,3 +153,34 @@ def test_merge_points_large(dim, radius):
     assert set(sum(groups, ())) == set(range(len(points)))
     d2 = (merged_points.unsqueeze(-2) - merged_points.unsqueeze(-3)).pow(2).sum(-1)
     assert d2.min() < radius ** 2
+
+
+@pytest.mark.parametrize('scale', [0.1, 1, 10, 100])
+def test_aps_try_add_batch(scale):
+    points = torch.randn(100, 2) * scale
+    aps = ApproxSet(scale / 2)
+    expected = [aps.try_add(point) for point in points]
+    actual = ApproxSet(scale / 2).try_add_batch(points)
+    assert actual.tolist() == expected
+
+
+@pytest.mark.parametrize('searchsorted', [True, False], ids=['searchsorted', 'sort'])
+@pytest.mark.parametrize('radius', [0.1, 0.5])
+@pytest.mark.parametrize('dim', [1, 2, 3])
+def test_grid_index_query(dim, radius, searchsorted, monkeypatch):
+    if not searchsorted and hasattr(torch, 'searchsorted'):
+        monkeypatch.delattr(torch, 'searchsorted')
+    points = torch.randn(200, dim)
+    queries = torch.randn(100, dim)
+    edges = GridIndex(points, radius).query(queries)
+    assert edges.shape[0] == 2
+
+    expected = ((queries.unsqueeze(1) - points).pow(2).sum(-1) < radius ** 2).nonzero()
+    assert sorted(map(tuple, edges.t().tolist())) == sorted(map(tuple, expected.tolist()))
+
+
+def test_grid_index_empty():
+    index = GridIndex(torch.zeros(0, 2), 1.)
+    assert index.query(torch.randn(5, 2)).shape == (2, 0)
+    index = GridIndex(torch.randn(5, 2), 1.)
+    assert index.query(torch.zeros(0, 2)).shape == (2, 0)
@@ -1,5 +1,6 @@
 from __future__ import absolute_import, division, print_function
 
+import itertools
 import logging
 import math
 
@@ -161,6 +162,83 @@ def test_distribution_3(temperature):
     assert_equal(expected_probs.reshape(-1), actual_probs.reshape(-1), prec=1e-2)
 
 
+@pytest.mark.parametrize('temperature', [0, 1], ids=['map', 'sample'])
+def test_num_samples_distribution(temperature):
+    #       +--------+
+    #  z1 --|--> x1  |
+    #   |   |        |
+    #   V   |        |
+    #  z2 --|--> x2  |
+    #       +--------+
+    num_samples = 10000
+    data = torch.tensor([[-1., -1., 0.], [-1., 1., 1.]])
+
+    @config_enumerate
+    def model(z1=None, z2=None):
+        p = pyro.param("p", torch.tensor([[0.25, 0.75], [0.1, 0.9]]))
+        loc = pyro.param("loc", torch.tensor([-1., 1.]))
+        z1 = pyro.sample("z1", dist.Categorical(p[0]), obs=z1)
+        z2 = pyro.sample("z2", dist.Categorical(p[z1]), obs=z2)
+        with pyro.plate("data", 3):
+            pyro.sample("x1", dist.Normal(loc[z1], 1.), obs=data[0])
+            pyro.sample("x2", dist.Normal(loc[z2], 1.), obs=data[1])
+
+    sampled_model = infer_discrete(model, first_available_dim=-2, temperature=temperature,
+                                   num_samples=num_samples)
+    sampled_trace = poutine.trace(sampled_model).get_trace()
+    assert sampled_trace.nodes["z1"]["value"].shape == (num_samples, 1)
+    assert sampled_trace.nodes["z2"]["value"].shape == (num_samples, 1)
+    assert sampled_trace.nodes["x1"]["fn"].batch_shape == (num_samples, 3)
+    conditioned_traces = {(z1, z2): poutine.trace(model).get_trace(z1=torch.tensor(z1),
+                                                                   z2=torch.tensor(z2))
+                          for z1 in [0, 1] for z2 in [0, 1]}
+
+    # Check joint posterior over (z1, z2).
+    actual_probs = torch.empty(2, 2)
+    expected_probs = torch.empty(2, 2)
+    for (z1, z2), tr in conditioned_traces.items():
+        expected_probs[z1, z2] = tr.log_prob_sum().exp()
+        actual_probs[z1, z2] = ((sampled_trace.nodes["z1"]["value"] == z1) &
+                                (sampled_trace.nodes["z2"]["value"] == z2)).float().mean()
+    if temperature:
+        expected_probs = expected_probs / expected_probs.sum()
+    else:
+        argmax = expected_probs.reshape(-1).max(0)[1]
+        expected_probs[:] = 0
+        expected_probs.reshape(-1)[argmax] = 1
+    assert_equal(expected_probs, actual_probs, prec=1e-2)
+
+
+@pytest.mark.parametrize('topk', [1, 3, 6])
+@pytest.mark.parametrize('temperature', [0, 1], ids=['map', 'sample'])
+def test_topk_distribution(temperature, topk):
+    num_samples = 10000
+    probs = torch.tensor([0.3, 0.05, 0.25, 0.1, 0.2, 0.1])
+    locs = torch.arange(6.)
+    data = torch.tensor([3.5, 4.])
+
+    def model():
+        z = pyro.sample("z", dist.Categorical(probs), infer={"enumerate": "parallel", "topk": topk})
+        with pyro.plate("data", 2):
+            pyro.sample("x", dist.Normal(locs[z], 1.), obs=data)
+        return z
+
+    sampled_model = infer_discrete(model, first_available_dim=-2, temperature=temperature,
+                                   num_samples=num_samples)
+    samples = sampled_model().squeeze(-1)
+
+    # Check the posterior is restricted to the topk values of the prior.
+    logits = probs.log() + dist.Normal(locs.unsqueeze(-1), 1.).log_prob(data).sum(-1)
+    index = probs.topk(topk)[1]
+    expected_probs = torch.zeros(6)
+    if temperature:
+        expected_probs[index] = (logits[index] - logits[index].logsumexp(0)).exp()
+    else:
+        expected_probs[index[logits[index].max(0)[1]]] = 1
+    actual_probs = torch.stack([(samples == z).float().mean() for z in range(6)])
+    assert_equal(actual_probs, expected_probs, prec=2e-2)
+
+
 @pytest.mark.parametrize('length', [1, 2, 10, 100])
 @pytest.mark.parametrize('temperature', [0, 1], ids=['map', 'sample'])
 def test_hmm_smoke(temperature, length):
@@ -191,6 +269,134 @@ def test_hmm_smoke(temperature, length):
     logger.info("inferred states: {}".format(list(map(int, inferred_states))))
 
 
+@pytest.mark.parametrize('temperature', [0, 1], ids=['map', 'sample'])
+def test_markov_plate_distribution(temperature):
+    num_particles = 10000
+    num_states, num_steps = 2, 3
+    data = torch.tensor([0.5, -1., 1.])
+    init_probs = torch.tensor([0.6, 0.4])
+    transition_probs = torch.tensor([[0.7, 0.3], [0.2, 0.8]])
+    locs = torch.tensor([-1., 1.])
+
+    @config_enumerate
+    def model(num_particles=1):
+        with pyro.plate("num_particles", num_particles, dim=-2):
+            time = pyro.markov_plate("time", num_steps, dim=-1)
+            with time as t:
+                x_prev = time.previous("x", num_states)
+                probs = torch.where((t == 0).unsqueeze(-1), init_probs, transition_probs[x_prev])
+                x = pyro.sample("x", dist.Categorical(probs))
+                pyro.sample("y", dist.Normal(locs[x], 1.), obs=data)
+        return x
+
+    def sequential_model(xs):
+        x = None
+        for t in pyro.markov(range(num_steps)):
+            probs = init_probs if x is None else transition_probs[x]
+            x = pyro.sample("x_{}".format(t), dist.Categorical(probs), obs=xs[t])
+            pyro.sample("y_{}".format(t), dist.Normal(locs[x], 1.), obs=data[t])
+
+    sampled_model = infer_discrete(model, first_available_dim=-3, temperature=temperature)
+    samples = sampled_model(num_particles)
+    assert samples.shape == (num_particles, num_steps)
+
+    # Check the joint posterior over all states by exhaustive enumeration.
+    states = list(itertools.product(range(num_states), repeat=num_steps))
+    logits = torch.stack([poutine.trace(sequential_model).get_trace(torch.tensor(xs)).log_prob_sum()
+                          for xs in states])
+    if temperature:
+        expected_probs = (logits - logits.logsumexp(0)).exp()
+    else:
+        expected_probs = torch.zeros(len(states))
+        expected_probs[logits.max(0)[1]] = 1
+    actual_probs = torch.stack([(samples == torch.tensor(xs)).all(-1).float().mean()
+                                for xs in states])
+    assert_equal(actual_probs, expected_probs, prec=2e-2)
+
+
+@pytest.mark.parametrize('temperature', [0, 1], ids=['map', 'sample'])
+def test_markov_plate_num_samples(temperature):
+    num_samples = 10000
+    num_states, num_steps = 2, 3
+    data = torch.tensor([0.5, -1., 1.])
+    init_probs = torch.tensor([0.6, 0.4])
+    transition_probs = torch.tensor([[0.7, 0.3], [0.2, 0.8]])
+    locs = torch.tensor([-1., 1.])
+
+    @config_enumerate
+    def model():
+        time = pyro.markov_plate("time", num_steps, dim=-1)
+        with time as t:
+            x_prev = time.previous("x", num_states)
+            probs = torch.where((t == 0).unsqueeze(-1), init_probs, transition_probs[x_prev])
+            x = pyro.sample("x", dist.Categorical(probs))
+            pyro.sample("y", dist.Normal(locs[x], 1.), obs=data)
+        return x
+
+    def sequential_model(xs):
+        x = None
+        for t in pyro.markov(range(num_steps)):
+            probs = init_probs if x is None else transition_probs[x]
+            x = pyro.sample("x_{}".format(t), dist.Categorical(probs), obs=xs[t])
+            pyro.sample("y_{}".format(t), dist.Normal(locs[x], 1.), obs=data[t])
+
+    sampled_model = infer_discrete(model, first_available_dim=-2, temperature=temperature,
+                                   num_samples=num_samples)
+    samples = sampled_model()
+    assert samples.shape == (num_samples, num_steps)
+
+    # Check the joint posterior over all states by exhaustive enumeration.
+    states = list(itertools.product(range(num_states), repeat=num_steps))
+    logits = torch.stack([poutine.trace(sequential_model).get_trace(torch.tensor(xs)).log_prob_sum()
+                          for xs in states])
+    if temperature:
+        expected_probs = (logits - logits.logsumexp(0)).exp()
+    else:
+        expected_probs = torch.zeros(len(states))
+        expected_probs[logits.max(0)[1]] = 1
+    actual_probs = torch.stack([(samples == torch.tensor(xs)).all(-1).float().mean()
+                                for xs in states])
+    assert_equal(actual_probs, expected_probs, prec=2e-2)
+
+
+def test_num_samples_invalid():
+    with pytest.raises(ValueError):
+        infer_discrete(lambda: None, first_available_dim=-1, num_samples=0)
+
+
+@pytest.mark.parametrize('length', [1, 2, 5, 10])
+def test_markov_plate_viterbi(length):
+    data = torch.randn(length)
+    init_probs = torch.tensor([0.5, 0.3, 0.2])
+    transition_probs = torch.tensor([[0.8, 0.1, 0.1], [0.1, 0.8, 0.1], [0.1, 0.1, 0.8]])
+    locs = torch.tensor([-1., 0., 1.])
+
+    @config_enumerate
+    def sequential_model(data):
+        x = None
+        states = []
+        for t in pyro.markov(range(len(data))):
+            probs = init_probs if x is None else transition_probs[x]
+            x = pyro.sample("x_{}".format(t), dist.Categorical(probs))
+            pyro.sample("y_{}".format(t), dist.Normal(locs[x], 1.), obs=data[t])
+            states.append(x)
+        return states
+
+    @config_enumerate
+    def vectorized_model(data):
+        time = pyro.markov_plate("time", len(data), dim=-1)
+        with time as t:
+            x_prev = time.previous("x", 3)
+            probs = torch.where((t == 0).unsqueeze(-1), init_probs, transition_probs[x_prev])
+            x = pyro.sample("x", dist.Categorical(probs))
+            pyro.sample("y", dist.Normal(locs[x], 1.), obs=data)
+        return x
+
+    expected = torch.stack(infer_discrete(sequential_model, first_available_dim=-1, temperature=0)(data))
+    actual = infer_discrete(vectorized_model, first_available_dim=-2, temperature=0)(data)
+    assert_equal(actual, expected)
+
+
 @pytest.mark.xfail(reason='infer_discrete log_prob is incorrect')
 @pytest.mark.parametrize('nderivs', [0, 1], ids=['value', 'grad'])
 def test_prob(nderivs):
@@ -18,7 +18,7 @@ import pyro.poutine as poutine
 from pyro.distributions.testing.rejection_gamma import ShapeAugmentedGamma
 from pyro.infer import SVI, config_enumerate
 from pyro.infer.enum import iter_discrete_traces
-from pyro.infer.traceenum_elbo import TraceEnum_ELBO
+from pyro.infer.traceenum_elbo import TraceEnum_ELBO, _compute_dice_elbo
 from pyro.infer.util import LAST_CACHE_SIZE
 from pyro.util import torch_isnan
 from tests.common import assert_equal, skipif_param
@@ -527,6 +527,81 @@ def test_elbo_categoricals(enumerate1, enumerate2, enumerate3, max_plate_nesting
         ]))
 
 
+@pytest.mark.parametrize("topk", [1, 3, 6])
+def test_elbo_topk_model(topk):
+    pyro.clear_param_store()
+    data = torch.tensor([0., 2., 5.])
+    probs = torch.tensor([[0.3, 0.1, 0.1, 0.2, 0.2, 0.1],
+                          [0.1, 0.1, 0.4, 0.1, 0.2, 0.1],
+                          [0.1, 0.1, 0.1, 0.1, 0.1, 0.5]])
+    locs = pyro.param("locs", torch.arange(6.))
+
+    def model():
+        locs = pyro.param("locs")
+        with pyro.plate("data", 3):
+            z = pyro.sample("z", dist.Categorical(probs), infer={"enumerate": "parallel", "topk": topk})
+            pyro.sample("x", dist.Normal(locs[z], 1.), obs=data)
+
+    def guide():
+        pass
+
+    # Model sites are pruned to the topk values of their local factors.
+    index = probs.topk(topk, -1)[1]
+    log_joint = probs.gather(-1, index).log() + dist.Normal(locs[index], 1.).log_prob(data.unsqueeze(-1))
+    expected_loss = -log_joint.logsumexp(-1).sum()
+    expected_grad = grad(expected_loss, [locs])[0]
+
+    elbo = TraceEnum_ELBO(max_plate_nesting=1)
+    loss = elbo.differentiable_loss(model, guide)
+    actual_grad = grad(loss, [locs])[0]
+    assert_equal(loss, expected_loss)
+    assert_equal(actual_grad, expected_grad)
+
+
+@pytest.mark.parametrize("topk", [1, 2, 4])
+def test_elbo_topk_guide(topk):
+    pyro.clear_param_store()
+    p = torch.tensor([0.1, 0.2, 0.3, 0.4])
+    pyro.param("q", torch.tensor([0.4, 0.3, 0.2, 0.1]), constraint=constraints.simplex)
+
+    def model():
+        pyro.sample("z", dist.Categorical(p))
+
+    def guide():
+        q = pyro.param("q")
+        pyro.sample("z", dist.Categorical(q), infer={"enumerate": "parallel", "topk": topk})
+
+    # Guide sites are pruned and renormalized over their topk values.
+    q_unconstrained = pyro.param("q").unconstrained()
+    q_topk, index = pyro.param("q").topk(topk)
+    q_topk = q_topk / q_topk.sum()
+    expected_loss = (q_topk * (q_topk.log() - p[index].log())).sum()
+    expected_grad = grad(expected_loss, [q_unconstrained])[0]
+
+    elbo = TraceEnum_ELBO(max_plate_nesting=0)
+    loss = elbo.differentiable_loss(model, guide)
+    actual_grad = grad(loss, [q_unconstrained])[0]
+    assert_equal(loss, expected_loss)
+    assert_equal(actual_grad, expected_grad)
+
+
+def test_compute_marginals_topk_error():
+    pyro.clear_param_store()
+
+    def model():
+        z = pyro.sample("z", dist.Categorical(torch.ones(4)), infer={"enumerate": "parallel", "topk": 2})
+        pyro.sample("x", dist.Normal(z.float(), 1.), obs=torch.tensor(0.))
+
+    def guide():
+        pass
+
+    elbo = TraceEnum_ELBO(max_plate_nesting=0)
+    with pytest.raises(NotImplementedError):
+        elbo.compute_marginals(model, guide)
+    with pytest.raises(NotImplementedError):
+        elbo.sample_posterior(model, guide)
+
+
 @pytest.mark.parametrize("enumerate1", [None, "parallel"])
 @pytest.mark.parametrize("enumerate2", [None, "parallel"])
 @pytest.mark.parametrize("enumerate3", [None, "parallel"])
@@ -1258,6 +1333,122 @@ def test_hmm_enumerate_model_and_guide(num_steps):
     elbo.differentiable_loss(model, guide, data)
 
 
+@pytest.mark.parametrize('num_steps', [1, 2, 3, 10, 17])
+def test_hmm_markov_plate(num_steps):
+    pyro.clear_param_store()
+    data = torch.randn(num_steps, 2)
+
+    def params():
+        switch_probs = pyro.param("switch_probs", torch.tensor([0.3, 0.7]),
+                                  constraint=constraints.simplex)
+        init_probs = pyro.param("init_probs", torch.tensor([0.2, 0.3, 0.5]),
+                                constraint=constraints.simplex)
+        transition_probs = pyro.param("transition_probs",
+                                      torch.tensor([[[0.8, 0.1, 0.1], [0.1, 0.8, 0.1], [0.1, 0.1, 0.8]],
+                                                    [[0.2, 0.4, 0.4], [0.4, 0.2, 0.4], [0.4, 0.4, 0.2]]]),
+                                      constraint=constraints.simplex)
+        locs = pyro.param("locs", torch.tensor([-1., 0., 1.]))
+        return switch_probs, init_probs, transition_probs, locs
+
+    @config_enumerate
+    def sequential_model(data):
+        switch_probs, init_probs, transition_probs, locs = params()
+        z = pyro.sample("z", dist.Categorical(switch_probs))
+        x = None
+        for t in pyro.markov(range(len(data))):
+            probs = init_probs if x is None else transition_probs[z, x]
+            x = pyro.sample("x_{}".format(t), dist.Categorical(probs))
+            with pyro.plate("obs_{}".format(t), 2, dim=-1):
+                pyro.sample("y_{}".format(t), dist.Normal(locs[x], 1.), obs=data[t])
+
+    @config_enumerate
+    def vectorized_model(data):
+        switch_probs, init_probs, transition_probs, locs = params()
+        z = pyro.sample("z", dist.Categorical(switch_probs))
+        time = pyro.markov_plate("time", len(data), dim=-2)
+        with time as t:
+            x_prev = time.previous("x", 3)
+            first = (t == 0).reshape(-1, 1, 1)
+            probs = torch.where(first, init_probs, transition_probs[z, x_prev])
+            x = pyro.sample("x", dist.Categorical(probs))
+            with pyro.plate("obs", 2, dim=-1):
+                pyro.sample("y", dist.Normal(locs[x], 1.), obs=data)
+
+    def guide(data):
+        pass
+
+    elbo = TraceEnum_ELBO(max_plate_nesting=2)
+    expected_loss = elbo.differentiable_loss(sequential_model, guide, data)
+    actual_loss = elbo.differentiable_loss(vectorized_model, guide, data)
+    assert_equal(actual_loss, expected_loss)
+
+    names = ["switch_probs", "init_probs", "transition_probs", "locs"]
+    unconstrained = [pyro.param(name).unconstrained() for name in names]
+    expected_grads = grad(expected_loss, unconstrained, allow_unused=True)
+    actual_grads = grad(actual_loss, unconstrained, allow_unused=True)
+    for name, param, actual, expected in zip(names, unconstrained, actual_grads, expected_grads):
+        if expected is None:  # transition_probs is unused in a single step
+            expected = torch.zeros_like(param)
+        assert_equal(actual, expected, msg=name)
+
+
+@pytest.mark.parametrize('num_steps', [2, 3])
+def test_elbo_schedule_reuse(num_steps):
+    pyro.clear_param_store()
+
+    @config_enumerate
+    def model(data):
+        probs = pyro.param("probs", torch.tensor([[0.8, 0.2], [0.3, 0.7]]), constraint=constraints.simplex)
+        locs = pyro.param("locs", torch.tensor([-1., 1.]))
+        scale = pyro.sample("scale", dist.LogNormal(0., 1.))
+        with pyro.plate("sequences", data.size(0), dim=-1):
+            x = 0
+            for t in pyro.markov(range(data.size(1))):
+                x = pyro.sample("x_{}".format(t), dist.Categorical(probs[x]))
+                pyro.sample("y_{}".format(t), dist.Normal(locs[x], scale), obs=data[:, t])
+
+    def guide(data):
+        loc = pyro.param("loc", torch.tensor(0.))
+        pyro.sample("scale", dist.LogNormal(loc, 1.))
+
+    elbo = TraceEnum_ELBO(max_plate_nesting=1)
+    for size in [num_steps, num_steps, num_steps + 1, num_steps]:
+        data = torch.randn(4, size)
+        model_trace, guide_trace = next(elbo._get_traces(model, guide, data))
+        schedule = elbo._get_schedule(model_trace, guide_trace)
+        expected = _compute_dice_elbo(model_trace, guide_trace)
+        actual = _compute_dice_elbo(model_trace, guide_trace, schedule)
+        assert_equal(actual, expected)
+    assert len(elbo._schedules) == 2
+
+
+@pytest.mark.parametrize('max_schedules', [0, 1, 2, None])
+def test_elbo_schedule_eviction(max_schedules):
+    pyro.clear_param_store()
+
+    @config_enumerate
+    def model(data):
+        probs = pyro.param("probs", torch.tensor([0.3, 0.7]), constraint=constraints.simplex)
+        with pyro.plate("data", data.size(0), dim=-1):
+            for t in range(data.size(1)):
+                x = pyro.sample("x_{}".format(t), dist.Categorical(probs))
+                pyro.sample("y_{}".format(t), dist.Normal(x.type_as(data), 1.), obs=data[:, t])
+
+    def guide(data):
+        pass
+
+    elbo = TraceEnum_ELBO(max_plate_nesting=1, max_schedules=max_schedules)
+    schedules = []
+    # the model structure changes with the length of data
+    for size in [1, 2, 3, 1, 3]:
+        model_trace, guide_trace = next(elbo._get_traces(model, guide, torch.randn(2, size)))
+        schedules.append(elbo._get_schedule(model_trace, guide_trace))
+    expected_size = {0: 0, 1: 1, 2: 2, None: 3}[max_schedules]
+    assert len(elbo._schedules) == expected_size
+    assert (schedules[3] is schedules[0]) == (max_schedules is None)
+    assert (schedules[4] is schedules[2]) == (max_schedules in (2, None))
+
+
 def _check_loss_and_grads(expected_loss, actual_loss):
     assert_equal(actual_loss, expected_loss,
                  msg='Expected:\n{}\nActual:\n{}'.format(expected_loss.detach().cpu().numpy(),
@@ -12,9 +12,9 @@ import pyro
 import pyro.distributions as dist
 import pyro.ops.jit
 import pyro.poutine as poutine
-from pyro.infer import (SVI, JitTrace_ELBO, JitTraceEnum_ELBO, JitTraceGraph_ELBO, JitTraceMeanField_ELBO, Trace_ELBO,
-                        TraceEnum_ELBO, TraceGraph_ELBO, TraceMeanField_ELBO, infer_discrete)
-from pyro.optim import Adam
+from pyro.infer import (SVI, JitSVI, JitTrace_ELBO, JitTraceEnum_ELBO, JitTraceGraph_ELBO, JitTraceMeanField_ELBO,
+                        Trace_ELBO, TraceEnum_ELBO, TraceGraph_ELBO, TraceMeanField_ELBO, infer_discrete)
+from pyro.optim import SGD, Adam, ClippedAdam
 from pyro.poutine.indep_messenger import CondIndepStackFrame
 from pyro.util import ignore_jit_warnings
 from tests.common import assert_equal
@@ -483,3 +483,86 @@ def test_jit_arange_workaround():
 
     compiled = torch.jit.trace(fn, torch.ones(3))
     assert_equal(compiled(torch.ones(10)), torch.arange(10))
+
+
+@pytest.mark.parametrize('optim', [
+    lambda: SGD({"lr": 0.01}),
+    lambda: SGD({"lr": 0.01, "momentum": 0.9, "dampening": 0.1, "weight_decay": 0.1}),
+    lambda: SGD({"lr": 0.01, "momentum": 0.9, "nesterov": True}),
+    lambda: Adam({"lr": 0.1}),
+    lambda: Adam({"lr": 0.1, "betas": (0.8, 0.9), "weight_decay": 0.1}),
+    lambda: ClippedAdam({"lr": 0.1, "clip_norm": 1.0, "lrd": 0.9}),
+], ids=['sgd', 'sgd_momentum', 'sgd_nesterov', 'adam', 'adam_decay', 'clipped_adam'])
+@pytest.mark.parametrize('Elbo', [Trace_ELBO, JitTrace_ELBO])
+def test_jit_svi(Elbo, optim):
+    data = torch.tensor([0.5, 1.0, 3.0])
+
+    def model(data, num_params):
+        loc = pyro.param("loc", torch.zeros(2))
+        scale = pyro.param("scale", torch.ones(2), constraint=constraints.positive)
+        if num_params > 2:
+            # a param that first appears after a few steps
+            loc = loc + pyro.param("shift", torch.tensor(0.5))
+        with pyro.plate("data", len(data)):
+            pyro.sample("obs", dist.Normal(loc.sum(), scale.prod()), obs=data)
+
+    def guide(data, num_params):
+        pass
+
+    expected = []
+    for svi_class in [SVI, JitSVI]:
+        pyro.clear_param_store()
+        elbo = Elbo(ignore_jit_warnings=True)
+        svi = svi_class(model, guide, optim(), elbo)
+        for step in range(10):
+            svi.step(data, num_params=2 if step < 4 else 3)
+        params = {name: pyro.param(name).detach().clone() for name in ["loc", "scale", "shift"]}
+        if svi_class is SVI:
+            expected = params
+        else:
+            assert_equal(params, expected, prec=1e-6)
+
+
+def test_jit_svi_retrace():
+    data = torch.randn(5)
+
+    def model(data, names):
+        loc = sum(pyro.param(name, torch.tensor(0.)) for name in names)
+        with pyro.plate("data", len(data)):
+            pyro.sample("obs", dist.Normal(loc, 1.), obs=data)
+
+    def guide(data, names):
+        pass
+
+    pyro.clear_param_store()
+    svi = JitSVI(model, guide, Adam({"lr": 0.1}), JitTrace_ELBO())
+    svi.step(data, names=("a",))
+    compiled_step = svi._compiled_step
+    svi.step(data, names=("a",))
+    assert svi._compiled_step is compiled_step
+    svi.step(data, names=("a", "b"))
+    assert svi._compiled_step is not compiled_step
+    compiled_step = svi._compiled_step
+    svi.step(data, names=("a", "b"))
+    assert svi._compiled_step is compiled_step
+
+    # gradients that are replaced outside of the step are kept
+    pyro.infer.util.zero_grads([pyro.param("a").unconstrained()])
+    svi.step(data, names=("a", "b"))
+    assert svi._compiled_step is compiled_step
+    assert pyro.param("a").unconstrained().grad is svi._grads["a"]
+
+    # optimizer state of params seen before is carried over
+    def step_counts():
+        return {name: svi._flat_state[0][start:end] for name, (_, start, end) in svi._layout.items()}
+
+    assert_equal(step_counts(), {"a": torch.tensor([5.]), "b": torch.tensor([3.])})
+    svi.step(data, names=("b",))
+    assert_equal(step_counts(), {"b": torch.tensor([4.])})
+
+
+def test_jit_svi_unsupported_optim():
+    with pytest.raises(NotImplementedError):
+        JitSVI(lambda: None, lambda: None, pyro.optim.Adagrad({"lr": 0.1}), Trace_ELBO())
+    with pytest.raises(NotImplementedError):
+        JitSVI(lambda: None, lambda: None, Adam(lambda module_name, param_name: {"lr": 0.1}), Trace_ELBO())
@@ -0,0 +1,103 @@
+from __future__ import absolute_import, division, print_function
+
+import functools
+
+import pytest
+import torch
+
+import pyro
+import pyro.distributions as dist
+from pyro.infer import EmpiricalMarginal, Importance, MemoizedMarginal
+from tests.common import assert_equal
+
+
+class CountingImportance(Importance):
+    num_runs = 0
+
+    def run(self, *args, **kwargs):
+        CountingImportance.num_runs += 1
+        return super(CountingImportance, self).run(*args, **kwargs)
+
+
+def model(probs):
+    return pyro.sample("x", dist.Bernoulli(probs))
+
+
+@pytest.fixture
+def posterior():
+    CountingImportance.num_runs = 0
+    return functools.partial(CountingImportance, num_samples=10)
+
+
+def test_cache_hits(posterior):
+    marginal = MemoizedMarginal(model, posterior)
+    d1 = marginal(torch.tensor(0.5))
+    d2 = marginal(torch.tensor(0.5))
+    assert d1 is d2
+    assert CountingImportance.num_runs == 1
+    assert marginal.cache_info() == (1, 1, 0, 128, 1)
+
+    # Tensors are compared by value, including dtype and shape.
+    marginal(torch.tensor(0.25))
+    marginal(torch.tensor([0.5]))
+    marginal(torch.tensor(0.5, dtype=torch.float32))
+    marginal(probs=torch.tensor(0.5))
+    assert CountingImportance.num_runs == 5
+    assert marginal.cache_info() == (1, 5, 0, 128, 5)
+
+
+@pytest.mark.parametrize("maxsize", [0, 1, 2, None])
+def test_cache_eviction(posterior, maxsize):
+    marginal = MemoizedMarginal(model, posterior, maxsize=maxsize)
+    for probs in [0.1, 0.2, 0.1, 0.3, 0.1, 0.2]:
+        marginal(torch.tensor(probs))
+    info = marginal.cache_info()
+    assert info.hits + info.misses == 6
+    assert info.misses == CountingImportance.num_runs
+    expected_misses = {0: 6, 1: 6, 2: 4, None: 3}[maxsize]
+    assert info.misses == expected_misses
+    assert info.maxsize == maxsize
+    assert info.currsize == min(3, 3 if maxsize is None else maxsize)
+    assert info.evictions == (0 if maxsize == 0 else info.misses - info.currsize)
+
+
+def test_cache_clear(posterior):
+    marginal = MemoizedMarginal(model, posterior)
+    marginal(torch.tensor(0.5))
+    marginal(torch.tensor(0.5))
+    marginal.cache_clear()
+    assert marginal.cache_info() == (0, 0, 0, 128, 0)
+    marginal(torch.tensor(0.5))
+    assert CountingImportance.num_runs == 2
+
+
+def test_sites():
+
+    def model():
+        x = pyro.sample("x", dist.Normal(0., 1.))
+        y = pyro.sample("y", dist.Normal(x, 1.), obs=torch.tensor(2.))
+        return x + y
+
+    marginal = MemoizedMarginal(model, functools.partial(Importance, num_samples=10), sites="x")
+    d = marginal()
+    assert isinstance(d, EmpiricalMarginal)
+    assert d.sample().shape == ()
+    assert marginal() is d
+
+
+def test_nested_search():
+    # The marginal of a sub-model is computed once per distinct argument,
+    # even when it is conditioned on inside a loop of the outer model.
+    pyro.set_rng_seed(0)
+    inner = MemoizedMarginal(model, functools.partial(Importance, num_samples=2000))
+
+    def outer(probs):
+        x = pyro.sample("x", dist.Bernoulli(probs))
+        pyro.sample("y", inner(probs), obs=x)
+        return x
+
+    posterior = Importance(outer, num_samples=100).run(torch.tensor(0.3))
+    outer_marginal = EmpiricalMarginal(posterior)
+    # The outer model is also used as its own guide, so inner is called twice per sample.
+    assert inner.cache_info() == (199, 1, 0, 128, 1)
+    assert_equal(outer_marginal.mean, torch.tensor(0.3 ** 2 / (0.3 ** 2 + 0.7 ** 2)), prec=0.2)
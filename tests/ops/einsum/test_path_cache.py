@@ -0,0 +1,79 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import opt_einsum
+import pytest
+import torch
+
+from pyro.ops.einsum import (_PATH_CACHE, clear_path_cache, contract, contract_expression, load_path_cache,
+                             path_cache_info, path_cache_plans, save_path_cache, set_path_cache_size)
+from tests.common import assert_equal
+
+EXAMPLES = [
+    ('ab->', [(2, 3)]),
+    ('ab,ab->ab', [(3, 4), (3, 4)]),
+    ('ab,bc,cd->', [(5, 6), (6, 7), (7, 4)]),
+    ('a,abi,bcij,bdik->ijk', [(5,), (5, 6, 2), (6, 7, 2, 3), (6, 4, 2, 2)]),
+]
+
+
+@pytest.fixture
+def path_cache():
+    maxsize = _PATH_CACHE.maxsize
+    clear_path_cache()
+    yield
+    set_path_cache_size(maxsize)
+    clear_path_cache()
+
+
+def test_lru(path_cache):
+    set_path_cache_size(2)
+    contract_expression('ab,bc->', (2, 3), (3, 4))
+    contract_expression('ab,bc->', (2, 3), (3, 4))
+    assert path_cache_info() == (1, 1, 0, 2, 1)
+
+    contract_expression('ab,bc->', (2, 3), (3, 5))
+    contract_expression('ab,bc->', (2, 3), (3, 4))  # most recently used
+    contract_expression('ab,bc->', (2, 3), (3, 6))  # evicts (3, 5)
+    assert path_cache_info() == (2, 3, 1, 2, 2)
+    assert [plan.shapes[1] for plan in path_cache_plans()] == [(3, 4), (3, 6)]
+
+    set_path_cache_size(1)
+    assert path_cache_info() == (2, 3, 2, 1, 1)
+
+
+def test_no_cache(path_cache):
+    contract_expression('ab,bc->', (2, 3), (3, 4), cache_path=False)
+    assert path_cache_info() == (0, 0, 0, _PATH_CACHE.maxsize, 0)
+
+
+@pytest.mark.parametrize('equation,shapes', EXAMPLES)
+def test_plan_cost(path_cache, equation, shapes):
+    contract_expression(equation, *shapes)
+    plan, = path_cache_plans()
+    operands = [torch.randn(shape).numpy() for shape in shapes]
+    _, info = opt_einsum.contract_path(equation, *operands)
+    assert plan.equation == equation
+    assert plan.flops == info.opt_cost
+    assert plan.largest_intermediate == info.largest_intermediate
+
+
+def test_save_load(path_cache, tmpdir):
+    for equation, shapes in EXAMPLES:
+        contract_expression(equation, *shapes)
+    expected_plans = path_cache_plans()
+    filename = os.path.join(str(tmpdir), 'paths.json')
+    save_path_cache(filename)
+    clear_path_cache()
+
+    load_path_cache(filename)
+    assert path_cache_plans() == expected_plans
+    assert path_cache_info().currsize == len(EXAMPLES)
+    for equation, shapes in EXAMPLES:
+        operands = [torch.randn(shape) for shape in shapes]
+        actual = contract(equation, *operands, backend='torch')
+        expected = torch.einsum(equation, operands)
+        assert_equal(actual, expected)
+    assert path_cache_info().hits == len(EXAMPLES)
+    assert path_cache_info().misses == 0
@@ -11,7 +11,8 @@ import torch
 
 import pyro.ops.jit
 from pyro.distributions.util import logsumexp
-from pyro.ops.contract import _partition_terms, contract_tensor_tree, contract_to_tensor, naive_ubersum, ubersum
+from pyro.ops.contract import (ContractionSchedule, _partition_terms, contract_tensor_tree, contract_to_tensor,
+                               naive_ubersum, ubersum)
 from pyro.ops.einsum.adjoint import require_backward
 from pyro.ops.rings import LogRing
 from pyro.poutine.indep_messenger import CondIndepStackFrame
@@ -277,6 +278,32 @@ def test_contract_tensor_tree(example):
                 assert term.shape[frame.dim] == frame.size
 
 
+@pytest.mark.parametrize('example', EXAMPLES)
+def test_contraction_schedule(example):
+    symbol_to_size = dict(zip('abcdij', [4, 5, 6, 7, 2, 3]))
+    sum_dims = example['sum_dims']
+    schedule = ContractionSchedule(sum_dims)
+
+    # The first call records a program, later calls replay it.
+    for step in range(3):
+        tensor_tree = OrderedDict()
+        for t, shapes in example['shape_tree'].items():
+            for dims in shapes:
+                tensor = torch.randn(tuple(symbol_to_size[s] for s in dims))
+                tensor._pyro_dims = dims
+                tensor_tree.setdefault(t, []).append(tensor)
+
+        expected = contract_tensor_tree(tensor_tree, sum_dims)
+        actual = assert_immutable(schedule.__call__)(tensor_tree)
+        assert len(schedule._programs) == 1
+        assert list(actual) == list(expected)
+        for ordinal in expected:
+            assert len(actual[ordinal]) == len(expected[ordinal])
+            for actual_term, expected_term in zip(actual[ordinal], expected[ordinal]):
+                assert actual_term._pyro_dims == expected_term._pyro_dims
+                assert_equal(actual_term, expected_term)
+
+
 # Let abcde be enum dims and ijk be batch dims.
 UBERSUM_EXAMPLES = [
     ('->', ''),
@@ -582,6 +609,34 @@ def test_ubersum_5(impl):
     assert_equal(actual, expected)
 
 
+@pytest.mark.parametrize('num_steps', [1, 2, 3, 7, 8])
+@pytest.mark.parametrize('backend', ['log', 'map'])
+def test_ubersum_markov(backend, num_steps):
+    # x,y {i,t}  <--- chains of a along t
+    #     |
+    #   w {}
+    backend = 'pyro.ops.einsum.torch_{}'.format(backend)
+    a, d, i, t = 3, 2, 2, num_steps
+    w = torch.randn(d)
+    x = torch.randn(i, t, a, a, d)
+    y = torch.randn(i, t, a, d)
+    actual, = ubersum('d,itabd,itbd->', w, x, y, batch_dims='it', backend=backend,
+                      markov_dims={'t': ('a', 'b')})
+
+    # Contract each chain by a sequential forward recursion.
+    if backend.endswith('log'):
+        reduce_ = logsumexp
+    else:
+        def reduce_(x, dim):
+            return x.max(dim)[0]
+    xy = x + y.unsqueeze(-3)
+    message = reduce_(xy[:, 0], -3)
+    for s in range(1, t):
+        message = reduce_(message.unsqueeze(-2) + xy[:, s], -3)
+    expected = reduce_(w + reduce_(message, -2).sum(0), -1)
+    assert_equal(actual, expected)
+
+
 @pytest.mark.parametrize('impl,implemented', [(naive_ubersum, True), (ubersum, False)])
 def test_ubersum_collide_implemented(impl, implemented):
     # Non-tree plates cause exponential blowup,
@@ -755,3 +810,62 @@ def test_adjoint_marginal(equation, batch_dims):
                             backend='pyro.ops.einsum.torch_log')
         actual = operand._pyro_backward_result
         assert_equal(expected, actual)
+
+
+MEMORY_LIMIT_EXAMPLES = [
+    ('ab,bc->', ''),
+    ('a,ab,bc,cd->', ''),
+    ('a,abi,bcij,bdik->', 'ijk'),
+    ('ai,abij,acik->i', 'ijk'),
+]
+
+
+@pytest.mark.parametrize('memory_limit', [1, 8, 50])
+@pytest.mark.parametrize('equation,batch_dims', MEMORY_LIMIT_EXAMPLES)
+@pytest.mark.parametrize('backend', ['log', 'map'])
+def test_ubersum_memory_limit(backend, equation, batch_dims, memory_limit):
+    backend = 'pyro.ops.einsum.torch_{}'.format(backend)
+    inputs = equation.split('->')[0].split(',')
+    sizes = dict(zip('abcdijk', [5, 6, 7, 4, 2, 3, 2]))
+    operands = [torch.randn(torch.Size(sizes[dim] for dim in input_)) for input_ in inputs]
+
+    expected, = ubersum(equation, *operands, batch_dims=batch_dims, modulo_total=True,
+                        backend=backend)
+    actual, = ubersum(equation, *operands, batch_dims=batch_dims, modulo_total=True,
+                      backend=backend, memory_limit=memory_limit)
+    assert_equal(actual, expected)
+
+
+@pytest.mark.parametrize('equation,batch_dims', MEMORY_LIMIT_EXAMPLES)
+@pytest.mark.parametrize('backend', ['map', 'sample', 'marginal'])
+def test_adjoint_memory_limit(backend, equation, batch_dims):
+    backend = 'pyro.ops.einsum.torch_{}'.format(backend)
+    inputs = equation.split('->')[0].split(',')
+    sizes = dict(zip('abcdijk', [5, 6, 7, 4, 2, 3, 2]))
+    operands = [torch.randn(torch.Size(sizes[dim] for dim in input_)) for input_ in inputs]
+
+    # run forward-backward algorithm with and without a memory limit
+    results = []
+    for memory_limit in [None, 8]:
+        xs = [x.clone() for x in operands]
+        for input_, x in zip(inputs, xs):
+            x._pyro_dims = input_
+            require_backward(x)
+        result, = ubersum(equation, *xs, batch_dims=batch_dims, modulo_total=True,
+                          backend=backend, memory_limit=memory_limit)
+        result._pyro_backward()
+        results.append((result, [x._pyro_backward_result for x in xs]))
+
+    (expected, expected_backward), (actual, actual_backward) = results
+    assert_equal(actual, expected)
+    for expected, actual in zip(expected_backward, actual_backward):
+        if expected is None:
+            assert actual is None
+            continue
+        assert actual.shape == expected.shape
+        if backend.endswith('marginal'):
+            assert_equal(actual, expected)
+        elif backend.endswith('map'):
+            # argmax samples agree up to the order of sample dims
+            actual = actual[[actual._pyro_sample_dims.index(dim) for dim in expected._pyro_sample_dims]]
+            assert_equal(actual, expected)
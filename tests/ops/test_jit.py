@@ -2,6 +2,7 @@ from __future__ import absolute_import, division, print_function
 
 import torch
 
+import pyro
 import pyro.ops.jit
 from tests.common import assert_equal
 
@@ -42,3 +43,47 @@ def test_varying_unhashable_kwargs():
     for scale in [-1., 0., 1., 10.]:
         config = {'scale': scale}
         assert_equal(jit_fn(x, config=config), fn(x, config=config))
+
+
+def test_varying_shapes():
+
+    def fn(x):
+        return x.sum(-1) * x.size(-1)
+
+    jit_fn = pyro.ops.jit.trace(fn)
+    examples = [torch.ones(2), torch.ones(3), torch.ones(2, 3), torch.ones(2, dtype=torch.float32), torch.ones(3)]
+    for x in examples:
+        assert_equal(jit_fn(x), fn(x))
+    info = jit_fn.cache_info()
+    assert (info.hits, info.misses, info.evictions, info.currsize) == (1, 4, 0, 4)
+    assert info.compile_time > 0
+    assert info.run_time > 0
+
+
+def test_cache_eviction():
+
+    def fn(x):
+        return x.sum(-1) * x.size(-1)
+
+    jit_fn = pyro.ops.jit.trace(fn, maxsize=2)
+    for size in [1, 2, 1, 3, 2, 3]:
+        x = torch.ones(size)
+        assert_equal(jit_fn(x), fn(x))
+    info = jit_fn.cache_info()
+    assert (info.hits, info.misses, info.evictions, info.maxsize, info.currsize) == (2, 4, 2, 2, 2)
+
+    jit_fn.cache_clear()
+    assert jit_fn.cache_info() == (0, 0, 0, 2, 0, 0., 0.)
+
+
+def test_varying_params():
+
+    def fn(x, name):
+        return pyro.param(name, torch.ones(x.shape)) * x
+
+    pyro.clear_param_store()
+    jit_fn = pyro.ops.jit.trace(fn)
+    for name, size in [("a", 1), ("b", 2), ("a", 1), ("b", 2)]:
+        x = torch.randn(size)
+        assert_equal(jit_fn(x, name=name), fn(x, name=name))
+    assert jit_fn.cache_info().misses == 2
@@ -71,3 +71,23 @@ def test_broadcast_all(shapes):
     assert len(actual) == len(expected)
     for a, e in zip(actual, expected):
         assert_equal(a, e)
+
+
+def test_gather():
+    value = torch.randn(3, 4)
+    value._pyro_dims = 'ab'
+    index = torch.tensor([2, 0, 1])
+    index._pyro_dims = 'a'
+    actual = packed.gather(value, index, 'b')
+    assert actual._pyro_dims == 'a'
+    assert_equal(actual, value[torch.arange(3), index])
+
+
+def test_gather_diagonal():
+    value = torch.randn(3, 4)
+    value._pyro_dims = 'ab'
+    index = torch.tensor([2, 0, 1])
+    index._pyro_dims = 'a'
+    actual = packed.gather(value, index, 'a')
+    assert actual._pyro_dims == 'ab'
+    assert_equal(actual, value[index])
@@ -13,8 +13,9 @@ import pyro
 import pyro.contrib.gp as gp
 import pyro.distributions as dist
 import pyro.optim as optim
+from pyro.contrib.oed.search import Search
 from pyro.distributions.testing import fakes
-from pyro.infer import SVI, Trace_ELBO, TraceGraph_ELBO
+from pyro.infer import SVI, EmpiricalMarginal, Trace_ELBO, TraceGraph_ELBO
 from pyro.infer.mcmc.hmc import HMC
 from pyro.infer.mcmc.mcmc import MCMC
 from pyro.infer.mcmc.nuts import NUTS
@@ -123,6 +124,31 @@ def vsgp_multiclass(num_steps, whiten):
     gp.util.train(gpmodule, optimizer, num_steps=num_steps)
 
 
+@register_model(N=500, num_steps=20, id='GP::KernelCombination_N=500')
+@register_model(N=1000, num_steps=20, id='GP::KernelCombination_N=1000')
+@register_model(N=2000, num_steps=20, id='GP::KernelCombination_N=2000')
+def gp_kernel_combination(N, num_steps):
+    pyro.set_rng_seed(0)
+    X = torch.rand(N, 20)
+    kernel = gp.kernels.Sum(gp.kernels.Product(gp.kernels.RBF(20), gp.kernels.Matern32(20)),
+                            gp.kernels.Sum(gp.kernels.Matern52(20), gp.kernels.RationalQuadratic(20)))
+    for _ in range(num_steps):
+        kernel.set_mode("guide")
+        kernel(X).sum().backward()
+
+
+@register_model(num_steps=6, id='Search::DiscreteChain_steps=6')
+@register_model(num_steps=10, id='Search::DiscreteChain_steps=10')
+def search_discrete_chain(num_steps):
+    def model():
+        x = torch.tensor(0.)
+        for t in range(num_steps):
+            x = pyro.sample("x_{}".format(t), dist.Bernoulli(0.3 + 0.4 * x))
+        return x
+
+    EmpiricalMarginal(Search(model).run()).mean
+
+
 @pytest.mark.parametrize('model, model_args, id', TEST_MODELS, ids=MODEL_IDS)
 @pytest.mark.benchmark(
     min_rounds=5,
@@ -8,7 +8,7 @@ from unittest import TestCase
 import pytest
 import torch
 import torch.nn as nn
-from six.moves.queue import Queue
+from six.moves.queue import LifoQueue, Queue
 
 import pyro
 import pyro.distributions as dist
@@ -275,6 +275,41 @@ class QueueHandlerDiscreteTest(TestCase):
             f()
 
 
+@pytest.mark.parametrize("queue_type", [Queue, LifoQueue])
+def test_queue_share_prefix(queue_type):
+    num_calls = [0]
+
+    def model():
+        num_calls[0] += 1
+        x = pyro.sample("x", Categorical(torch.ones(3)))
+        z = pyro.sample("z", Normal(0., 1.))
+        y = pyro.sample("y", Bernoulli(torch.tensor(0.5)))
+        return int(x), z, int(y)
+
+    queue = queue_type()
+    queue.put(poutine.Trace())
+    f = poutine.queue(model, queue=queue)
+    results = []
+    while not queue.empty():
+        results.append(f())
+
+    # The order of complete traces is determined by the queue.
+    if queue_type is LifoQueue:
+        expected = [(2, 1), (2, 0), (1, 1), (1, 0), (0, 1), (0, 0)]
+    else:
+        expected = [(0, 0), (0, 1), (1, 0), (1, 1), (2, 0), (2, 1)]
+    assert [(x, y) for x, _, y in results] == expected
+
+    # Sites before an enumerated site are shared by its extensions.
+    for x, z, _ in results:
+        assert_equal(z, next(z2 for x2, z2, _ in results if x2 == x))
+
+    # Prefixes are executed once per complete trace when extensions are
+    # retrieved from the queue immediately.
+    if queue_type is LifoQueue:
+        assert num_calls[0] == 6
+
+
 class Model(nn.Module):
     def __init__(self):
         super(Model, self).__init__()
@@ -694,6 +729,38 @@ def test_enumerate_poutine(depth, first_available_dim):
         assert actual_shape == expected_shape, 'error on iteration {}'.format(i)
 
 
+@pytest.mark.parametrize('topk', [1, 2, 4, 5])
+@pytest.mark.parametrize('one_hot', [False, True], ids=['categorical', 'one_hot'])
+def test_enumerate_topk_poutine(one_hot, topk):
+    probs = torch.tensor([[0.1, 0.2, 0.3, 0.4], [0.4, 0.1, 0.3, 0.2], [0.1, 0.6, 0.2, 0.1]])
+
+    def model():
+        with pyro.plate("data", 3):
+            d = dist.OneHotCategorical(probs) if one_hot else Categorical(probs)
+            return pyro.sample("x", d, infer={"enumerate": "parallel", "topk": topk})
+
+    value = poutine.enum(model, first_available_dim=-2)()
+    if one_hot:
+        value = value.max(-1)[1]
+    if topk >= 4:
+        expected = torch.arange(4).unsqueeze(-1)
+    else:
+        expected = probs.t().topk(topk, 0)[1]
+    assert_equal(value, expected)
+
+
+@pytest.mark.parametrize('kwargs', [{"topk": 0}, {"topk": 1.5}, {"topk": 2, "num_samples": 2}])
+def test_enumerate_topk_error(kwargs):
+    infer = {"enumerate": "parallel"}
+    infer.update(kwargs)
+
+    def model():
+        pyro.sample("x", Categorical(torch.ones(3)), infer=infer)
+
+    with pytest.raises(ValueError):
+        poutine.enum(model, first_available_dim=-1)()
+
+
 @pytest.mark.parametrize('first_available_dim', [-1, -2, -3])
 @pytest.mark.parametrize('depth', [0, 1, 2])
 def test_replay_enumerate_poutine(depth, first_available_dim):
@@ -27,6 +27,9 @@ CPU_EXAMPLES = [
     'contrib/oed/ab_test.py --num-vi-steps=10 --num-bo-steps=2',
     'contrib/oed/item_response.py -N=1000 -M=1000',
     'contrib/oed/sequential_oed_sigmoid_lm.py --num-experiments=2 --num-runs=2 --no-plot',
+    skipif_param('contrib/serving/load_test.py --num-requests=100',
+                 condition=sys.version_info < (3, 5),
+                 reason='async syntax requires Python 3.5 or later'),
     'dmm/dmm.py --num-epochs=1',
     'dmm/dmm.py --num-epochs=1 --num-iafs=1',
     'eight_schools/mcmc.py --num-samples=500 --warmup-steps=100',